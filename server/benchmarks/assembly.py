@@ -0,0 +1,103 @@
+"""
+End-to-end time of assembling an exam from many papers.
+
+The reference outputs are indexed as --documents papers, each diagram/table
+pointing to a cached JPEG crop, and --picks main questions are picked at
+random across them. Resolve (index lookup + renumbering) and render (one
+shared image prefetch + DOCX) are timed separately, with cold and warm
+fragment caches.
+
+Usage (from the server directory):
+    python -m benchmarks.assembly --documents 200 --picks 40
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+REFERENCE_OUTPUTS = [
+    os.path.join(SERVER_DIR, "assets", "reference_output_1.json"),
+    os.path.join(SERVER_DIR, "assets", "reference_output_2.json"),
+]
+
+
+def crop():
+    from PIL import Image
+    output = io.BytesIO()
+    Image.new("RGB", (1800, 900), "white").save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def attach_urls(data, document_id):
+    counter = 0
+
+    def recurse(obj):
+        nonlocal counter
+        if isinstance(obj, dict):
+            if obj.get("type") in ["diagram", "table"]:
+                obj["url"] = f"bench://{document_id}/{counter}"
+                counter += 1
+            for value in obj.values():
+                recurse(value)
+        elif isinstance(obj, list):
+            for item in obj:
+                recurse(item)
+
+    recurse(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exam assembly benchmark")
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--picks", type=int, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Point every cache and index at the temporary directory before importing them
+        os.environ["CACHE_DIR"] = directory
+        from modules.assembly import assemble_paper
+        from modules.disk_cache import image_cache
+        from modules.models import parse_paper
+        from modules.question_index import get_question_index
+        from modules.wordgen import generate
+
+        index = get_question_index()
+        image = crop()
+        refs = []
+        for document_id in range(1, args.documents + 1):
+            with open(REFERENCE_OUTPUTS[document_id % len(REFERENCE_OUTPUTS)], encoding="utf-8") as f:
+                data = json.load(f)
+            attach_urls(data, document_id)
+            paper = parse_paper(data)
+            for figure in paper.figures():
+                image_cache.put(figure.url, image)
+            index.index_document(document_id, f"paper_{document_id}.pdf", paper)
+            refs.extend((document_id, main_q.number) for main_q in paper.main_questions)
+
+        picks = random.Random(0).sample(refs, args.picks)
+        report = {"indexed_main_questions": len(refs), "picks": args.picks}
+        for run in ["cold", "warm"]:
+            start = time.perf_counter()
+            paper = assemble_paper(picks)
+            resolved = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                output = generate(paper)
+            rendered = time.perf_counter()
+            report[run] = {
+                "resolve_seconds": resolved - start,
+                "render_seconds": rendered - resolved,
+                "docx_bytes": len(output.read()),
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Concurrency check for /generate_word.
+
+Fires many simultaneous exports of different documents against the app
+in-process and verifies that every response contains its own document and
+nothing from the others. Exits non-zero on any mismatch.
+
+Usage (from the server directory):
+    python -m benchmarks.concurrent_export --requests 50
+"""
+import argparse
+import asyncio
+import copy
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REFERENCE_OUTPUT = os.path.join(SERVER_DIR, "assets", "reference_output_2.json")
+
+
+def strip_urls(obj):
+    if isinstance(obj, dict):
+        obj.pop("url", None)
+        for value in obj.values():
+            strip_urls(value)
+    elif isinstance(obj, list):
+        for item in obj:
+            strip_urls(item)
+
+
+def make_document(reference, marker):
+    """Returns a copy of the reference paper tagged with a unique marker in its first text block."""
+    data = copy.deepcopy(reference)
+    strip_urls(data)  # Keep the check about document assembly, not image downloads
+    for main_q in data["main_questions"]:
+        for content in main_q["content_flow"]:
+            if content["type"] == "text":
+                content["text"]["malay"] = f"{marker} {content['text']['malay']}"
+                return data
+    raise ValueError("Reference output has no main question text to tag")
+
+
+def markers_in(docx_bytes, all_markers):
+    from docx import Document
+
+    doc = Document(io.BytesIO(docx_bytes))
+    text = "\n".join(cell.text for table in doc.tables for row in table.rows for cell in row.cells)
+    return {marker for marker in all_markers if marker in text}
+
+
+async def run(total):
+    import httpx
+
+    from main import app
+
+    with open(REFERENCE_OUTPUT, encoding="utf-8") as f:
+        reference = json.load(f)
+
+    markers = [f"EXPORT-{i:04d}-CHECK" for i in range(total)]
+    payloads = [
+        {"jsonData": make_document(reference, marker), "filename": f"export_{i}.docx"}
+        for i, marker in enumerate(markers)
+    ]
+
+    async def export(client, payload):
+        start = time.perf_counter()
+        response = await client.post("/generate_word", json=payload)
+        return response, time.perf_counter() - start
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(export(client, payload) for payload in payloads))
+        wall = time.perf_counter() - start
+
+    failures = []
+    for marker, (response, _) in zip(markers, results):
+        if response.status_code != 200:
+            failures.append(f"{marker}: HTTP {response.status_code}")
+            continue
+        found = markers_in(response.content, markers)
+        if found != {marker}:
+            failures.append(f"{marker}: response contains {sorted(found)}")
+
+    latencies = [latency for _, latency in results]
+    print(json.dumps({
+        "requests": total,
+        "wall_seconds": wall,
+        "p50_seconds": statistics.median(latencies),
+        "max_seconds": max(latencies),
+        "mismatches": len(failures),
+    }, indent=2))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent /generate_word consistency check")
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_KEY", "benchmark")
+    sys.path.insert(0, SERVER_DIR)
+
+    failures = asyncio.run(run(args.requests))
+    if failures:
+        for failure in failures:
+            print(f"MISMATCH: {failure}")
+        sys.exit(1)
+    print("Every export matched its input.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Lookup latency and accuracy of the near-duplicate (MinHash/LSH) index.
+
+A synthetic corpus is built from the word sequences of the reference main
+questions: every corpus question replaces half of the words with random
+ones, so unrelated questions share little. Near-duplicates are corpus
+questions with --edit of their words changed. Lookups are timed as the
+corpus grows, to show the cost per lookup stays flat rather than linear.
+
+Usage (from the server directory):
+    python -m benchmarks.dedup --sizes 1000 10000 100000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from modules import dedup  # noqa: E402
+from modules.models import parse_paper  # noqa: E402
+from modules.question_index import content_text  # noqa: E402
+
+REFERENCE_OUTPUTS = [
+    os.path.join(SERVER_DIR, "assets", "reference_output_1.json"),
+    os.path.join(SERVER_DIR, "assets", "reference_output_2.json"),
+]
+
+
+def reference_word_lists():
+    word_lists = []
+    for path in REFERENCE_OUTPUTS:
+        with open(path, encoding="utf-8") as f:
+            paper = parse_paper(json.load(f))
+        for main_q in paper.main_questions:
+            words = []
+            for content_flow in main_q.content_flows():
+                for text in content_text(content_flow):
+                    words.extend(dedup._words(text))
+            word_lists.append(words)
+    return word_lists
+
+
+def mutate(words, fraction, rng):
+    return [f"w{rng.randrange(10**9)}" if rng.random() < fraction else word for word in words]
+
+
+def signature(words):
+    return dedup.minhash(dedup.word_shingles(words))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Near-duplicate index benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--edit", type=float, default=0.05, help="Fraction of words changed in a near-duplicate")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    references = reference_word_lists()
+    report = {"sizes": {}}
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = dedup.DedupIndex(os.path.join(directory, "dedup.db"))
+        corpus = {}
+        indexed = 0
+        for size in sorted(args.sizes):
+            start = time.perf_counter()
+            while indexed < size:
+                batch = {}
+                for _ in range(min(1000, size - indexed)):
+                    words = mutate(rng.choice(references), 0.5, rng)
+                    batch[str(indexed)] = signature(words)
+                    corpus[str(indexed)] = words
+                    indexed += 1
+                index.add_document(f"doc{indexed}", batch)
+            build_seconds = time.perf_counter() - start
+
+            found, false_matches, times = 0, 0, []
+            for _ in range(args.queries):
+                target = str(rng.randrange(size))
+                query = signature(mutate(corpus[target], args.edit, rng))
+                start = time.perf_counter()
+                matches = index.query(query)
+                times.append((time.perf_counter() - start) * 1000)
+                found += any(match["main_number"] == target for match in matches)
+                false_matches += sum(match["main_number"] != target for match in matches)
+
+            unrelated = sum(bool(index.query(signature(mutate(rng.choice(references), 0.5, rng))))
+                            for _ in range(args.queries))
+            report["sizes"][size] = {
+                "build_seconds": build_seconds,
+                "lookup_p50_ms": statistics.median(times),
+                "lookup_max_ms": max(times),
+                "recall": found / args.queries,
+                "false_matches_per_lookup": false_matches / args.queries,
+                "unrelated_flagged": unrelated / args.queries,
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
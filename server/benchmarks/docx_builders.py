@@ -0,0 +1,114 @@
+"""
+Compares the python-docx and XML-template DOCX builders on a synthetic paper.
+
+The paper is made by cycling the main questions of the reference outputs
+until it reaches the requested size. Images are left out so the numbers
+reflect table construction only. Both builders must produce identical
+document.xml, and the script fails otherwise.
+
+Usage (from the server directory):
+    python -m benchmarks.docx_builders --questions 200
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+import zipfile
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from modules.models import parse_paper  # noqa: E402
+from modules.wordgen import build_document  # noqa: E402
+
+REFERENCE_OUTPUTS = [
+    os.path.join(SERVER_DIR, "assets", "reference_output_1.json"),
+    os.path.join(SERVER_DIR, "assets", "reference_output_2.json"),
+]
+
+
+def strip_urls(obj):
+    if isinstance(obj, dict):
+        obj.pop("url", None)
+        for value in obj.values():
+            strip_urls(value)
+    elif isinstance(obj, list):
+        for item in obj:
+            strip_urls(item)
+
+
+def synthetic_paper(total):
+    pool = []
+    for path in REFERENCE_OUTPUTS:
+        with open(path, encoding="utf-8") as f:
+            pool.extend(json.load(f)["main_questions"])
+
+    main_questions = []
+    for i in range(total):
+        main_q = copy.deepcopy(pool[i % len(pool)])
+        main_q["number"] = str(i + 1)
+        main_questions.append(main_q)
+
+    data = {"main_questions": main_questions}
+    strip_urls(data)
+    return parse_paper(data)
+
+
+def build(builder, data):
+    with contextlib.redirect_stdout(io.StringIO()):  # Silence per-question progress prints
+        return build_document(data, {}, builder=builder)
+
+
+def measure(builder, data):
+    start = time.perf_counter()
+    output = build(builder, data)
+    elapsed = time.perf_counter() - start
+
+    # Separate traced run: tracemalloc slows allocation-heavy code too much to time under it.
+    # It only sees Python allocations, not lxml's own buffers.
+    tracemalloc.start()
+    build(builder, data).close()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    content = output.read()
+    document_xml = zipfile.ZipFile(io.BytesIO(content)).read("word/document.xml")
+    return {
+        "seconds": elapsed,
+        "peak_traced_mb": peak / (1024 * 1024),
+        "docx_bytes": len(content),
+    }, document_xml
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DOCX builder benchmark")
+    parser.add_argument("--questions", type=int, default=200, help="Number of main questions")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data = synthetic_paper(args.questions)
+    report = {"main_questions": args.questions}
+    documents = {}
+    for builder in ["python-docx", "xml"]:
+        runs = []
+        for _ in range(args.repeat):
+            result, documents[builder] = measure(builder, data)
+            runs.append(result)
+        report[builder] = min(runs, key=lambda r: r["seconds"])
+
+    report["speedup"] = report["python-docx"]["seconds"] / report["xml"]["seconds"]
+    report["identical_layout"] = documents["python-docx"] == documents["xml"]
+    print(json.dumps(report, indent=2))
+
+    if not report["identical_layout"]:
+        print("Builders produced different document.xml")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
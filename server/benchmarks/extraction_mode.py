@@ -0,0 +1,96 @@
+"""
+Input tokens, modelled latency and payload size of the extraction requests in
+pdf mode (whole PDF per range) versus text mode (serialized text layer of the
+range's pages), using the replay backend so no model is called.
+
+Coverage is the share of the words in the recorded questions of a range that
+appear in the text sent for it, a check that text mode does not drop content.
+
+Usage (from the server directory):
+    python -m benchmarks.extraction_mode --pdf assets/reference_input_2.pdf --recording assets/reference_output_2.json
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from config.replay_client import get_replay_response  # noqa: E402
+from modules.pdf_probe import plan_ranges, probe_pdf  # noqa: E402
+from modules.pdf_text import prepare_request, request_parts  # noqa: E402
+
+WORD = re.compile(r"\w{3,}")
+
+
+def words(text):
+    return set(WORD.findall(text.lower()))
+
+
+def recorded_words(value):
+    """Words of every malay/english string in the recorded questions."""
+    if isinstance(value, dict):
+        found = set()
+        for key, item in value.items():
+            found |= words(item) if key in ("malay", "english") and isinstance(item, str) else recorded_words(item)
+        return found
+    if isinstance(value, list):
+        return set().union(*(recorded_words(item) for item in value)) if value else set()
+    return set()
+
+
+def run_mode(pdf_content, probe, ranges, mode, recording):
+    rows = []
+    for start, end in ranges:
+        prepare_start = time.perf_counter()
+        pdf, page_text = prepare_request(pdf_content, probe, start, end, mode=mode)
+        prepare_seconds = time.perf_counter() - prepare_start
+
+        response = get_replay_response(pdf, start, end, page_text, recording=recording)
+        parts = request_parts(pdf, start, end, page_text)
+        row = {
+            "range": [start, end],
+            "input_tokens": response.usage_metadata.prompt_token_count,
+            "output_tokens": response.usage_metadata.candidates_token_count,
+            "modelled_seconds": round(response.latency, 3),
+            "prepare_ms": round(prepare_seconds * 1000, 1),
+            "payload_kb": round(sum(len(value) if kind == "pdf" else len(value.encode()) for kind, value in parts) / 1024, 1),
+        }
+        if page_text is not None:
+            expected = recorded_words(json.loads(response.text)["main_questions"])
+            row["coverage"] = round(len(expected & words(page_text)) / max(1, len(expected)), 3)
+        rows.append(row)
+
+    totals = {key: round(sum(row[key] for row in rows), 3)
+              for key in ("input_tokens", "output_tokens", "modelled_seconds", "prepare_ms", "payload_kb")}
+    return {"ranges": rows, "total": totals}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pdf vs text extraction mode benchmark")
+    parser.add_argument("--pdf", default=os.path.join(SERVER_DIR, "assets", "reference_input_2.pdf"))
+    parser.add_argument("--recording", default=os.path.join(SERVER_DIR, "assets", "reference_output_2.json"))
+    args = parser.parse_args()
+
+    with open(args.pdf, "rb") as f:
+        pdf_content = f.read()
+    probe = probe_pdf(pdf_content)
+    ranges = plan_ranges(probe)
+
+    report = {"pdf": os.path.basename(args.pdf), "pages": probe.page_count, "ranges": ranges, "modes": {}}
+    for mode in ("pdf", "text"):
+        report["modes"][mode] = run_mode(pdf_content, probe, ranges, mode, args.recording)
+    pdf_total = report["modes"]["pdf"]["total"]
+    text_total = report["modes"]["text"]["total"]
+    report["text_vs_pdf"] = {
+        "input_tokens": round(text_total["input_tokens"] / pdf_total["input_tokens"], 3),
+        "modelled_seconds": round(text_total["modelled_seconds"] / pdf_total["modelled_seconds"], 3),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
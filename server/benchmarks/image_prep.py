@@ -0,0 +1,100 @@
+"""
+Before/after DOCX size for the image preparation stage.
+
+Crops are made the way extract_data makes them: 300-DPI page renders of
+assets/reference_input_2.pdf, JPEG quality 90. They are attached to every
+diagram/table of reference_output_2.json, and the paper is built with and
+without preparation.
+
+Usage (from the server directory):
+    python -m benchmarks.image_prep --dpi 200
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+import fitz  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from modules import image_prep  # noqa: E402
+from modules.models import parse_paper  # noqa: E402
+from modules.wordgen import build_document  # noqa: E402
+
+REFERENCE_INPUT = os.path.join(SERVER_DIR, "assets", "reference_input_2.pdf")
+REFERENCE_OUTPUT = os.path.join(SERVER_DIR, "assets", "reference_output_2.json")
+
+
+def page_crops():
+    """Returns JPEG crops (middle band of each page) at 300 DPI, like the YOLO crops."""
+    crops = []
+    with fitz.open(REFERENCE_INPUT) as pdf:
+        for page in pdf:
+            pix = page.get_pixmap(dpi=300)
+            image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+            box = (pix.width // 10, pix.height // 4, pix.width * 9 // 10, pix.height // 2)
+            output = io.BytesIO()
+            image.crop(box).save(output, format="JPEG", quality=90)
+            crops.append(output.getvalue())
+    return crops
+
+
+def attach_images(data, crops):
+    images = {}
+    counter = 0
+
+    def recurse(obj):
+        nonlocal counter
+        if isinstance(obj, dict):
+            if obj.get("type") in ["diagram", "table"]:
+                obj["url"] = f"bench://{counter}"
+                images[obj["url"]] = crops[counter % len(crops)]
+                counter += 1
+            for value in obj.values():
+                recurse(value)
+        elif isinstance(obj, list):
+            for item in obj:
+                recurse(item)
+
+    recurse(data)
+    return images
+
+
+def build(paper, images, dpi):
+    image_prep.DOCX_IMAGE_DPI = dpi
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        output = build_document(paper, images)
+    elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "docx_bytes": len(output.read())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DOCX image preparation benchmark")
+    parser.add_argument("--dpi", type=int, default=200, help="Target embed DPI")
+    args = parser.parse_args()
+
+    with open(REFERENCE_OUTPUT, encoding="utf-8") as f:
+        data = json.load(f)
+    images = attach_images(data, page_crops())
+    paper = parse_paper(data)
+
+    before = build(paper, images, 0)
+    after = build(paper, images, args.dpi)
+    print(json.dumps({
+        "images": len(images),
+        "raw_image_bytes": sum(len(image) for image in images.values()),
+        "before": before,
+        "after": after,
+        "size_reduction": 1 - after["docx_bytes"] / before["docx_bytes"],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
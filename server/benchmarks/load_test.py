@@ -0,0 +1,258 @@
+"""
+Concurrent-upload load test of the API.
+
+Starts uvicorn with the local storage/DB backend and the replay LLM backend
+(sleeping for the latency it models, with jitter), then runs --users virtual
+users. Each one repeats: upload the PDF to /extract_questions, fetch the new
+document, wait for its extraction (up to --extraction-timeout), and export it
+through /generate_word (the recorded output while it is not extracted yet).
+
+Reports throughput and p50/p95/p99 latency per endpoint, and a timeline of
+the extraction queue depth (documents still "in process") and the RSS of the
+server process tree, sampled every --sample-interval seconds. Extraction runs
+the real cropping stage, which needs the ML stack installed.
+
+Usage (from the server directory):
+    python -m benchmarks.load_test --users 1 4 16 --iterations 3 --workers 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+import psutil
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+REFERENCE_PDF = os.path.join(SERVER_DIR, "assets", "reference_input_2.pdf")
+REFERENCE_OUTPUT = os.path.join(SERVER_DIR, "assets", "reference_output_2.json")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def start_server(args, work_dir, port):
+    env = os.environ.copy()
+    env.update({
+        "DB_BACKEND": "local",
+        "LOCAL_DB_PATH": os.path.join(work_dir, "local.db"),
+        "LOCAL_STORAGE_DIR": os.path.join(work_dir, "storage"),
+        "LOCAL_PUBLIC_URL": f"http://127.0.0.1:{port}/storage",
+        "CACHE_DIR": os.path.join(work_dir, "cache"),
+        "LLM_BACKEND": "replay",
+        "REPLAY_SLEEP": "true",
+        "REPLAY_BASE_SECONDS": str(args.llm_base_seconds),
+        "REPLAY_JITTER": str(args.llm_jitter),
+        # Virtual users all connect from localhost and are told apart by X-Client-ID
+        "TRUSTED_PROXIES": "127.0.0.1",
+    })
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL if not args.server_logs else None,
+        stderr=subprocess.STDOUT if not args.server_logs else None,
+    )
+
+
+async def wait_until_up(client, server, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            await client.get("/documents")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not start in time")
+
+
+def tree_rss(pid):
+    try:
+        process = psutil.Process(pid)
+        total = process.memory_info().rss
+        children = process.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return 0
+    for child in children:
+        try:
+            total += child.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return total
+
+
+class LoadRun:
+    def __init__(self, client, args, pdf_content, reference):
+        self.client = client
+        self.args = args
+        self.pdf_content = pdf_content
+        self.reference = reference
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.rejected = defaultdict(int)
+        self.extraction_seconds = []
+        self.extraction_timeouts = 0
+
+    async def timed(self, endpoint, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.errors[endpoint] += 1
+            print(f"{endpoint} failed: {e!r}")
+            return None
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        if response.status_code == 429:
+            # Refused by admission control; counted apart from failures
+            self.rejected[endpoint] += 1
+            return None
+        if response.status_code >= 400:
+            self.errors[endpoint] += 1
+            return None
+        return response
+
+    async def wait_for_extraction(self, document_id):
+        start = time.perf_counter()
+        deadline = start + self.args.extraction_timeout
+        while time.perf_counter() < deadline:
+            response = await self.timed("GET /documents/{id}", "GET", f"/documents/{document_id}")
+            document = response.json()["data"] if response is not None else None
+            if document is not None and document.get("status") != "in process":
+                self.extraction_seconds.append(time.perf_counter() - start)
+                return document
+            await asyncio.sleep(self.args.poll_interval)
+        self.extraction_timeouts += 1
+        return None
+
+    async def user(self, number):
+        for iteration in range(self.args.iterations):
+            files = {"pdf_file": (f"load_{number}_{iteration}.pdf", self.pdf_content, "application/pdf")}
+            response = await self.timed("POST /extract_questions", "POST", "/extract_questions", files=files,
+                                        headers={"X-Client-ID": f"load-{number}"})
+            if response is None:
+                continue
+            document_id = response.json()["data"]["document_id"]
+            document = await self.wait_for_extraction(document_id)
+            data = document.get("data") if document else None
+            await self.timed("POST /generate_word", "POST", "/generate_word",
+                             json={"jsonData": data or self.reference, "filename": f"{document_id}.docx"})
+
+    def report(self, wall):
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "errors": self.errors[endpoint],
+                "rejected": self.rejected[endpoint],
+                "throughput_per_second": round(len(latencies) / wall, 3),
+                "p50_seconds": round(percentile(latencies, 0.50), 4),
+                "p95_seconds": round(percentile(latencies, 0.95), 4),
+                "p99_seconds": round(percentile(latencies, 0.99), 4),
+            }
+        return {
+            "wall_seconds": round(wall, 3),
+            "endpoints": endpoints,
+            "extraction": {
+                "completed": len(self.extraction_seconds),
+                "timeouts": self.extraction_timeouts,
+                "p50_seconds": round(statistics.median(self.extraction_seconds), 3) if self.extraction_seconds else None,
+                "max_seconds": round(max(self.extraction_seconds), 3) if self.extraction_seconds else None,
+            },
+        }
+
+
+async def sample(server_pid, database, interval, timeline, stop):
+    start = time.perf_counter()
+    while not stop.is_set():
+        documents = database.table("documents").select("status").execute().data
+        timeline.append({
+            "t": round(time.perf_counter() - start, 2),
+            "queue_depth": sum(1 for document in documents if document.get("status") == "in process"),
+            "rss_mb": round(tree_rss(server_pid) / (1024 * 1024), 1),
+        })
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_level(args, users, pdf_content, reference):
+    work_dir = tempfile.mkdtemp(prefix="load-test-")
+    port = free_port()
+    server = start_server(args, work_dir, port)
+    try:
+        from db.local import LocalClient
+
+        database = LocalClient(os.path.join(work_dir, "local.db"), os.path.join(work_dir, "storage"), "")
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None,
+                                     limits=httpx.Limits(max_connections=users * 2)) as client:
+            await wait_until_up(client, server)
+            run = LoadRun(client, args, pdf_content, reference)
+            timeline, stop = [], asyncio.Event()
+            sampler = asyncio.create_task(sample(server.pid, database, args.sample_interval, timeline, stop))
+            start = time.perf_counter()
+            await asyncio.gather(*(run.user(number) for number in range(users)))
+            wall = time.perf_counter() - start
+            stop.set()
+            await sampler
+        result = run.report(wall)
+        result["users"] = users
+        result["peak_queue_depth"] = max((point["queue_depth"] for point in timeline), default=0)
+        result["peak_rss_mb"] = max((point["rss_mb"] for point in timeline), default=0)
+        result["timeline"] = timeline
+        return result
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent upload load test")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 16], help="concurrency levels to run")
+    parser.add_argument("--iterations", type=int, default=3, help="uploads per user")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--pdf", default=REFERENCE_PDF)
+    parser.add_argument("--llm-base-seconds", type=float, default=2.0, help="fixed latency of each fake LLM call")
+    parser.add_argument("--llm-jitter", type=float, default=0.3)
+    parser.add_argument("--extraction-timeout", type=float, default=300)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--sample-interval", type=float, default=0.5)
+    parser.add_argument("--server-logs", action="store_true", help="show the server output")
+    args = parser.parse_args()
+
+    with open(args.pdf, "rb") as f:
+        pdf_content = f.read()
+    with open(REFERENCE_OUTPUT, encoding="utf-8") as f:
+        reference = json.load(f)
+
+    report = {"cpu_count": os.cpu_count(), "workers": args.workers, "iterations": args.iterations, "levels": []}
+    for users in args.users:
+        report["levels"].append(asyncio.run(run_level(args, users, pdf_content, reference)))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
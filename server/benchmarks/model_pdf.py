@@ -0,0 +1,68 @@
+"""
+Size and time of modules.pdf_optimize.optimize_pdf on the bundled PDFs and on a
+scanned copy of each (rasterized at --scan-dpi, like a paper from a scanner).
+
+Each result also checks that the page sizes and the text layer are unchanged,
+so page numbers and crop coordinates from the model still line up.
+
+Usage (from the server directory):
+    python -m benchmarks.model_pdf --scan-dpi 300 --dpi 150
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import fitz
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from modules.pdf_optimize import optimize_pdf  # noqa: E402
+from modules.utils import rasterize_pdf  # noqa: E402
+
+PDFS = sorted(glob.glob(os.path.join(SERVER_DIR, "assets", "*.pdf")))
+
+
+def pages(pdf_content):
+    with fitz.open(stream=pdf_content, filetype="pdf") as document:
+        return [(tuple(page.rect), page.get_text("text")) for page in document]
+
+
+def measure(pdf_content, dpi):
+    start = time.perf_counter()
+    optimized = optimize_pdf(pdf_content, dpi=dpi)
+    elapsed = time.perf_counter() - start
+    before, after = pages(pdf_content), pages(optimized)
+    return {
+        "input_mb": round(len(pdf_content) / (1024 * 1024), 3),
+        "output_mb": round(len(optimized) / (1024 * 1024), 3),
+        "ratio": round(len(optimized) / len(pdf_content), 3),
+        "seconds": round(elapsed, 3),
+        "geometry_unchanged": [rect for rect, _ in before] == [rect for rect, _ in after],
+        "text_unchanged": [text for _, text in before] == [text for _, text in after],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Model-facing PDF optimization benchmark")
+    parser.add_argument("--dpi", type=int, default=150, help="target resolution of embedded images")
+    parser.add_argument("--scan-dpi", type=int, default=300, help="resolution of the scanned copies")
+    args = parser.parse_args()
+
+    report = {"dpi": args.dpi, "scan_dpi": args.scan_dpi, "pdfs": {}}
+    for path in PDFS:
+        with open(path, "rb") as f:
+            pdf_content = f.read()
+        scanned = rasterize_pdf(pdf_content, dpi=args.scan_dpi, image_format="jpeg", workers=1)
+        report["pdfs"][os.path.basename(path)] = {
+            "original": measure(pdf_content, args.dpi),
+            "scanned": measure(scanned, args.dpi),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+End-to-end offline benchmark of the extraction pipeline.
+
+Runs main.extract_data and wordgen.generate on assets/reference_input_2.pdf and
+on synthetic papers made of N copies of it (main questions renumbered, so the
+probe and range planning see one long paper). The model is the replay backend
+answering from the recorded output and storage is the local backend, both in a
+temporary directory, so nothing leaves the machine. Cropping runs for real and
+needs the ML stack (ultralytics, torch, cv2, pdf2image).
+
+Each stage reports wall time, CPU time of this process, peak RSS and output
+sizes; the llm stage also reports tokens and the latency the replay backend
+models for them. --save writes the report as a baseline, --compare flags
+stages that got slower or bigger than the baseline and exits non-zero.
+
+Usage (from the server directory):
+    python -m benchmarks.pipeline --scales 1 2 4 --save benchmarks/pipeline_baseline.json
+    python -m benchmarks.pipeline --scales 1 2 4 --compare benchmarks/pipeline_baseline.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import fitz
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+# The backends are chosen at import time, so configure them before importing main
+WORK_DIR = tempfile.mkdtemp(prefix="pipeline-bench-")
+os.environ.update({
+    "DB_BACKEND": "local",
+    "LOCAL_DB_PATH": os.path.join(WORK_DIR, "local.db"),
+    "LOCAL_STORAGE_DIR": os.path.join(WORK_DIR, "storage"),
+    "CACHE_DIR": os.path.join(WORK_DIR, "cache"),
+    "LLM_BACKEND": "replay",
+})
+
+import main  # noqa: E402
+from benchmarks.rasterize import PeakRSS  # noqa: E402
+from config import ai_client, replay_client  # noqa: E402
+from db.local import LocalBucket  # noqa: E402
+from modules import crop_img, pdf_optimize, pdf_text, wordgen  # noqa: E402
+from modules.assembly import renumber_main_question  # noqa: E402
+from modules.models import Paper, parse_paper  # noqa: E402
+from modules.pdf_probe import ANCHOR_MAX_X, probe_pdf  # noqa: E402
+
+REFERENCE_PDF = os.path.join(SERVER_DIR, "assets", "reference_input_2.pdf")
+REFERENCE_OUTPUT = os.path.join(SERVER_DIR, "assets", "reference_output_2.json")
+
+# Compared metrics and the change below which a difference is treated as noise
+COMPARED = {
+    "wall_seconds": 0.05,
+    "cpu_seconds": 0.05,
+    "peak_rss_mb": 10,
+    "input_tokens": 0,
+    "output_bytes": 1024,
+}
+
+
+class StageRecorder:
+    """Accumulates per-stage metrics for functions wrapped with wrap()."""
+
+    def __init__(self):
+        self.stages = defaultdict(lambda: {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "peak_rss_mb": 0.0})
+        self._patched = []
+
+    def measure(self, stage, function, *args, **kwargs):
+        with PeakRSS() as rss:
+            wall, cpu = time.perf_counter(), time.process_time()
+            result = function(*args, **kwargs)
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        metrics = self.stages[stage]
+        metrics["calls"] += 1
+        metrics["wall_seconds"] += wall
+        metrics["cpu_seconds"] += cpu
+        metrics["peak_rss_mb"] = max(metrics["peak_rss_mb"], rss.peak / (1024 * 1024))
+        return result
+
+    def add(self, stage, key, value):
+        self.stages[stage][key] = self.stages[stage].get(key, 0) + value
+
+    def wrap(self, owner, name, stage, on_result=None):
+        original = getattr(owner, name)
+
+        def wrapper(*args, **kwargs):
+            result = self.measure(stage, original, *args, **kwargs)
+            if on_result is not None:
+                on_result(result, *args)
+            return result
+
+        setattr(owner, name, wrapper)
+        self._patched.append((owner, name, original))
+
+    def restore(self):
+        for owner, name, original in reversed(self._patched):
+            setattr(owner, name, original)
+        self._patched.clear()
+
+    def report(self):
+        return {stage: {key: round(value, 4) if isinstance(value, float) else value for key, value in metrics.items()}
+                for stage, metrics in self.stages.items()}
+
+
+def _anchor_spans(page, number):
+    for block in page.get_text("dict")["blocks"]:
+        for line in block.get("lines", []):
+            for span in line["spans"]:
+                bold = span["flags"] & 16 or "bold" in span["font"].lower()
+                if bold and span["text"].strip() == str(number) and span["bbox"][0] < page.rect.width * ANCHOR_MAX_X:
+                    yield span
+
+
+def scale_paper(pdf_content, recording, copies):
+    """
+    Returns (pdf, recording) for a paper made of `copies` copies of the given one.
+    Main question numbers continue across copies, in the PDF anchors as well as in
+    the recorded output, and recorded figure pages are shifted to their copy.
+    """
+    probe = probe_pdf(pdf_content)
+    paper = parse_paper(recording)
+    main_questions = []
+    with fitz.open(stream=pdf_content, filetype="pdf") as source, fitz.open() as output:
+        for copy in range(copies):
+            output.insert_pdf(source)
+            offset, page_offset = copy * len(probe.anchors), copy * probe.page_count
+            for main_q in paper.main_questions:
+                main_q = renumber_main_question(main_q, str(int(main_q.number) + offset))
+                for figure in main_q.figures():
+                    if figure.page is not None:
+                        figure.page += page_offset
+                main_questions.append(main_q)
+            if copy == 0:
+                continue
+            for number, page_number in probe.anchors:
+                page = output[page_offset + page_number - 1]
+                spans = list(_anchor_spans(page, number))
+                for span in spans:
+                    page.add_redact_annot(span["bbox"])
+                page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE, graphics=fitz.PDF_REDACT_LINE_ART_NONE)
+                for span in spans:
+                    page.insert_text(span["origin"], str(number + offset), fontname="hebo", fontsize=span["size"])
+        scaled_pdf = output.tobytes(garbage=3, deflate=True)
+    return scaled_pdf, Paper(main_questions=main_questions).to_dict()
+
+
+def run_paper(name, pdf_content, recording):
+    recording_path = os.path.join(WORK_DIR, f"{name}.json")
+    with open(recording_path, "w", encoding="utf-8") as f:
+        json.dump(recording, f, ensure_ascii=False)
+    replay_client.REPLAY_OUTPUT = recording_path
+
+    recorder = StageRecorder()
+
+    def on_llm(response, *args):
+        recorder.add("llm", "input_tokens", response.usage_metadata.prompt_token_count)
+        recorder.add("llm", "output_tokens", response.usage_metadata.candidates_token_count)
+        recorder.add("llm", "modelled_seconds", response.latency)
+
+    def on_upload(result, bucket, path, file):
+        recorder.add("upload", "output_bytes", len(file))
+
+    recorder.wrap(pdf_optimize, "get_model_pdf", "model_pdf",
+                  lambda result, *args: recorder.add("model_pdf", "output_bytes", len(result)))
+    recorder.wrap(pdf_text, "prepare_request", "prepare_request")
+    recorder.wrap(ai_client, "get_ai_response", "llm", on_llm)
+    recorder.wrap(crop_img, "get_images", "crop")
+    recorder.wrap(LocalBucket, "upload", "upload", on_upload)
+    recorder.wrap(main, "index_document", "index")
+    recorder.wrap(main, "fingerprint_document", "fingerprint")
+    try:
+        # Same steps as the upload endpoint: probe, insert the row, extract
+        probe = recorder.measure("probe", probe_pdf, pdf_content)
+        inserted = main.supabase.table("documents").insert({"file_name": name, "probe": probe.to_dict()}).execute()
+        document_id = inserted.data[0]["id"]
+        recorder.measure("extract", main.extract_data, pdf_content, document_id, name, probe)
+
+        stored = main.supabase.table("documents").select("data").eq("id", document_id).execute().data[0]["data"]
+        recorder.add("extract", "output_bytes", len(json.dumps(stored)))
+        paper = parse_paper(stored)
+        for stage in ("docx", "docx_cached"):
+            docx = recorder.measure(stage, wordgen.generate, paper)
+            recorder.add(stage, "output_bytes", len(docx.getvalue()))
+    finally:
+        recorder.restore()
+
+    return {
+        "pages": probe.page_count,
+        "main_questions": len(recording["main_questions"]),
+        "input_mb": round(len(pdf_content) / (1024 * 1024), 3),
+        "stages": recorder.report(),
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Returns the stage metrics that grew by more than tolerance (and the noise floor) over the baseline."""
+    regressions = []
+    for paper, result in report["papers"].items():
+        base_paper = baseline.get("papers", {}).get(paper)
+        if base_paper is None:
+            continue
+        for stage, metrics in result["stages"].items():
+            base_metrics = base_paper["stages"].get(stage, {})
+            for key, noise in COMPARED.items():
+                if key not in metrics or key not in base_metrics:
+                    continue
+                current, previous = metrics[key], base_metrics[key]
+                if current - previous > max(noise, previous * tolerance):
+                    regressions.append({
+                        "paper": paper,
+                        "stage": stage,
+                        "metric": key,
+                        "baseline": previous,
+                        "current": current,
+                        "change": round(current / previous - 1, 3) if previous else None,
+                    })
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="End-to-end extraction pipeline benchmark")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 2, 4], help="copies of the reference paper")
+    parser.add_argument("--save", help="write the report to this baseline file")
+    parser.add_argument("--compare", help="baseline file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative growth per metric")
+    args = parser.parse_args()
+
+    with open(REFERENCE_PDF, "rb") as f:
+        pdf_content = f.read()
+    with open(REFERENCE_OUTPUT, encoding="utf-8") as f:
+        recording = json.load(f)
+
+    report = {"cpu_count": os.cpu_count(), "extraction_mode": pdf_text.EXTRACTION_MODE, "papers": {}}
+    for scale in args.scales:
+        name = "reference_input_2" if scale == 1 else f"reference_input_2_x{scale}"
+        scaled_pdf, scaled_recording = (pdf_content, recording) if scale == 1 else scale_paper(pdf_content, recording, scale)
+        report["papers"][name] = run_paper(name, scaled_pdf, scaled_recording)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+    print(json.dumps(report, indent=2))
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,88 @@
+"""
+Indexing throughput and query latency of the question bank index.
+
+The reference outputs are indexed repeatedly under fresh document ids until
+the index holds --questions rows, then each query is run --repeat times.
+Latencies are reported per query (p50/p95/max, in milliseconds).
+
+Usage (from the server directory):
+    python -m benchmarks.question_index --questions 100000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from modules.models import parse_paper  # noqa: E402
+from modules.question_index import QuestionIndex, flatten_paper  # noqa: E402
+
+REFERENCE_OUTPUTS = [
+    os.path.join(SERVER_DIR, "assets", "reference_output_1.json"),
+    os.path.join(SERVER_DIR, "assets", "reference_output_2.json"),
+]
+
+QUERIES = ["momentum", "spektrum", "rajah", "the", "force", "cahaya gelombang", "moment", "xyzzy"]
+
+
+def load_papers():
+    papers = []
+    for path in REFERENCE_OUTPUTS:
+        with open(path, encoding="utf-8") as f:
+            papers.append((os.path.basename(path), parse_paper(json.load(f))))
+    return papers
+
+
+def build(index, papers, target):
+    start = time.perf_counter()
+    document_id = 0
+    while index.count() < target:
+        for file_name, paper in papers:
+            document_id += 1
+            index.index_document(document_id, file_name, paper)
+    return {"documents": document_id, "questions": index.count(), "seconds": time.perf_counter() - start}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Question index benchmark")
+    parser.add_argument("--questions", type=int, default=100000, help="Index size in questions")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    papers = load_papers()
+    per_document = sum(len(list(flatten_paper(0, None, paper))) for _, paper in papers) / len(papers)
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = QuestionIndex(os.path.join(directory, "questions.db"))
+        report = {"questions_per_document": per_document, "build": build(index, papers, args.questions), "queries": {}}
+
+        for query in QUERIES:
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                results = index.search(query, limit=args.limit)
+                times.append((time.perf_counter() - start) * 1000)
+            report["queries"][query] = {
+                "results": len(results),
+                "p50_ms": statistics.median(times),
+                "p95_ms": percentile(times, 0.95),
+                "max_ms": max(times),
+            }
+        report["worst_p95_ms"] = max(query["p95_ms"] for query in report["queries"].values())
+        report["index_bytes"] = os.path.getsize(os.path.join(directory, "questions.db"))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
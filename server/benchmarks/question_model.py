@@ -0,0 +1,96 @@
+"""
+Parse time and memory of the typed question model versus raw dicts.
+
+The reference outputs are replicated to a large paper. The dict path is
+json.loads plus the recursive "\\n" replacement wordgen used to run on
+every export. The model path is json.loads plus modules.models.parse_paper.
+Memory is what each resulting tree keeps alive, measured with tracemalloc.
+
+Usage (from the server directory):
+    python -m benchmarks.question_model --copies 50
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from modules.models import parse_paper  # noqa: E402
+
+REFERENCE_OUTPUTS = [
+    os.path.join(SERVER_DIR, "assets", "reference_output_1.json"),
+    os.path.join(SERVER_DIR, "assets", "reference_output_2.json"),
+]
+
+
+def replace_newlines(data):
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if isinstance(value, str):
+                data[key] = value.replace("\\n", "\n")
+            else:
+                replace_newlines(value)
+    elif isinstance(data, list):
+        for item in data:
+            replace_newlines(item)
+
+
+def parse_dict(text):
+    data = json.loads(text)
+    replace_newlines(data)
+    return data
+
+
+def parse_model(text):
+    return parse_paper(json.loads(text))
+
+
+def large_paper(copies):
+    main_questions = []
+    for path in REFERENCE_OUTPUTS:
+        with open(path, encoding="utf-8") as f:
+            main_questions.extend(json.load(f)["main_questions"])
+    return json.dumps({"main_questions": main_questions * copies}, ensure_ascii=False)
+
+
+def measure(parse, text, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(text)
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    tree = parse(text)
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del tree
+    return {"seconds": min(times), "retained_mb": retained / (1024 * 1024)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Question model parse benchmark")
+    parser.add_argument("--copies", type=int, default=50, help="Times the reference questions are repeated")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    text = large_paper(args.copies)
+    report = {
+        "json_bytes": len(text.encode("utf-8")),
+        "dict": measure(parse_dict, text, args.repeat),
+        "model": measure(parse_model, text, args.repeat),
+    }
+    report["memory_ratio"] = report["model"]["retained_mb"] / report["dict"]["retained_mb"]
+    report["time_ratio"] = report["model"]["seconds"] / report["dict"]["seconds"]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
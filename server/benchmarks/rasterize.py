@@ -0,0 +1,93 @@
+"""
+Pages per second and peak memory of modules.utils.rasterize_pdf versus workers.
+
+Each bundled PDF is rasterized once per worker count. Peak RSS is sampled
+every 10 ms over this process and its worker processes combined, so it
+includes the per-worker copies of the source PDF and the pages in flight.
+
+Usage (from the server directory):
+    python -m benchmarks.rasterize --workers 1 2 4 --dpi 150
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+import time
+
+import psutil
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from modules.utils import RASTER_DPI, get_last_page, rasterize_pdf  # noqa: E402
+
+PDFS = sorted(glob.glob(os.path.join(SERVER_DIR, "assets", "*.pdf")))
+
+
+class PeakRSS:
+    """Samples the RSS of this process tree in a background thread."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        process = psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._sample())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF rasterization benchmark")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--dpi", type=int, default=RASTER_DPI)
+    parser.add_argument("--colorspace", default="rgb", choices=["rgb", "gray"])
+    parser.add_argument("--format", default="png", choices=["png", "jpeg"])
+    args = parser.parse_args()
+
+    report = {"cpu_count": os.cpu_count(), "dpi": args.dpi, "colorspace": args.colorspace, "format": args.format, "pdfs": {}}
+    for path in PDFS:
+        with open(path, "rb") as f:
+            pdf_content = f.read()
+        pages = get_last_page(pdf_content)
+        runs = {}
+        for workers in args.workers:
+            with PeakRSS() as rss:
+                start = time.perf_counter()
+                output = rasterize_pdf(pdf_content, dpi=args.dpi, colorspace=args.colorspace,
+                                       image_format=args.format, workers=workers)
+                elapsed = time.perf_counter() - start
+            runs[workers] = {
+                "seconds": elapsed,
+                "pages_per_second": pages / elapsed,
+                "peak_rss_mb": rss.peak / (1024 * 1024),
+                "output_mb": len(output) / (1024 * 1024),
+            }
+        report["pdfs"][os.path.basename(path)] = {"pages": pages, "workers": runs}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Simulation of the extraction scheduler on a mixed workload.
+
+Generates Poisson arrivals of short quizzes, long exam papers and scanned
+papers, builds a PdfProbe for each so the cost estimate goes through
+modules.extraction_queue.estimate_cost, and draws each job's real duration
+around that estimate (lognormal, --noise) to model estimation error. The same
+workload is then replayed through a discrete-event model of the extraction
+workers with each policy's job_priority:
+
+    fifo       submission order (the old behaviour)
+    sjf        cheapest estimate first, no aging
+    sjf+aging  cheapest estimate first, aged by --aging (the default policy)
+
+Reports mean/p50/p95/p99/max completion time (arrival to finish) overall and
+per job kind, so starvation of long papers shows up in their max.
+
+Usage (from the server directory):
+    python -m benchmarks.scheduling --jobs 2000 --load 0.85 --workers 1
+"""
+import argparse
+import json
+import heapq
+import os
+import random
+import statistics
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from modules.extraction_queue import EXTRACTION_AGING, estimate_cost, job_priority  # noqa: E402
+from modules.pdf_probe import PageInfo, PdfProbe  # noqa: E402
+
+# kind -> (share of uploads, page range, main question range, scanned)
+WORKLOAD = {
+    "quiz": (0.6, (4, 8), (3, 6), False),
+    "paper": (0.3, (30, 45), (8, 14), False),
+    "scanned": (0.1, (10, 30), (0, 0), True),
+}
+
+
+def make_probe(rng, pages, questions, scanned):
+    page_infos = [PageInfo(number, 595.0, 842.0, 0 if scanned else 2000, 1 if scanned else 0)
+                  for number in range(1, pages + 1)]
+    # Main questions spread evenly over the pages; scanned papers have no anchors
+    anchors = [(number, 1 + (number - 1) * pages // questions) for number in range(1, questions + 1)]
+    return PdfProbe(content_hash=f"{rng.getrandbits(64):016x}", size_bytes=pages * 100_000,
+                    page_count=pages, pages=page_infos, anchors=anchors)
+
+
+def make_workload(jobs, load, workers, noise, seed):
+    """Returns (arrival, kind, estimate, duration) tuples sorted by arrival."""
+    rng = random.Random(seed)
+    kinds = list(WORKLOAD)
+    shares = [WORKLOAD[kind][0] for kind in kinds]
+    drawn = []
+    for _ in range(jobs):
+        kind = rng.choices(kinds, shares)[0]
+        _, (min_pages, max_pages), (min_questions, max_questions), scanned = WORKLOAD[kind]
+        probe = make_probe(rng, rng.randint(min_pages, max_pages), rng.randint(min_questions, max_questions), scanned)
+        estimate = estimate_cost(probe)
+        drawn.append((kind, estimate, estimate * rng.lognormvariate(0, noise)))
+
+    # Arrival rate that keeps the workers busy the given fraction of the time
+    rate = load * workers / statistics.fmean(duration for _, _, duration in drawn)
+    arrival = 0.0
+    workload = []
+    for kind, estimate, duration in drawn:
+        arrival += rng.expovariate(rate)
+        workload.append((arrival, kind, estimate, duration))
+    return workload
+
+
+def simulate(workload, workers, scheduler, aging):
+    """Completion time of every job, in arrival order, as (kind, seconds)."""
+    free = [0.0] * workers  # times at which each worker becomes idle
+    heapq.heapify(free)
+    queued = []
+    completion = [None] * len(workload)
+    index = 0
+    while index < len(workload) or queued:
+        now = heapq.heappop(free)
+        if not queued and workload[index][0] > now:
+            now = workload[index][0]
+        while index < len(workload) and workload[index][0] <= now:
+            queued.append(index)
+            index += 1
+        seq = min(queued, key=lambda seq: job_priority(workload[seq][2], now - workload[seq][0], seq, scheduler, aging))
+        queued.remove(seq)
+        arrival, kind, _, duration = workload[seq]
+        heapq.heappush(free, now + duration)
+        completion[seq] = (kind, now + duration - arrival)
+    return completion
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def summarize(seconds):
+    return {
+        "jobs": len(seconds),
+        "mean": round(statistics.fmean(seconds), 1),
+        "p50": round(percentile(seconds, 0.50), 1),
+        "p95": round(percentile(seconds, 0.95), 1),
+        "p99": round(percentile(seconds, 0.99), 1),
+        "max": round(max(seconds), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extraction scheduler simulation")
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--load", type=float, default=0.85, help="fraction of worker time that is busy")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--noise", type=float, default=0.3, help="sigma of the lognormal estimate error")
+    parser.add_argument("--aging", type=float, default=EXTRACTION_AGING)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    workload = make_workload(args.jobs, args.load, args.workers, args.noise, args.seed)
+    policies = {"fifo": ("fifo", 0.0), "sjf": ("sjf", 0.0), "sjf+aging": ("sjf", args.aging)}
+
+    report = {"config": vars(args), "policies": {}}
+    for name, (scheduler, aging) in policies.items():
+        completion = simulate(workload, args.workers, scheduler, aging)
+        result = {"all": summarize([seconds for _, seconds in completion])}
+        for kind in WORKLOAD:
+            seconds = [seconds for job_kind, seconds in completion if job_kind == kind]
+            if seconds:
+                result[kind] = summarize(seconds)
+        report["policies"][name] = result
+
+    fifo = report["policies"]["fifo"]["all"]
+    report["vs_fifo"] = {
+        name: {"mean": round(result["all"]["mean"] / fifo["mean"], 3), "p95": round(result["all"]["p95"] / fifo["p95"], 3)}
+        for name, result in report["policies"].items() if name != "fifo"
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
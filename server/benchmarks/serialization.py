@@ -0,0 +1,82 @@
+"""
+Encode/decode time and stored size of extracted document JSON.
+
+The reference outputs are replicated to a large paper and round-tripped
+through the stdlib json module and config.serialization (orjson when
+installed). Stored size compares the raw UTF-8 JSON with the zlib and zstd
+blobs the local backend writes to its "data" column. Replicated copies
+flatter the compressors (zstd finds the repeats), so compare codecs on
+--copies 1 as well.
+
+Usage (from the server directory):
+    python -m benchmarks.serialization --copies 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from config import serialization  # noqa: E402
+
+REFERENCE_OUTPUTS = [
+    os.path.join(SERVER_DIR, "assets", "reference_output_1.json"),
+    os.path.join(SERVER_DIR, "assets", "reference_output_2.json"),
+]
+
+
+def large_document(copies):
+    main_questions = []
+    for path in REFERENCE_OUTPUTS:
+        with open(path, encoding="utf-8") as f:
+            main_questions.extend(json.load(f)["main_questions"])
+    return {"main_questions": main_questions * copies}
+
+
+def best_of(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def stdlib_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Document JSON serialization benchmark")
+    parser.add_argument("--copies", type=int, default=50, help="Times the reference questions are repeated")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    document = large_document(args.copies)
+    report = {"encoder": "orjson" if serialization.orjson else "json"}
+
+    encode_json, raw = best_of(lambda: stdlib_dumps(document), args.repeat)
+    decode_json, _ = best_of(lambda: json.loads(raw), args.repeat)
+    encode_fast, _ = best_of(lambda: serialization.dumps(document), args.repeat)
+    decode_fast, _ = best_of(lambda: serialization.loads(raw), args.repeat)
+    report["encode_seconds"] = {"json": encode_json, "fast": encode_fast, "speedup": encode_json / encode_fast}
+    report["decode_seconds"] = {"json": decode_json, "fast": decode_fast, "speedup": decode_json / decode_fast}
+
+    sizes = {"raw": len(raw), "zlib": len(zlib.compress(raw, 9))}
+    compress_seconds, blob = best_of(lambda: serialization.compress_json(document), args.repeat)
+    decompress_seconds, restored = best_of(lambda: serialization.decompress_json(blob), args.repeat)
+    assert restored == document
+    sizes["stored"] = len(blob)
+    sizes["stored_codec"] = "zstd" if blob[:1] == b"Z" else "zlib"
+    sizes["stored_ratio"] = len(blob) / len(raw)
+    report["bytes"] = sizes
+    report["store_seconds"] = {"compress": compress_seconds, "decompress": decompress_seconds}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
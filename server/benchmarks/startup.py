@@ -0,0 +1,92 @@
+"""
+Cold-start benchmark for the API process.
+
+Imports `main` in fresh interpreters and reports import time, peak RSS and
+whether any of the heavy extraction modules were pulled in. Exits non-zero
+when a run breaks the thresholds so it can gate CI / deploys.
+
+Usage (from the server directory):
+    python -m benchmarks.startup --runs 5 --max-seconds 3 --max-rss-mb 250
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be imported by the extraction worker path
+HEAVY_MODULES = ["torch", "ultralytics", "cv2", "pdf2image", "google.genai"]
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss_kb //= 1024  # ru_maxrss is reported in bytes on macOS
+print(json.dumps({
+    "import_seconds": elapsed,
+    "peak_rss_mb": rss_kb / 1024,
+    "heavy_modules": [m for m in %r if m in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def run_once():
+    env = os.environ.copy()
+    # init_db only builds the client, so placeholders are enough to import main
+    env.setdefault("SUPABASE_URL", "http://localhost:54321")
+    env.setdefault("SUPABASE_KEY", "benchmark")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=SERVER_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=3.0, help="Median import time threshold")
+    parser.add_argument("--max-rss-mb", type=float, default=250.0, help="Max peak RSS threshold")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    import_times = [r["import_seconds"] for r in runs]
+    peak_rss = max(r["peak_rss_mb"] for r in runs)
+    heavy = sorted({m for r in runs for m in r["heavy_modules"]})
+
+    report = {
+        "runs": args.runs,
+        "median_import_seconds": statistics.median(import_times),
+        "max_import_seconds": max(import_times),
+        "peak_rss_mb": peak_rss,
+        "heavy_modules": heavy,
+    }
+    print(json.dumps(report, indent=2))
+
+    failures = []
+    if report["median_import_seconds"] > args.max_seconds:
+        failures.append(f"median import time {report['median_import_seconds']:.2f}s > {args.max_seconds}s")
+    if peak_rss > args.max_rss_mb:
+        failures.append(f"peak RSS {peak_rss:.0f}MB > {args.max_rss_mb}MB")
+    if heavy:
+        failures.append(f"heavy modules imported at startup: {', '.join(heavy)}")
+
+    if failures:
+        for failure in failures:
+            print(f"REGRESSION: {failure}")
+        sys.exit(1)
+    print("Startup within thresholds.")
+
+
+if __name__ == "__main__":
+    main()
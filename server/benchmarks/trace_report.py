@@ -0,0 +1,61 @@
+"""
+Latency breakdown per document from the spans written by config.tracing.
+
+Groups the JSON-lines trace file by document id and span name and reports
+the count, total and max duration of each stage, plus failed spans.
+
+Usage (from the server directory):
+    python -m benchmarks.trace_report --path traces/spans.jsonl --document 42
+"""
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from config.tracing import TRACE_PATH  # noqa: E402
+
+
+def load_spans(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def breakdown(spans, document=None):
+    documents = defaultdict(lambda: defaultdict(lambda: {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0}))
+    # Spans opened before the document id was known share the trace id of one that has it
+    trace_documents = {}
+    spans = list(spans)
+    for span in spans:
+        document_id = span["attributes"].get("document_id")
+        if document_id is not None:
+            trace_documents.setdefault(span["trace_id"], document_id)
+
+    for span in spans:
+        document_id = span["attributes"].get("document_id", trace_documents.get(span["trace_id"]))
+        if document_id is None or (document is not None and str(document_id) != document):
+            continue
+        stage = documents[str(document_id)][span["name"]]
+        stage["count"] += 1
+        stage["total_ms"] = round(stage["total_ms"] + span["duration_ms"], 3)
+        stage["max_ms"] = max(stage["max_ms"], span["duration_ms"])
+        stage["errors"] += span["status"] != "ok"
+    return {document_id: dict(sorted(stages.items(), key=lambda item: -item[1]["total_ms"]))
+            for document_id, stages in documents.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-document latency breakdown from trace spans")
+    parser.add_argument("--path", default=TRACE_PATH)
+    parser.add_argument("--document", help="only this document id")
+    args = parser.parse_args()
+    print(json.dumps(breakdown(load_spans(args.path), args.document), indent=2))
+
+
+if __name__ == "__main__":
+    main()
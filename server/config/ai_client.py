@@ -1,16 +1,31 @@
 import os
 import base64
-import time
 from google import genai
 from google.genai import types
 
-def get_ai_response(file, start, end):
+from modules.pdf_text import request_parts
+from config.tracing import span
+
+# gemini, or replay to answer from a recorded extraction (see config/replay_client.py)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.0-flash")
+
+def model_label():
+  """Model name used in metrics and usage records."""
+  return "replay" if LLM_BACKEND == "replay" else LLM_MODEL
+
+def get_ai_response(file, start, end, page_text=None):
+  """
+  Extracts main questions start..end. file is the PDF; with page_text (text-layer
+  mode) it is only the pages without a text layer, or None.
+  """
+  if LLM_BACKEND == "replay":
+    from config.replay_client import get_replay_response
+    return get_replay_response(file, start, end, page_text)
+
   client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
   
-  model = "gemini-2.0-flash"
-  
-  print("uploading files")
-  upload_start = time.time()
+  model = LLM_MODEL
   
   # Get reference files
   base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -19,15 +34,13 @@ def get_ai_response(file, start, end):
   reference_input_2_file_path = os.path.join(base_dir, "..", "assets", "reference_input_2.pdf")
   reference_output_2_file_path = os.path.join(base_dir, "..", "assets", "reference_output_2.txt")
   
-  files = [
-    client.files.upload(file=reference_input_1_file_path),
-    client.files.upload(file=reference_output_1_file_path),
-    client.files.upload(file=reference_input_2_file_path),
-    client.files.upload(file=reference_output_2_file_path)
-  ]
-  
-  upload_end = time.time()
-  print(f"Upload time: {upload_end - upload_start}")
+  with span("llm.reference_upload", files=4):
+    files = [
+      client.files.upload(file=reference_input_1_file_path),
+      client.files.upload(file=reference_output_1_file_path),
+      client.files.upload(file=reference_input_2_file_path),
+      client.files.upload(file=reference_output_2_file_path)
+    ]
 
   fixed_contents = [
         # Rules and Schema
@@ -451,11 +464,9 @@ Do not copy exactly from these references when generating JSON output, ONLY stud
         types.Content(
             role="user",
             parts=[
-                types.Part.from_bytes(
-                    data=file,
-                    mime_type="application/pdf",
-                ),
-                types.Part.from_text(text=f"Extract **Main Questions {start} to {end}** for this PDF."),
+                types.Part.from_bytes(data=value, mime_type="application/pdf") if kind == "pdf"
+                else types.Part.from_text(text=value)
+                for kind, value in request_parts(file, start, end, page_text)
             ],
         ),
     ]
@@ -469,16 +480,13 @@ Do not copy exactly from these references when generating JSON output, ONLY stud
         ],
     )
   
-  response_start = time.time()
-  response = client.models.generate_content(
-    model = model,
-    contents = fixed_contents,
-    config = generate_content_config
-  )
-  response_end = time.time()
-  print(f"Response time for questions {start} to {end}: {response_end - response_start}")
+  with span("llm.generate", model=model):
+    response = client.models.generate_content(
+      model = model,
+      contents = fixed_contents,
+      config = generate_content_config
+    )
   
-  print(response.usage_metadata)
   return response
 
 def convert_pdf_to_part(pdf_file):
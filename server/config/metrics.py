@@ -0,0 +1,104 @@
+import json
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+
+# Prometheus metrics for extraction, served at /metrics. With several uvicorn workers set
+# PROMETHEUS_MULTIPROC_DIR so every worker writes to a shared directory and /metrics
+# aggregates them (see the prometheus_client multiprocess docs).
+
+# USD per million tokens; defaults are the gemini-2.0-flash list prices
+LLM_PRICE_INPUT_PER_MTOK = float(os.getenv("LLM_PRICE_INPUT_PER_MTOK", "0.10"))
+LLM_PRICE_OUTPUT_PER_MTOK = float(os.getenv("LLM_PRICE_OUTPUT_PER_MTOK", "0.40"))
+LLM_PRICE_CACHED_PER_MTOK = float(os.getenv("LLM_PRICE_CACHED_PER_MTOK", "0.025"))
+
+LLM_LATENCY = Histogram(
+    "llm_request_seconds", "Latency of one extraction request to the model", ["model", "range"],
+    buckets=(1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300),
+)
+LLM_INPUT_TOKENS = Counter("llm_input_tokens_total", "Prompt tokens sent to the model, cached ones included", ["model"])
+LLM_OUTPUT_TOKENS = Counter("llm_output_tokens_total", "Tokens generated by the model", ["model"])
+LLM_CACHED_TOKENS = Counter("llm_cached_tokens_total", "Prompt tokens served from the model's context cache", ["model"])
+LLM_COST = Counter("llm_cost_usd_total", "Estimated model cost in USD", ["model"])
+LLM_RETRIES = Counter("llm_retries_total", "Failed extraction attempts that were retried or gave up", ["cause"])
+DOCUMENTS = Counter("documents_processed_total", "Documents by final extraction status", ["status"])
+EXTRACTION_QUEUED = Gauge("extraction_jobs_queued", "Extraction jobs waiting for a worker", multiprocess_mode="livesum")
+EXTRACTION_IN_FLIGHT = Gauge("extraction_jobs_running", "Extraction jobs being processed", multiprocess_mode="livesum")
+UPLOADS_REJECTED = Counter("uploads_rejected_total", "Uploads refused by admission control", ["reason"])
+DETECT_PAGES = Counter("detect_pages_total", "Pages run through the diagram/table detector")
+DETECT_SECONDS = Counter("detect_seconds_total", "Time spent in the diagram/table detector")
+DETECT_PAGES_PER_SECOND = Gauge("detect_pages_per_second", "Detector throughput of the last document", multiprocess_mode="mostrecent")
+
+def retry_cause(error):
+    """Buckets an extraction error into a small fixed set of causes for llm_retries_total."""
+    if isinstance(error, json.JSONDecodeError):
+        return "invalid_json"
+    if isinstance(error, TimeoutError) or "timeout" in type(error).__name__.lower():
+        return "timeout"
+    message = str(error)
+    if "429" in message or "RESOURCE_EXHAUSTED" in message:
+        return "rate_limited"
+    if "503" in message or "UNAVAILABLE" in message:
+        return "unavailable"
+    return "error"
+
+class DocumentUsage:
+    """Token, cost and latency totals of one document's extraction, stored on its record."""
+
+    def __init__(self, model):
+        self.model = model
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        self.cost_usd = 0.0
+        self.llm_seconds = 0.0
+        self.requests = 0
+
+    def record(self, range_label, seconds, usage_metadata):
+        """Adds one successful model response to the totals and the metrics."""
+        input_tokens = getattr(usage_metadata, "prompt_token_count", None) or 0
+        output_tokens = getattr(usage_metadata, "candidates_token_count", None) or 0
+        cached_tokens = getattr(usage_metadata, "cached_content_token_count", None) or 0
+        cost = ((input_tokens - cached_tokens) * LLM_PRICE_INPUT_PER_MTOK
+                + cached_tokens * LLM_PRICE_CACHED_PER_MTOK
+                + output_tokens * LLM_PRICE_OUTPUT_PER_MTOK) / 1_000_000
+
+        LLM_LATENCY.labels(self.model, range_label).observe(seconds)
+        LLM_INPUT_TOKENS.labels(self.model).inc(input_tokens)
+        LLM_OUTPUT_TOKENS.labels(self.model).inc(output_tokens)
+        LLM_CACHED_TOKENS.labels(self.model).inc(cached_tokens)
+        LLM_COST.labels(self.model).inc(cost)
+
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.cached_tokens += cached_tokens
+        self.cost_usd += cost
+        self.llm_seconds += seconds
+        self.requests += 1
+
+    def to_dict(self):
+        return {
+            "model": self.model,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "llm_seconds": round(self.llm_seconds, 3),
+            "requests": self.requests,
+        }
+
+def record_detection(pages, seconds):
+    DETECT_PAGES.inc(pages)
+    DETECT_SECONDS.inc(seconds)
+    if pages and seconds > 0:
+        DETECT_PAGES_PER_SECOND.set(pages / seconds)
+
+def render_metrics():
+    """Returns (body, content type) of the Prometheus text exposition."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
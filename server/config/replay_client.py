@@ -0,0 +1,77 @@
+import json
+import math
+import os
+import random
+import time
+from types import SimpleNamespace
+
+import fitz
+
+from modules.pdf_text import request_parts
+
+# Offline stand-in for the Gemini call (LLM_BACKEND=replay). It answers each range
+# request from a recorded extraction and reports what the request would have cost:
+# input tokens counted the way Gemini bills them and a latency derived from the
+# token counts. Used by benchmarks and load tests; sleeping is opt-in.
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+REPLAY_OUTPUT = os.getenv("REPLAY_OUTPUT", os.path.join(base_dir, "..", "assets", "reference_output_2.json"))
+
+# Gemini bills a PDF page as 258 tokens; text is roughly 4 characters per token
+PDF_TOKENS_PER_PAGE = 258
+CHARS_PER_TOKEN = 4
+
+# Latency model: fixed overhead plus prefill and decode time per token
+REPLAY_BASE_SECONDS = float(os.getenv("REPLAY_BASE_SECONDS", "0.5"))
+REPLAY_SECONDS_PER_INPUT_TOKEN = float(os.getenv("REPLAY_SECONDS_PER_INPUT_TOKEN", "0.00002"))
+REPLAY_SECONDS_PER_OUTPUT_TOKEN = float(os.getenv("REPLAY_SECONDS_PER_OUTPUT_TOKEN", "0.005"))
+REPLAY_SLEEP = os.getenv("REPLAY_SLEEP", "false").lower() == "true"
+# Spread of the modelled latency, e.g. 0.3 for +-30%, so load tests do not move in lockstep
+REPLAY_JITTER = float(os.getenv("REPLAY_JITTER", "0"))
+
+_recordings = {}
+
+def load_recording(path):
+    if path not in _recordings:
+        with open(path, encoding="utf-8") as f:
+            _recordings[path] = json.load(f)
+    return _recordings[path]
+
+def count_tokens(parts):
+    tokens = 0
+    for kind, value in parts:
+        if kind == "pdf":
+            with fitz.open(stream=value, filetype="pdf") as document:
+                tokens += document.page_count * PDF_TOKENS_PER_PAGE
+        else:
+            tokens += math.ceil(len(value) / CHARS_PER_TOKEN)
+    return tokens
+
+def _in_range(number, start, end):
+    try:
+        return start <= int(number) <= end
+    except (TypeError, ValueError):
+        return False
+
+def get_replay_response(file, start, end, page_text=None, recording=None):
+    """Returns a Gemini-like response (text, usage_metadata) for main questions start..end."""
+    data = load_recording(recording or REPLAY_OUTPUT)
+    main_questions = [main_q for main_q in data.get("main_questions", []) if _in_range(main_q.get("number"), start, end)]
+    text = json.dumps({"main_questions": main_questions}, ensure_ascii=False)
+
+    prompt_tokens = count_tokens(request_parts(file, start, end, page_text))
+    output_tokens = math.ceil(len(text) / CHARS_PER_TOKEN)
+    latency = (REPLAY_BASE_SECONDS + prompt_tokens * REPLAY_SECONDS_PER_INPUT_TOKEN
+               + output_tokens * REPLAY_SECONDS_PER_OUTPUT_TOKEN)
+    if REPLAY_JITTER:
+        latency *= random.uniform(1 - REPLAY_JITTER, 1 + REPLAY_JITTER)
+    if REPLAY_SLEEP:
+        time.sleep(latency)
+
+    usage = SimpleNamespace(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=output_tokens,
+        total_token_count=prompt_tokens + output_tokens,
+    )
+    print(f"Replayed questions {start} to {end}: {usage.prompt_token_count} input tokens, {latency:.2f}s modelled")
+    return SimpleNamespace(text=text, usage_metadata=usage, latency=latency)
@@ -0,0 +1,58 @@
+import json
+import zlib
+
+from fastapi.responses import JSONResponse
+
+# orjson and zstandard are optional: without them this falls back to the stdlib
+# json encoder and zlib, with the same API for callers.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD_LEVEL = 10
+
+# One-byte header on compressed blobs so either codec can always be read back
+_CODEC_ZSTD = b"Z"
+_CODEC_ZLIB = b"D"
+
+def dumps(obj):
+    """Serializes obj to UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def loads(data):
+    """Parses JSON from bytes or str."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def compress_json(obj):
+    """Serializes and compresses obj for storage."""
+    raw = dumps(obj)
+    if zstandard is not None:
+        return _CODEC_ZSTD + zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return _CODEC_ZLIB + zlib.compress(raw, 9)
+
+def decompress_json(blob):
+    """Inverse of compress_json."""
+    codec, payload = blob[:1], blob[1:]
+    if codec == _CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read this blob")
+        return loads(zstandard.ZstdDecompressor().decompress(payload))
+    if codec == _CODEC_ZLIB:
+        return loads(zlib.decompress(payload))
+    raise ValueError(f"Unknown compression codec: {codec!r}")
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed."""
+
+    def render(self, content):
+        return dumps(content)
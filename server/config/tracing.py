@@ -0,0 +1,138 @@
+import contextvars
+import importlib
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from config.serialization import dumps
+
+# Structured timing spans for the extraction and export stages. Spans nest through a
+# context variable, carry the document id / range / page of their parent, and are
+# handed to an exporter when they end. The default exporter appends one JSON object
+# per span to TRACE_PATH, so latency breakdowns per document are a group-by away.
+
+# jsonl (default), console, none, or "package.module:factory" for a custom exporter
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "jsonl")
+TRACE_PATH = os.getenv("TRACE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "traces", "spans.jsonl"))
+
+# Attributes children copy from their parent span
+INHERITED_ATTRIBUTES = ("document_id", "range", "page")
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start", "duration", "status", "error")
+
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration = None
+        self.status = "ok"
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+class JsonlExporter:
+    """Appends each span as a JSON line; safe across threads and worker processes (O_APPEND)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def export(self, span):
+        line = dumps(span.to_dict()) + b"\n"
+        with self._lock, open(self.path, "ab") as f:
+            f.write(line)
+
+class ConsoleExporter:
+    def export(self, span):
+        attributes = " ".join(f"{key}={value}" for key, value in span.attributes.items())
+        print(f"[{span.name}] {span.duration * 1000:.1f}ms {span.status} {attributes}")
+
+class NullExporter:
+    def export(self, span):
+        pass
+
+def _create_exporter(name):
+    if name == "jsonl":
+        return JsonlExporter(TRACE_PATH)
+    if name == "console":
+        return ConsoleExporter()
+    if name == "none":
+        return NullExporter()
+    module_name, _, factory = name.partition(":")
+    return getattr(importlib.import_module(module_name), factory)()
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+def get_exporter():
+    global _exporter
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = _create_exporter(TRACE_EXPORTER)
+    return _exporter
+
+def set_exporter(exporter):
+    """Replaces the exporter, e.g. with one that forwards spans to a collector."""
+    global _exporter
+    with _exporter_lock:
+        _exporter = exporter
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+@contextmanager
+def span(name, **attributes):
+    """Times the enclosed block as a child of the current span. Exceptions mark it as failed."""
+    parent = _current_span.get()
+    if parent is not None:
+        inherited = {key: parent.attributes[key] for key in INHERITED_ATTRIBUTES if key in parent.attributes}
+        attributes = {**inherited, **attributes}
+    current = Span(name, parent.trace_id if parent else uuid.uuid4().hex, parent.span_id if parent else None, attributes)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        _current_span.reset(token)
+        try:
+            get_exporter().export(current)
+        except Exception as e:
+            print(f"Failed to export span {name}: {e}")
+
+def bind(function):
+    """Wraps function so that spans it opens on a pool thread are children of the caller's span."""
+    parent = _current_span.get()
+
+    def bound(*args, **kwargs):
+        token = _current_span.set(parent)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current_span.reset(token)
+
+    return bound
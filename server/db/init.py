@@ -1,7 +1,13 @@
 import os
-from supabase import create_client, Client
 
 def init_db():
+    # DB_BACKEND=local keeps documents and storage on disk (SQLite + a folder),
+    # for development and benchmarks without a Supabase project
+    if os.environ.get("DB_BACKEND") == "local":
+        from db.local import init_local_db
+        return init_local_db()
+
+    from supabase import create_client, Client
     url: str = os.environ.get("SUPABASE_URL")
     key: str = os.environ.get("SUPABASE_KEY")
     supabase: Client = create_client(url, key)
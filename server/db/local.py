@@ -0,0 +1,218 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from config.serialization import dumps, loads, compress_json, decompress_json
+
+# Local stand-in for the subset of the Supabase client used by the API: table
+# queries (select/insert/update/delete with eq/in_/order) and storage buckets.
+# Rows live in SQLite; the large "data" column is stored compressed on its own so
+# list queries and filters never have to decode it.
+
+COMPRESSED_COLUMN = "data"
+
+# Column defaults the Supabase schema provides for new rows
+TABLE_DEFAULTS = {
+    "documents": {"status": "in process", "version": 1, "data": None},
+}
+TIMESTAMP_COLUMNS = {
+    "documents": "uploaded_date",
+    "document_edits": "created_at",
+}
+
+class LocalResponse:
+    def __init__(self, data):
+        self.data = data
+        self.count = len(data)
+
+class LocalQuery:
+    def __init__(self, client, table):
+        self._client = client
+        self._table = table
+        self._action = "select"
+        self._columns = None
+        self._values = None
+        self._filters = []
+        self._order = None
+
+    def select(self, columns="*"):
+        self._action = "select"
+        if columns.strip() != "*":
+            self._columns = [column.strip() for column in columns.split(",")]
+        return self
+
+    def insert(self, values):
+        self._action = "insert"
+        self._values = values if isinstance(values, list) else [values]
+        return self
+
+    def update(self, values):
+        self._action = "update"
+        self._values = values
+        return self
+
+    def delete(self):
+        self._action = "delete"
+        return self
+
+    def eq(self, column, value):
+        # PostgREST compares on the column type; ids arrive as str from path params
+        self._filters.append(lambda row: str(row.get(column)) == str(value))
+        return self
+
+    def in_(self, column, values):
+        values = {str(value) for value in values}
+        self._filters.append(lambda row: str(row.get(column)) in values)
+        return self
+
+    def order(self, column, desc=False):
+        self._order = (column, desc)
+        return self
+
+    def execute(self):
+        return LocalResponse(self._client._execute(self))
+
+class LocalBucket:
+    def __init__(self, storage, bucket):
+        self._storage = storage
+        self._bucket = bucket
+
+    def upload(self, path, file):
+        target = os.path.join(self._storage.directory, self._bucket, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(file)
+        return {"path": path}
+
+    def get_public_url(self, path):
+        return f"{self._storage.public_url}/{self._bucket}/{path}"
+
+class LocalStorage:
+    def __init__(self, directory, public_url):
+        self.directory = directory
+        self.public_url = public_url.rstrip("/")
+
+    def from_(self, bucket):
+        return LocalBucket(self, bucket)
+
+class LocalClient:
+    def __init__(self, path, storage_dir, public_url):
+        self.path = path
+        self.storage = LocalStorage(storage_dir, public_url)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "tbl TEXT NOT NULL, id INTEGER NOT NULL, fields BLOB NOT NULL, data BLOB, "
+            "PRIMARY KEY (tbl, id))"
+        )
+        # Highest id ever used per table, so ids of deleted rows are never handed out again
+        # (storage paths and cached image URLs are derived from them)
+        conn.execute("CREATE TABLE IF NOT EXISTS sequences (tbl TEXT PRIMARY KEY, last_id INTEGER NOT NULL)")
+
+    def table(self, name):
+        return LocalQuery(self, name)
+
+    def _connection(self):
+        # One connection per thread: FastAPI runs sync endpoints on a threadpool
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _encode(self, row):
+        data = row.get(COMPRESSED_COLUMN)
+        if data is None:
+            # Tables without a data column (or a null one) keep it in the plain fields
+            return dumps({key: value for key, value in row.items() if key != "id"}), None
+        fields = {key: value for key, value in row.items() if key not in ["id", COMPRESSED_COLUMN]}
+        return dumps(fields), compress_json(data)
+
+    def _rows(self, conn, query, with_data):
+        """Yields (id, row) for matching rows; "data" is only decompressed when with_data."""
+        records = conn.execute("SELECT id, fields, data FROM records WHERE tbl = ?", (query._table,))
+        for row_id, fields, data in records:
+            row = loads(fields)
+            row["id"] = row_id
+            if not all(matches(row) for matches in query._filters):
+                continue
+            if with_data and data is not None:
+                row[COMPRESSED_COLUMN] = decompress_json(data)
+            yield row_id, row
+
+    def _execute(self, query):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE" if query._action != "select" else "BEGIN")
+        try:
+            result = getattr(self, f"_{query._action}")(conn, query)
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _select(self, conn, query):
+        with_data = query._columns is None or COMPRESSED_COLUMN in query._columns
+        rows = [row for _, row in self._rows(conn, query, with_data)]
+        if query._order:
+            column, desc = query._order
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        if query._columns is not None:
+            rows = [{column: row.get(column) for column in query._columns} for row in rows]
+        return rows
+
+    def _insert(self, conn, query):
+        inserted = []
+        for values in query._values:
+            row = dict(TABLE_DEFAULTS.get(query._table, {}))
+            timestamp_column = TIMESTAMP_COLUMNS.get(query._table)
+            if timestamp_column:
+                row[timestamp_column] = datetime.now(timezone.utc).isoformat()
+            row.update(values)
+            row_id = row.get("id")
+            if row_id is None:
+                # Databases created before the sequences table only have their rows to go by
+                (last_id,) = conn.execute(
+                    "SELECT MAX(COALESCE((SELECT last_id FROM sequences WHERE tbl = ?), 0), "
+                    "COALESCE((SELECT MAX(id) FROM records WHERE tbl = ?), 0))",
+                    (query._table, query._table),
+                ).fetchone()
+                row_id = last_id + 1
+            row["id"] = row_id
+            conn.execute(
+                "INSERT INTO sequences (tbl, last_id) VALUES (?, ?) "
+                "ON CONFLICT (tbl) DO UPDATE SET last_id = MAX(last_id, excluded.last_id)",
+                (query._table, row_id),
+            )
+            conn.execute("INSERT INTO records (tbl, id, fields, data) VALUES (?, ?, ?, ?)", (query._table, row_id, *self._encode(row)))
+            inserted.append(row)
+        return inserted
+
+    def _update(self, conn, query):
+        updated = []
+        # Rows are rewritten whole, so the data column is needed
+        for row_id, row in list(self._rows(conn, query, True)):
+            row.update(query._values)
+            fields, data = self._encode(row)
+            conn.execute("UPDATE records SET fields = ?, data = ? WHERE tbl = ? AND id = ?", (fields, data, query._table, row_id))
+            updated.append(row)
+        return updated
+
+    def _delete(self, conn, query):
+        deleted = []
+        for row_id, row in list(self._rows(conn, query, True)):
+            conn.execute("DELETE FROM records WHERE tbl = ? AND id = ?", (query._table, row_id))
+            deleted.append(row)
+        return deleted
+
+def init_local_db():
+    base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "local_data")
+    return LocalClient(
+        os.getenv("LOCAL_DB_PATH", os.path.join(base_dir, "local.db")),
+        os.getenv("LOCAL_STORAGE_DIR", os.path.join(base_dir, "storage")),
+        os.getenv("LOCAL_PUBLIC_URL", "http://localhost:8000/storage"),
+    )
@@ -0,0 +1,12 @@
+-- Optimistic concurrency and edit log for PATCH /documents/{id}
+alter table documents add column if not exists version integer not null default 1;
+
+create table if not exists document_edits (
+    id bigint generated always as identity primary key,
+    document_id bigint not null references documents (id) on delete cascade,
+    version integer not null,
+    operations jsonb not null,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists document_edits_document_id_idx on document_edits (document_id, version);
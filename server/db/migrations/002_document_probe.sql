@@ -0,0 +1,4 @@
+-- One-pass PDF probe (page count, text layer, images, main question anchors, hash)
+alter table documents add column if not exists probe jsonb;
+
+create index if not exists documents_probe_hash_idx on documents ((probe ->> 'content_hash'));
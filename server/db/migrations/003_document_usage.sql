@@ -0,0 +1,2 @@
+-- Model token, cost and latency totals of each document's extraction
+alter table documents add column if not exists usage jsonb;
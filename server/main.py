@@ -4,25 +4,38 @@ import os
 from datetime import datetime
 from dotenv import load_dotenv
 import time
-import cv2
 
-from fastapi import FastAPI, HTTPException, File, UploadFile, BackgroundTasks, Request, Path
+from fastapi import FastAPI, HTTPException, File, UploadFile, Request, Response, Path, Body, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
+from urllib.parse import quote
 
-from modules.new import newPrompt, newPrompt2
-from modules.utils import get_reference_pdf, get_rasterized_pdf
-from modules.wordgen import generate
-from modules.crop_img import get_images, update_json_with_url
-
-from config.ai_client import get_ai_response
+from modules.wordgen import generate, warm_cache, drop_warmed
+from modules.disk_cache import image_cache
+from modules.batch_export import stream_zip, merge_documents
+from modules.models import parse_paper
+from modules.json_patch import apply_patch, dropped_paths, JsonPatchError
+from modules.question_index import get_question_index, index_document, remove_document, SEARCH_LIMIT
+from modules.dedup import get_dedup_index, fingerprint_document, remove_fingerprints
+from modules.assembly import assemble_paper, MissingQuestionsError
+from modules.pdf_probe import probe_pdf, plan_ranges
+from modules.extraction_queue import get_extraction_queue, client_key, estimate_cost, AdmissionError
 
 from db.init import init_db
+from config.tracing import span
+from config.metrics import DocumentUsage, DOCUMENTS, LLM_RETRIES, retry_cause, render_metrics
+from config.serialization import FastJSONResponse
 
 load_dotenv()
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 supabase = init_db()
+if os.getenv("DB_BACKEND") == "local":
+    # Serve uploaded crops the way Supabase storage would
+    os.makedirs(supabase.storage.directory, exist_ok=True)
+    app.mount("/storage", StaticFiles(directory=supabase.storage.directory), name="storage")
 
 origins = ["http://localhost:5173"]
 
@@ -34,6 +47,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.get("/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/documents")
 def get_documents():
     response = supabase.table("documents").select("*").order("uploaded_date", desc=True).execute()
@@ -46,20 +64,83 @@ def get_documents():
     }
 
 @app.get("/documents/{id}")
-def get_document_by_id(id: str):
-    response = supabase.table("documents").select("*").eq("id", id).execute()
-    if not response.data:
+def get_document_by_id(id: str, response: Response):
+    document = supabase.table("documents").select("*").eq("id", id).execute()
+    if not document.data:
         raise HTTPException(status_code=404, detail="Document not found")
+    # Clients send the version back in If-Match when patching
+    response.headers["ETag"] = f'"{document.data[0].get("version", 1)}"'
     return {
         "status": "success",
         "message": "Document fetched successfully",
-        "data": response.data[0]
+        "data": document.data[0]
+    }
+
+@app.patch("/documents/{id}")
+def patch_document(id: str, response: Response, operations: list = Body(...), if_match: str = Header(None)):
+    """Applies RFC 6902 operations to the document's data, guarded by its version."""
+    if if_match is None:
+        raise HTTPException(status_code=428, detail="If-Match header with the document version is required")
+    try:
+        expected_version = int(if_match.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match must be the document version")
+
+    current = supabase.table("documents").select("data, version, file_name").eq("id", id).execute()
+    if not current.data:
+        raise HTTPException(status_code=404, detail="Document not found")
+    version = current.data[0].get("version", 1)
+    if version != expected_version:
+        raise HTTPException(status_code=412, detail=f"Document has changed, current version is {version}")
+
+    try:
+        patched = apply_patch(current.data[0]["data"] or {}, operations)
+    except JsonPatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    # Round-trip through the model so the stored tree stays valid and normalized
+    try:
+        paper = parse_paper(patched)
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=f"Patched document is not a valid question tree: {e}")
+    data = paper.to_dict()
+    dropped = dropped_paths(operations, patched, data)
+    if dropped:
+        raise HTTPException(status_code=422, detail=f"Fields not supported by the question tree: {', '.join(dropped)}")
+
+    # Compare-and-set on the version so concurrent editors cannot overwrite each other
+    updated = supabase.table("documents").update({"data": data, "version": version + 1, "status": "edited"}) \
+        .eq("id", id).eq("version", version).execute()
+    if not updated.data:
+        raise HTTPException(status_code=412, detail="Document was modified concurrently, reload and retry")
+
+    supabase.table("document_edits").insert({"document_id": id, "version": version + 1, "operations": operations}).execute()
+    drop_warmed(id)
+    index_document(id, current.data[0].get("file_name"), paper)
+    fingerprint_document(id, paper)
+
+    response.headers["ETag"] = f'"{version + 1}"'
+    return {
+        "status": "success",
+        "message": "Document updated successfully",
+        "data": {"version": version + 1}
+    }
+
+@app.get("/documents/{id}/duplicates")
+def get_document_duplicates(id: str):
+    """Near-duplicates of this document's main questions in other documents."""
+    return {
+        "status": "success",
+        "message": "Duplicates fetched successfully",
+        "data": {"duplicates": get_dedup_index().document_duplicates(id)}
     }
 
 @app.delete("/documents/{id}")
 def delete_document(id: str = Path(...)):
     response = supabase.table("documents").delete().eq("id", id).execute()
-    if response.status_code == 204:  # No content means successful deletion
+    drop_warmed(id)
+    remove_document(id)
+    remove_fingerprints(id)
+    if response.data:  # Deleted rows are returned; none means nothing matched
         return {
             "status": "success",
             "message": "Document deleted successfully."
@@ -67,115 +148,214 @@ def delete_document(id: str = Path(...)):
     else:
         raise HTTPException(status_code=404, detail="Document not found")
 
+@app.get("/questions/search")
+def search_questions(q: str, limit: int = SEARCH_LIMIT, document_id: str = None):
+    """Full-text search over the questions of every extracted document."""
+    results = get_question_index().search(q, limit=limit, document_id=document_id)
+    return {
+        "status": "success",
+        "message": "Questions fetched successfully",
+        "data": {"questions": results}
+    }
+
+@app.get("/questions/duplicates")
+def get_duplicate_questions():
+    """Groups of near-duplicate main questions across all documents."""
+    return {
+        "status": "success",
+        "message": "Duplicate questions fetched successfully",
+        "data": {"groups": get_dedup_index().clusters()}
+    }
+
+@app.post("/questions/reindex")
+def reindex_questions():
+    """Rebuilds the question and dedup indexes from every extracted document, e.g. after upgrading."""
+    response = supabase.table("documents").select("id, file_name, data").execute()
+    documents = [document for document in response.data if document.get("data")]
+    for document in documents:
+        paper = parse_paper(document["data"])
+        index_document(document["id"], document.get("file_name"), paper)
+        fingerprint_document(document["id"], paper)
+    return {
+        "status": "success",
+        "message": "Question index rebuilt",
+        "data": {"documents": len(documents), "questions": get_question_index().count()}
+    }
+
 @app.post("/extract_questions")
-async def analyse_pdf(background_tasks: BackgroundTasks, pdf_file: UploadFile = File(...)):
+async def analyse_pdf(request: Request, pdf_file: UploadFile = File(...), x_client_id: str = Header(None)):
+    ticket = None
     try:
         if not pdf_file.filename.endswith(".pdf"):
             raise HTTPException(status_code=400, detail="Input PDF file must end with .pdf")
 
-        user_pdf_content = await pdf_file.read()
-        # rasterized_pdf = get_rasterized_pdf(user_pdf_content)
-        # pdf = convert_pdf_to_part(user_pdf_content)
-    
-        # return extract_data2(user_pdf_content)
-    
-        unique_id = datetime.now().strftime("%Y%m%d%H%M%S") + '_' + pdf_file.filename.lower().replace(" ", "_")
-        supabase.storage.from_("files").upload(unique_id, user_pdf_content)
-        download_link = supabase.storage.from_("files").get_public_url(unique_id)
+        # Refuse before reading and storing the upload when it cannot be processed soon
+        queue = get_extraction_queue()
+        try:
+            ticket = queue.reserve(client_key(request.client.host, x_client_id))
+        except AdmissionError as e:
+            raise HTTPException(status_code=429, headers={"Retry-After": str(e.retry_after)},
+                                detail={"status": "error", "message": str(e), "reason": e.reason, "data": None})
 
-        # insert document and get the inserted record's ID
-        insert_response = supabase.table("documents").insert({"file_name": pdf_file.filename, "file_url": download_link}).execute()
-        document_id = insert_response.data[0]['id']
+        with span("ingest", file_name=pdf_file.filename) as ingest_span:
+            user_pdf_content = await pdf_file.read()
+            # One scan of the PDF, stored with the document for the later stages
+            with span("probe", size_bytes=len(user_pdf_content)):
+                probe = await run_in_threadpool(probe_pdf, user_pdf_content)
+            # rasterized_pdf = get_rasterized_pdf(user_pdf_content)
+            # pdf = convert_pdf_to_part(user_pdf_content)
+        
+            # return extract_data2(user_pdf_content)
+        
+            unique_id = datetime.now().strftime("%Y%m%d%H%M%S") + '_' + pdf_file.filename.lower().replace(" ", "_")
+            with span("storage.upload", bucket="files", size_bytes=len(user_pdf_content)):
+                supabase.storage.from_("files").upload(unique_id, user_pdf_content)
+            download_link = supabase.storage.from_("files").get_public_url(unique_id)
 
-        background_tasks.add_task(extract_data, user_pdf_content, document_id)
+            # insert document and get the inserted record's ID
+            with span("db.insert"):
+                insert_response = supabase.table("documents").insert({"file_name": pdf_file.filename, "file_url": download_link, "probe": probe.to_dict()}).execute()
+            document_id = insert_response.data[0]['id']
+            ingest_span.set(document_id=document_id, pages=probe.page_count)
+
+        # Cheap papers go first (shortest job first, with aging)
+        position = queue.submit(ticket, extract_data, user_pdf_content, document_id, pdf_file.filename, probe,
+                                cost=estimate_cost(probe))
         return {
             "status": "success", 
             "message": "File uploaded successfully. Please wait while it being processed.", 
-            "data": { "document_id": document_id, "file_url": download_link }
+            "data": { "document_id": document_id, "file_url": download_link, "queue_position": position }
         }
+    except HTTPException:
+        raise
     except Exception as e:
+        if ticket is not None:
+            queue.cancel(ticket)
         raise HTTPException(status_code=500, detail={"status": "error", "message": str(e), "data": None})
 
-def extract_data(pdf, document_id):
-    start_time = time.time()  # Capture the start time
-    full_json = {}
-    combined_main_questions = []  # Initialize a list to hold combined questions
+def extract_data(pdf, document_id, file_name=None, probe=None):
+    # The ML stack (ultralytics, torch, cv2, pdf2image) and the Gemini client are
+    # only needed here, so they are imported lazily to keep API workers light.
+    import cv2
+    from modules.crop_img import get_images, update_json_with_url
+    from config.ai_client import get_ai_response, model_label
+    from modules.pdf_text import prepare_request
+    from modules.pdf_optimize import get_model_pdf
+
+    with span("extract", document_id=document_id, file_name=file_name) as extract_span:
+        start_time = time.time()  # Capture the start time
+        combined_main_questions = []  # Initialize a list to hold combined questions
+        usage = DocumentUsage(model_label())
 
-    ranges = [(1, 4), (5, 8), (9, 11)]
-    for start, end in ranges:
-        attempts = 0
-        max_attempts = 5
-        success = False
+        if probe is None:
+            probe = probe_pdf(pdf)
+        # Split at the main question anchors found by the probe, or the default ranges
+        ranges = plan_ranges(probe)
+        print(f"Planned ranges: {ranges}")
+        # Slimmed copy for the model; cropping below keeps using the original
+        with span("model_pdf"):
+            model_pdf = get_model_pdf(pdf, probe)
+        for start, end in ranges:
+            attempts = 0
+            max_attempts = 5
+            success = False
+            
+            with span("llm.range", range=f"{start}-{end}") as range_span:
+                while attempts < max_attempts and not success:
+                    attempts += 1
+                    print(f"Attempt {attempts}: Extracting questions for {start} to {end}")
+                    
+                    try:
+                        with span("llm.attempt", attempt=attempts) as attempt_span:
+                            # Whole PDF, or the range's text layer in EXTRACTION_MODE=text
+                            request_pdf, page_text = prepare_request(model_pdf, probe, start, end)
+                            request_start = time.perf_counter()
+                            response = get_ai_response(request_pdf, start, end, page_text)
+                            usage.record(f"{start}-{end}", time.perf_counter() - request_start, response.usage_metadata)
+                            attempt_span.set(input_tokens=response.usage_metadata.prompt_token_count,
+                                             output_tokens=response.usage_metadata.candidates_token_count)
+                            response_json = json.loads(response.text)
+                        
+                        if "main_questions" in response_json:
+                            combined_main_questions.extend(response_json["main_questions"])
+                        
+                        print(f"Questions extracted successfully for {start} to {end}")
+                        success = True
+                    except Exception as e:
+                        print(f"Error extracting questions for {start} to {end} (Attempt {attempts}): {str(e)}")
+                        LLM_RETRIES.labels(retry_cause(e)).inc()
+                        if attempts == max_attempts:
+                            print(f"Failed to extract questions for {start} to {end} after {max_attempts} attempts")
+                            print(response.text)
+                            supabase.table("documents").update({"status": "failed", "usage": usage.to_dict()}).eq("id", document_id).execute()
+                            DOCUMENTS.labels("failed").inc()
+                            raise HTTPException(status_code=500, 
+                                detail=f"Failed to extract questions for range {start}-{end} after {max_attempts} attempts")
+                range_span.set(attempts=attempts)
         
-        while attempts < max_attempts and not success:
-            attempts += 1
-            print(f"Attempt {attempts}: Extracting questions for {start} to {end}")
+        # Parse and normalize the combined LLM output once; later stages use the typed tree
+        paper = parse_paper({"main_questions": combined_main_questions})
+
+        # Call the cropping function and get cropped images
+        with span("crop"):
+            cropped_images = get_images(pdf, paper, probe)
+
+        for cropped_image, expected_num, expected_type, page_num in cropped_images:
+            # Validate image
+            if cropped_image is None or cropped_image.size == 0:
+                print(f"Invalid image data for page {page_num} - skipping")
+                continue
             
             try:
-                response = get_ai_response(pdf, start, end)
-                response_json = json.loads(response.text)
-                
-                if "main_questions" in response_json:
-                    combined_main_questions.extend(response_json["main_questions"])
-                
-                print(f"Questions extracted successfully for {start} to {end}")
-                success = True
+                h, w = cropped_image.shape[:2]
+                if h == 0 or w == 0:
+                    print(f"Empty image dimensions for page {page_num} - skipping")
+                    continue
             except Exception as e:
-                print(f"Error extracting questions for {start} to {end} (Attempt {attempts}): {str(e)}")
-                if attempts == max_attempts:
-                    print(f"Failed to extract questions for {start} to {end} after {max_attempts} attempts")
-                    print(response.text)
-                    supabase.table("documents").update({"status": "failed"}).eq("id", document_id).execute()
-                    raise HTTPException(status_code=500, 
-                        detail=f"Failed to extract questions for range {start}-{end} after {max_attempts} attempts")
-    
-    full_json["main_questions"] = combined_main_questions
-
-    # Call the cropping function and get cropped images
-    cropped_images = get_images(pdf, full_json)
+                print(f"Invalid image format for page {page_num}: {str(e)} - skipping")
+                continue
 
-    for cropped_image, expected_num, expected_type, page_num in cropped_images:
-        # Validate image
-        if cropped_image is None or cropped_image.size == 0:
-            print(f"Invalid image data for page {page_num} - skipping")
-            continue
-        
-        try:
-            h, w = cropped_image.shape[:2]
-            if h == 0 or w == 0:
-                print(f"Empty image dimensions for page {page_num} - skipping")
+            # Encode image
+            with span("encode", page=page_num):
+                success, buffer = cv2.imencode('.jpg', cropped_image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            if not success or buffer.size == 0:
+                print(f"Failed to encode image for page {page_num} - skipping")
                 continue
-        except Exception as e:
-            print(f"Invalid image format for page {page_num}: {str(e)} - skipping")
-            continue
-
-        # Encode image
-        success, buffer = cv2.imencode('.jpg', cropped_image, [cv2.IMWRITE_JPEG_QUALITY, 90])
-        if not success or buffer.size == 0:
-            print(f"Failed to encode image for page {page_num} - skipping")
-            continue
-
-        # Create safe filename
-        file_name = f"page_{page_num}_{expected_type}_{expected_num}.jpg"
-        file_name = re.sub(r'[^\w\-_. ]', '_', file_name)
-        
-        # Save image
-        try:
-            supabase.storage.from_("img").upload(f"{document_id}/{file_name}", buffer.tobytes())
-            file_url = supabase.storage.from_("img").get_public_url(f"{document_id}/{file_name}")
-            update_json_with_url(full_json, page_num, expected_type, expected_num, file_url)
+
+            # Create safe filename
+            image_name = f"page_{page_num}_{expected_type}_{expected_num}.jpg"
+            image_name = re.sub(r'[^\w\-_. ]', '_', image_name)
             
-            print(f"Successfully uploaded image. URL: {file_url}")
-        except Exception as e:
-            print(f"Failed to upload image {file_name}: {str(e)}")
-            continue
+            # Save image
+            try:
+                with span("image.upload", page=page_num, size_bytes=int(buffer.size)):
+                    supabase.storage.from_("img").upload(f"{document_id}/{image_name}", buffer.tobytes())
+                file_url = supabase.storage.from_("img").get_public_url(f"{document_id}/{image_name}")
+                # Warm the export cache while the bytes are still in memory
+                image_cache.put(file_url, buffer.tobytes())
+                update_json_with_url(paper, page_num, expected_type, expected_num, file_url)
+                
+                print(f"Successfully uploaded image. URL: {file_url}")
+            except Exception as e:
+                print(f"Failed to upload image {image_name}: {str(e)}")
+                continue
+                
             
-        
 
-    supabase.table("documents").update({"data": full_json, "status": "extracted"}).eq("id", document_id).execute()
-    end_time = time.time()  # Capture the end time
-    elapsed_time = end_time - start_time  # Calculate elapsed time
-    print(f"Total elapsed time: {elapsed_time} seconds")
+        full_json = paper.to_dict()
+        with span("db.update"):
+            supabase.table("documents").update({"data": full_json, "status": "extracted", "usage": usage.to_dict()}).eq("id", document_id).execute()
+        DOCUMENTS.labels("extracted").inc()
+        index_document(document_id, file_name, paper)
+        fingerprint_document(document_id, paper)
+        if os.getenv("WARM_DOCX_CACHE", "false").lower() == "true":
+            # Render now so the first export is served from the cache
+            try:
+                warm_cache(document_id, paper)
+            except Exception as e:
+                print(f"Failed to warm DOCX cache for document {document_id}: {e}")
+        extract_span.set(main_questions=len(paper.main_questions), images=len(cropped_images))
+        elapsed_time = time.time() - start_time
     return {
         "status": "success",
         "message": "Questions extracted successfully",
@@ -190,6 +370,78 @@ async def generate_word(request: Request):
     json_data = data.get('jsonData')  # Access jsonData
     filename = data.get('filename')  # Access filename
 
-    document_path = generate(json_data)  # Call generate and get the document path
-    
-    return FileResponse(document_path, media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document', filename=filename)
+    # Build off the event loop so one large export does not stall other requests
+    document = await run_in_threadpool(generate, parse_paper(json_data))
+
+    return StreamingResponse(
+        iter_file(document),
+        media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        headers={"Content-Disposition": content_disposition(filename or "document.docx")},
+    )
+
+@app.post("/documents/export")
+def export_documents(body: dict = Body(...)):
+    # A repeated id is exported once
+    ids = list(dict.fromkeys(str(id) for id in body.get("ids") or []))
+    export_format = body.get("format", "zip")
+    if not ids:
+        raise HTTPException(status_code=400, detail="No document ids provided")
+    if export_format not in ["zip", "docx"]:
+        raise HTTPException(status_code=400, detail="Export format must be zip or docx")
+
+    response = supabase.table("documents").select("id, file_name, data").in_("id", ids).execute()
+    documents_by_id = {str(document["id"]): document for document in response.data if document.get("data")}
+    # Keep the order the documents were requested in
+    documents = [documents_by_id[id] for id in ids if id in documents_by_id]
+    if not documents:
+        raise HTTPException(status_code=404, detail="No extracted documents found")
+    for document in documents:
+        document["paper"] = parse_paper(document["data"])
+
+    if export_format == "docx":
+        return StreamingResponse(
+            iter_file(merge_documents(documents)),
+            media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+            headers={"Content-Disposition": content_disposition(body.get("filename") or "documents.docx")},
+        )
+
+    return StreamingResponse(
+        stream_zip(documents),
+        media_type="application/zip",
+        headers={"Content-Disposition": content_disposition(body.get("filename") or "documents.zip")},
+    )
+
+@app.post("/exams/assemble")
+def assemble_exam(body: dict = Body(...)):
+    """Renders one DOCX from main questions picked out of several documents, renumbered in order."""
+    questions = body.get("questions") or []
+    try:
+        refs = [(question["document_id"], question["main_number"]) for question in questions]
+    except (TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Each question needs a document_id and main_number")
+    if not refs:
+        raise HTTPException(status_code=400, detail="No questions provided")
+
+    try:
+        paper = assemble_paper(refs)
+    except MissingQuestionsError as e:
+        raise HTTPException(status_code=404, detail={"message": "Questions not found", "questions": e.refs})
+
+    return StreamingResponse(
+        iter_file(generate(paper)),
+        media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        headers={"Content-Disposition": content_disposition(body.get("filename") or "exam.docx")},
+    )
+
+def iter_file(file, chunk_size=64 * 1024):
+    """Streams a file object in chunks and closes it once the response is sent."""
+    try:
+        while chunk := file.read(chunk_size):
+            yield chunk
+    finally:
+        file.close()
+
+def content_disposition(filename):
+    # RFC 6266 filename* so non-ASCII file names survive the header
+    return f"attachment; filename*=utf-8''{quote(filename)}"
+
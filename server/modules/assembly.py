@@ -0,0 +1,124 @@
+import re
+
+from modules.models import Paper, TextContent, AnswerSpace, RowContent, parse_main_question
+from modules.question_index import get_question_index
+
+# Builds a new paper from main questions picked out of several extracted papers.
+# Picked questions are renumbered 1..n: question and sub-question numbers
+# ("9(c)(i)") and diagram/table numbers tied to the main question ("9.2") follow
+# the new main question number. Figures numbered across the whole source paper
+# ("Table 1", "Rajah 2") are numbered again in order, per figure type, over the
+# assembled paper. The text that refers to figures ("Rajah 9.2", "table 1") is
+# changed through the same mapping as the figures.
+
+# Words that introduce a figure reference, and the figure type they refer to
+FIGURE_WORDS = {
+    "rajah": "diagram", "diagram": "diagram", "gambar rajah": "diagram",
+    "graf": "diagram", "graph": "diagram", "carta": "diagram", "chart": "diagram",
+    "jadual": "table", "table": "table",
+}
+
+class MissingQuestionsError(LookupError):
+    def __init__(self, refs):
+        super().__init__(f"Questions not found: {refs}")
+        self.refs = refs
+
+def renumber(number, old, new):
+    """Replaces the main question prefix of a number: renumber("9(c)(i)", "9", "2") == "2(c)(i)"."""
+    if number == old:
+        return new
+    if old and number.startswith(old) and not number[len(old)].isdigit():
+        return new + number[len(old):]
+    return number
+
+def _reference_pattern(numbers):
+    # Longest first so "9.1" is not matched as "9" followed by ".1"
+    numbers = sorted(numbers, key=len, reverse=True)
+    return re.compile(
+        r"\b(" + "|".join(re.escape(word) for word in FIGURE_WORDS) + r")(\s+)("
+        + "|".join(re.escape(number) for number in numbers) + r")(?!\d|\.\d)",
+        re.IGNORECASE,
+    )
+
+def _is_question_numbered(number, main_number):
+    """True for figure numbers tied to the main question: "9", "9.2", "9(a)"; False for "1" in question 9."""
+    return renumber(number, main_number, "") != number
+
+def renumber_main_question(main_q, new_number, figure_counts=None):
+    """
+    Returns a copy of main_q numbered new_number, with its figures and figure references
+    renumbered. figure_counts ({figure type: last number}) is shared across the questions
+    of an assembled paper to number paper-wide figures in order; without it they are kept.
+    """
+    main_q = parse_main_question(main_q.to_dict())
+    old_number = main_q.number
+
+    # (figure type, old number) -> new number, for figures and references alike
+    figure_numbers = {}
+    for figure in main_q.figures():
+        if not figure.number:
+            continue
+        key = (figure.type, figure.number)
+        if key not in figure_numbers:
+            if _is_question_numbered(figure.number, old_number):
+                figure_numbers[key] = renumber(figure.number, old_number, new_number)
+            elif figure_counts is not None:
+                figure_counts[figure.type] = figure_counts.get(figure.type, 0) + 1
+                figure_numbers[key] = str(figure_counts[figure.type])
+            else:
+                figure_numbers[key] = figure.number
+        figure.number = figure_numbers[key]
+    # References are matched case-insensitively ("TABLE 9", "diagram 10.1 (A)")
+    references = {(figure_type, number.lower()): new
+                  for (figure_type, number), new in figure_numbers.items() if number != new}
+    pattern = _reference_pattern({number for _, number in references}) if references else None
+
+    def replace(match):
+        new = references.get((FIGURE_WORDS[match.group(1).lower()], match.group(3).lower()))
+        if new is None:
+            return match.group(0)
+        return match.group(1) + match.group(2) + new
+
+    def fix(text):
+        if pattern is None or not text:
+            return text
+        return pattern.sub(replace, text)
+
+    def fix_content(content):
+        if isinstance(content, TextContent):
+            content.text.malay = fix(content.text.malay)
+            content.text.english = fix(content.text.english)
+        elif isinstance(content, AnswerSpace):
+            for option in content.options or []:
+                option.malay = fix(option.malay)
+                option.english = fix(option.english)
+        elif isinstance(content, RowContent):
+            for item in content.items:
+                fix_content(item)
+
+    for content_flow in main_q.content_flows():
+        for content in content_flow:
+            fix_content(content)
+
+    main_q.number = new_number
+    for question in main_q.questions:
+        question.number = renumber(question.number, old_number, new_number)
+        for sub_q in question.sub_questions or []:
+            sub_q.number = renumber(sub_q.number, old_number, new_number)
+    return main_q
+
+def assemble_paper(refs):
+    """
+    Resolves (document_id, main_number) refs through the question index and returns
+    a Paper of the picked main questions, renumbered in the order given. Raises
+    MissingQuestionsError when any ref is not indexed.
+    """
+    main_questions = get_question_index().get_main_questions(refs)
+    missing = [list(ref) for ref, main_q in zip(refs, main_questions) if main_q is None]
+    if missing:
+        raise MissingQuestionsError(missing)
+    figure_counts = {}
+    return Paper(main_questions=[
+        renumber_main_question(main_q, str(position), figure_counts)
+        for position, main_q in enumerate(main_questions, start=1)
+    ])
@@ -0,0 +1,143 @@
+import io
+import multiprocessing
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from modules.wordgen import generate, collect_image_urls, warm_images, stitch_fragments
+
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Documents rendered or waiting to be written at any time; bounds memory for large batches
+EXPORT_MAX_IN_FLIGHT = EXPORT_WORKERS * 2
+
+_export_pool = None
+
+def get_export_pool():
+    """Process pool shared by batch exports; python-docx rendering is CPU bound."""
+    global _export_pool
+    if _export_pool is None:
+        # spawn: forking the threaded API process is not safe
+        _export_pool = ProcessPoolExecutor(
+            max_workers=EXPORT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _export_pool
+
+def render_document(paper):
+    """Worker entry point: returns the rendered DOCX bytes."""
+    output = generate(paper)
+    try:
+        return output.read()
+    finally:
+        output.close()
+
+def prefetch_images(documents):
+    """
+    Downloads the images of every document into the shared disk cache once, so
+    the workers read them locally instead of each fetching its own copies.
+    """
+    urls = []
+    for document in documents:
+        urls.extend(collect_image_urls(document["paper"].main_questions))
+    warm_images(list(dict.fromkeys(urls)))
+
+def render_documents(documents, ordered=False):
+    """
+    Renders documents (dicts with "id", "file_name" and the parsed "paper") on the
+    export pool and yields (document, docx_bytes) in completion order, or in the
+    given order with ordered=True, keeping at most EXPORT_MAX_IN_FLIGHT documents
+    in memory.
+    """
+    pool = get_export_pool()
+    pending = iter(documents)
+    in_flight = {}  # Insertion order is submission order
+
+    def submit_next():
+        document = next(pending, None)
+        if document is not None:
+            in_flight[pool.submit(render_document, document["paper"])] = document
+
+    for _ in range(EXPORT_MAX_IN_FLIGHT):
+        submit_next()
+
+    while in_flight:
+        if ordered:
+            done = [next(iter(in_flight))]
+            wait(done)
+        else:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            document = in_flight.pop(future)
+            submit_next()
+            try:
+                yield document, future.result()
+            except Exception as e:
+                print(f"Failed to render document {document['id']}: {e}")
+                yield document, None
+
+class _ChunkStream(io.RawIOBase):
+    """Write-only, unseekable sink; zipfile falls back to data descriptors for it."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def docx_file_name(document, used_names):
+    base = re.sub(r'[^\w\-_. ]', '_', os.path.splitext(document.get("file_name") or str(document["id"]))[0])
+    name = f"{base}.docx"
+    counter = 1
+    while name in used_names:
+        counter += 1
+        name = f"{base} ({counter}).docx"
+    used_names.add(name)
+    return name
+
+def stream_zip(documents):
+    """Yields a ZIP archive of the rendered documents, one entry at a time as they complete."""
+    prefetch_images(documents)
+
+    stream = _ChunkStream()
+    used_names = set()
+    failed = []
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for document, content in render_documents(documents):
+            if content is None:
+                failed.append(document)
+                continue
+            archive.writestr(docx_file_name(document, used_names), content)
+            yield stream.drain()
+
+        if failed:
+            archive.writestr("errors.txt", "".join(
+                f"Failed to render {document.get('file_name')} ({document['id']})\n" for document in failed
+            ))
+    yield stream.drain()
+
+def merge_documents(documents):
+    """
+    Renders the documents and concatenates them, in the given order, into one DOCX.
+    Each rendering is appended as soon as it is its turn and then released, so only
+    the merged document and the in-flight renderings are held in memory.
+    """
+    prefetch_images(documents)
+
+    def rendered():
+        for document, content in render_documents(documents, ordered=True):
+            if content is None:
+                raise RuntimeError(f"Failed to render document {document['id']}")
+            yield content
+
+    return stitch_fragments(rendered())
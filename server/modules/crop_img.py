@@ -3,59 +3,34 @@ import cv2
 import torch
 import os
 import json
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_bytes, pdfinfo_from_bytes
 import numpy as np
 
-# Extract relevant pages from JSON
-def extract_relevant_pages(json_obj):
+from config.metrics import record_detection
+from config.tracing import span
+
+# Extract relevant pages from the question tree
+def extract_relevant_pages(paper):
     """
-    Extracts all unique pages containing diagrams/tables from the JSON.
+    Extracts all unique pages containing diagrams/tables from the Paper.
     """
-    relevant_pages = set()
-
-    def recurse(obj):
-        if isinstance(obj, list):
-            for item in obj:
-                recurse(item)
-        elif isinstance(obj, dict):
-            if "page" in obj and "number" in obj:
-                # Convert page to integer before adding to the set
-                try:
-                    relevant_pages.add(int(obj["page"]))
-                except ValueError:
-                    print(f"Warning: Page number '{obj['page']}' is not a valid integer.")
-            for key in ["content_flow", "questions", "subquestions", "items"]:
-                if key in obj and isinstance(obj[key], list):
-                    recurse(obj[key])
-
-    recurse(json_obj.get("main_questions", []))
+    # Pages are already parsed to integers by modules.models
+    relevant_pages = {figure.page for figure in paper.figures() if figure.page is not None and figure.number}
     return sorted(relevant_pages)  # Sort to process pages in order
 
 # Add this new function to get diagram/table numbers for a specific page
-def get_page_object_numbers(json_obj, page):
+def get_page_object_numbers(paper, page):
     """
     Returns a list of tuples (number, type) for all diagrams/tables on a specific page
-    sorted by their number.
+    in the order they appear in the Paper.
     """
     objects = []
-    
-    def recurse(obj):
-        if isinstance(obj, list):
-            for item in obj:
-                recurse(item)
-        elif isinstance(obj, dict):
-            if obj.get("page") == page and obj.get("type") in ["diagram", "table"]:
-                # Get the actual number from the object
-                number = obj.get("number")
-                if number:  # Only add if number exists
-                    objects.append((number, obj.get("type")))
-                else:
-                    print(f"Warning: Object on page {page} has no number.")
-            for key in ["content_flow", "questions", "subquestions", "items"]:
-                if key in obj and isinstance(obj[key], list):
-                    recurse(obj[key])
-    
-    recurse(json_obj.get("main_questions", []))
+    for figure in paper.figures():
+        if figure.page == page:
+            if figure.number:  # Only add if number exists
+                objects.append((figure.number, figure.type))
+            else:
+                print(f"Warning: Object on page {page} has no number.")
     
     # Debugging output
     if not objects:
@@ -92,76 +67,79 @@ def sort_boxes_by_position(boxes, y_threshold=50):
     # Flatten the rows
     return [box for row in rows for box in row]
 
-# Update JSON with the URL
-def update_json_with_url(json_obj, page, obj_type, detected_number, file_name):
+# Update the question tree with the URL
+def update_json_with_url(paper, page, obj_type, detected_number, file_name):
     """
-    Finds the correct diagram/table entry in json_data and updates it with the URL.
+    Finds the correct diagram/table entry in the Paper and updates it with the URL.
     """
-    def recurse(obj):
-        if isinstance(obj, list):
-            for item in obj:
-                recurse(item)
-        elif isinstance(obj, dict):
-            # Match by page number, type, and number
-            if (obj.get("page") == page and 
-                obj.get("type") == obj_type and 
-                obj.get("number") == detected_number):
-                obj["url"] = file_name
-                return
-            for key in ["content_flow", "questions", "subquestions", "items"]:
-                if key in obj and isinstance(obj[key], list):
-                    recurse(obj[key])
-
-    recurse(json_obj.get("main_questions", []))
-
-def get_images(pdf_file, json_data):
+    for figure in paper.figures():
+        # Match by page number, type, and number
+        if figure.page == page and figure.type == obj_type and figure.number == detected_number:
+            figure.url = file_name
+            return
+
+def get_images(pdf_file, paper, probe=None):
     print("Get images...")
     base_dir = os.path.dirname(os.path.abspath(__file__))
-    model = YOLO(os.path.join(base_dir, "..", "assets", "my_model.pt"))  # Change to your trained model path
+    with span("detect.load_model"):
+        model = YOLO(os.path.join(base_dir, "..", "assets", "my_model.pt"))  # Change to your trained model path
 
-    # Check if CUDA (GPU) is available, else use CPU
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    model.to(device)
+        # Check if CUDA (GPU) is available, else use CPU
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        model.to(device)
     
-    relevant_pages = extract_relevant_pages(json_data)
+    relevant_pages = extract_relevant_pages(paper)
     print('relevant pages:', relevant_pages)
 
-    # Convert the uploaded PDF file to images
-    pages = convert_from_bytes(pdf_file, dpi=300)  # Higher DPI for better quality
+    page_count = probe.page_count if probe is not None else pdfinfo_from_bytes(pdf_file)["Pages"]
 
     cropped_images = []  # List to hold cropped images and their metadata
+    detected_pages, detect_seconds = 0, 0.0
 
     for page_num in relevant_pages:
-        if page_num > len(pages):  # Skip if page number is out of bounds
+        if page_num > page_count:  # Skip if page number is out of bounds
             continue
 
-        # Convert PIL image to OpenCV format
-        image = cv2.cvtColor(np.array(pages[page_num - 1]), cv2.COLOR_RGB2BGR)
+        # Only render the pages that have diagrams/tables, one at a time
+        with span("render", page=page_num, dpi=300):
+            page = convert_from_bytes(pdf_file, dpi=300, first_page=page_num, last_page=page_num)[0]  # Higher DPI for better quality
+
+            # Convert PIL image to OpenCV format
+            image = cv2.cvtColor(np.array(page), cv2.COLOR_RGB2BGR)
 
         # Run YOLO inference
-        results = model(image, conf=0.5)  # Adjust confidence threshold if needed
-
-        detected_boxes = []
-        for result in results:
-            for i, box in enumerate(result.boxes.xyxy):
-                class_id = int(result.boxes.cls[i])
-                if model.names[class_id] in ['diagram', 'table']:
-                    x1, y1, x2, y2 = map(int, box)
-                    detected_boxes.append(((y1, x1), (x1, y1, x2, y2), model.names[class_id]))
-
-        detected_boxes = sort_boxes_by_position(detected_boxes)
-        page_objects = get_page_object_numbers(json_data, page_num)
-        
-        print(f"Processing Page: {page_num}, Detected: {len(detected_boxes)}, Expected: {len(page_objects)}")
-        for (expected_num, expected_type), (_, box, detected_type) in zip(page_objects, detected_boxes):
-            if detected_type != expected_type:
-                print(f"Warning: Type mismatch on page {page_num}: expected {expected_type}, detected {detected_type}")
-                continue
+        with span("detect", page=page_num) as detect_span:
+            results = model(image, conf=0.5)  # Adjust confidence threshold if needed
+
+            detected_boxes = []
+            for result in results:
+                for i, box in enumerate(result.boxes.xyxy):
+                    class_id = int(result.boxes.cls[i])
+                    if model.names[class_id] in ['diagram', 'table']:
+                        x1, y1, x2, y2 = map(int, box)
+                        detected_boxes.append(((y1, x1), (x1, y1, x2, y2), model.names[class_id]))
+            detect_span.set(boxes=len(detected_boxes))
+        detected_pages += 1
+        detect_seconds += detect_span.duration
+
+        with span("match", page=page_num) as match_span:
+            detected_boxes = sort_boxes_by_position(detected_boxes)
+            page_objects = get_page_object_numbers(paper, page_num)
             
-            x1, y1, x2, y2 = box
-            cropped_object = image[y1:y2, x1:x2]
-
-            # Store cropped image and its metadata
-            cropped_images.append((cropped_object, expected_num, expected_type, page_num))
-
+            print(f"Processing Page: {page_num}, Detected: {len(detected_boxes)}, Expected: {len(page_objects)}")
+            matched = 0
+            for (expected_num, expected_type), (_, box, detected_type) in zip(page_objects, detected_boxes):
+                if detected_type != expected_type:
+                    print(f"Warning: Type mismatch on page {page_num}: expected {expected_type}, detected {detected_type}")
+                    continue
+                
+                x1, y1, x2, y2 = box
+                cropped_object = image[y1:y2, x1:x2]
+
+                # Store cropped image and its metadata
+                cropped_images.append((cropped_object, expected_num, expected_type, page_num))
+                matched += 1
+            match_span.set(expected=len(page_objects), matched=matched)
+
+    record_detection(detected_pages, detect_seconds)
     return cropped_images  # Return the list of cropped images and their metadata
@@ -0,0 +1,282 @@
+import hashlib
+import io
+import os
+import re
+import sqlite3
+import threading
+import zlib
+
+import numpy as np
+
+from config.tracing import span
+from modules.disk_cache import CACHE_DIR, image_cache
+from modules.question_index import content_text
+
+# Near-duplicate detection for main questions. Each main question is turned into a
+# set of shingles (word 3-grams of its Malay and English text plus a perceptual hash
+# of each diagram), summarized as a MinHash signature and stored in an LSH index:
+# the signature is cut into bands and each band is hashed into a bucket, so a lookup
+# only compares against questions sharing at least one bucket.
+
+NUM_PERM = 128
+BANDS = 32  # 32 bands x 4 rows: pairs above ~0.5 Jaccard almost always share a bucket
+ROWS = NUM_PERM // BANDS
+SIMILARITY_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.6"))
+SHINGLE_WORDS = 3
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_permutations = np.random.default_rng(20240611).integers(1, _MERSENNE_PRIME, size=(2, NUM_PERM), dtype=np.uint64)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signatures (
+    document_id TEXT NOT NULL,
+    main_number TEXT NOT NULL,
+    signature BLOB NOT NULL,
+    PRIMARY KEY (document_id, main_number)
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    document_id TEXT NOT NULL,
+    main_number TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS buckets_lookup ON buckets (band, bucket);
+CREATE INDEX IF NOT EXISTS buckets_document ON buckets (document_id);
+"""
+
+def _words(text):
+    return re.findall(r"\w+", text.lower())
+
+def image_hash(image_bytes):
+    """64-bit difference hash of an image, stable across re-encoding and small rescales."""
+    from PIL import Image
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        pixels = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+def word_shingles(words):
+    """Returns the set of SHINGLE_WORDS-word windows of a word list."""
+    result = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    result.discard("")
+    return result
+
+def shingles(main_q, images=None):
+    """Returns the shingle set of a main question; images maps figure URL to bytes."""
+    words = []
+    for content_flow in main_q.content_flows():
+        malay, english = content_text(content_flow)
+        words.extend(_words(malay))
+        words.extend(_words(english))
+
+    result = word_shingles(words)
+    for figure in main_q.figures():
+        image = (images or {}).get(figure.url)
+        if image:
+            try:
+                result.add(f"image:{image_hash(image):016x}")
+            except Exception as e:
+                print(f"Failed to hash image {figure.url}: {e}")
+    return result
+
+def minhash(shingle_set):
+    """Returns the NUM_PERM MinHash signature (uint32) of a shingle set."""
+    if not shingle_set:
+        return None
+    values = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingle_set), dtype=np.uint64)
+    a, b = _permutations
+    # (a * x + b) stays below 2^63, so uint64 arithmetic does not overflow
+    hashed = (values[:, None] * a + b) % _MERSENNE_PRIME
+    return hashed.min(axis=0).astype(np.uint32)
+
+def band_buckets(signature):
+    """Yields (band, bucket) keys for the LSH index."""
+    for band in range(BANDS):
+        chunk = signature[band * ROWS:(band + 1) * ROWS].tobytes()
+        # Signed so it fits an SQLite INTEGER
+        yield band, int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), "little", signed=True)
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.count_nonzero(signature == other)) / NUM_PERM
+
+class DedupIndex:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _candidates(self, conn, signature):
+        keys = list(band_buckets(signature))
+        where = " OR ".join(["(band = ? AND bucket = ?)"] * len(keys))
+        params = [value for key in keys for value in key]
+        return conn.execute(
+            f"SELECT DISTINCT s.document_id, s.main_number, s.signature FROM buckets b "
+            f"JOIN signatures s ON s.document_id = b.document_id AND s.main_number = b.main_number "
+            f"WHERE {where}",
+            params,
+        ).fetchall()
+
+    def query(self, signature, threshold=SIMILARITY_THRESHOLD, exclude_document=None):
+        """Returns the indexed main questions similar to signature, most similar first."""
+        matches = []
+        for document_id, main_number, other in self._candidates(self._connection(), signature):
+            if document_id == exclude_document:
+                continue
+            score = similarity(signature, np.frombuffer(other, dtype=np.uint32))
+            if score >= threshold:
+                matches.append({"document_id": document_id, "main_number": main_number, "similarity": score})
+        matches.sort(key=lambda match: -match["similarity"])
+        return matches
+
+    def add_document(self, document_id, signatures):
+        """Replaces the signatures of one document; signatures maps main question number to signature."""
+        document_id = str(document_id)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM signatures WHERE document_id = ?", (document_id,))
+            conn.execute("DELETE FROM buckets WHERE document_id = ?", (document_id,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO signatures (document_id, main_number, signature) VALUES (?, ?, ?)",
+                [(document_id, number, signature.tobytes()) for number, signature in signatures.items()],
+            )
+            conn.executemany(
+                "INSERT INTO buckets (band, bucket, document_id, main_number) VALUES (?, ?, ?, ?)",
+                [(band, bucket, document_id, number)
+                 for number, signature in signatures.items()
+                 for band, bucket in band_buckets(signature)],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def remove_document(self, document_id):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM signatures WHERE document_id = ?", (str(document_id),))
+            conn.execute("DELETE FROM buckets WHERE document_id = ?", (str(document_id),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def document_duplicates(self, document_id, threshold=SIMILARITY_THRESHOLD):
+        """Returns {main_number: [matches in other documents]} for one indexed document."""
+        rows = self._connection().execute(
+            "SELECT main_number, signature FROM signatures WHERE document_id = ?", (str(document_id),)
+        ).fetchall()
+        duplicates = {}
+        for main_number, signature in rows:
+            matches = self.query(np.frombuffer(signature, dtype=np.uint32), threshold, exclude_document=str(document_id))
+            if matches:
+                duplicates[main_number] = matches
+        return duplicates
+
+    def clusters(self, threshold=SIMILARITY_THRESHOLD):
+        """Groups every indexed main question with its near-duplicates across documents."""
+        conn = self._connection()
+        signatures = {
+            (document_id, main_number): np.frombuffer(signature, dtype=np.uint32)
+            for document_id, main_number, signature in conn.execute(
+                "SELECT document_id, main_number, signature FROM signatures"
+            )
+        }
+        parent = {}
+
+        def find(key):
+            parent.setdefault(key, key)
+            while parent[key] != key:
+                parent[key] = parent[parent[key]]
+                key = parent[key]
+            return key
+
+        # Only questions sharing a bucket can be similar. Each member of a shared bucket
+        # is compared with the bucket's first member, which keeps this linear in the
+        # bucket size; pairs missed that way usually meet again in another band.
+        shared = conn.execute(
+            "SELECT b.band, b.bucket, b.document_id, b.main_number FROM buckets b JOIN ("
+            "SELECT band, bucket FROM buckets GROUP BY band, bucket HAVING COUNT(*) > 1"
+            ") s ON s.band = b.band AND s.bucket = b.bucket ORDER BY b.band, b.bucket"
+        )
+        current, first = None, None
+        for band, bucket, document_id, main_number in shared:
+            key = (document_id, main_number)
+            if (band, bucket) != current:
+                current, first = (band, bucket), key
+                continue
+            if find(key) != find(first) and similarity(signatures[key], signatures[first]) >= threshold:
+                parent[find(key)] = find(first)
+
+        groups = {}
+        for key in parent:
+            groups.setdefault(find(key), []).append({"document_id": key[0], "main_number": key[1]})
+        return [members for members in groups.values() if len(members) > 1]
+
+DEDUP_INDEX_PATH = os.getenv("DEDUP_INDEX_PATH", os.path.join(CACHE_DIR, "dedup.db"))
+
+_dedup_index = None
+_dedup_index_lock = threading.Lock()
+
+def get_dedup_index():
+    """Opens the shared index on first use, so importing this module touches no files."""
+    global _dedup_index
+    with _dedup_index_lock:
+        if _dedup_index is None:
+            _dedup_index = DedupIndex(DEDUP_INDEX_PATH)
+    return _dedup_index
+
+def paper_signatures(paper):
+    """MinHash signatures per main question; diagram images are read from the image cache."""
+    signatures = {}
+    for main_q in paper.main_questions:
+        images = {figure.url: image_cache.get(figure.url) for figure in main_q.figures() if figure.url}
+        signature = minhash(shingles(main_q, images))
+        if signature is not None:
+            signatures[main_q.number] = signature
+    return signatures
+
+def fingerprint_document(document_id, paper):
+    """
+    Indexes a document's main questions and returns their near-duplicates in other
+    documents ({main_number: [matches]}). Failures are logged, not raised, so they
+    never break extraction or editing.
+    """
+    try:
+        with span("fingerprint", document_id=document_id) as fingerprint_span:
+            index = get_dedup_index()
+            signatures = paper_signatures(paper)
+            duplicates = {}
+            for number, signature in signatures.items():
+                matches = index.query(signature, exclude_document=str(document_id))
+                if matches:
+                    duplicates[number] = matches
+            index.add_document(document_id, signatures)
+            fingerprint_span.set(main_questions=len(signatures), duplicates=len(duplicates))
+    except Exception as e:
+        print(f"Failed to fingerprint document {document_id}: {e}")
+        return {}
+
+    for number, matches in duplicates.items():
+        best = matches[0]
+        print(f"Main question {number} of document {document_id} is a near-duplicate of document "
+              f"{best['document_id']} question {best['main_number']} ({best['similarity']:.0%}, {len(matches)} matches)")
+    return duplicates
+
+def remove_fingerprints(document_id):
+    try:
+        get_dedup_index().remove_document(document_id)
+    except Exception as e:
+        print(f"Failed to remove document {document_id} from the dedup index: {e}")
@@ -0,0 +1,153 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+class DiskCache:
+    """
+    Size-bounded LRU cache of immutable blobs stored as files in a directory.
+
+    Entries are named by the SHA-256 of their key, and recency is tracked with the
+    file mtime, so several worker processes can share one directory. Writes are
+    atomic (temp file + rename), so readers never see partial entries.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None  # Approximate size, refreshed by a directory scan on eviction
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+        self.evictions = 0
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, key):
+        """Returns the cached bytes for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # Mark as most recently used
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self.bytes_served += len(data)
+        return data
+
+    def contains(self, key):
+        """True when key is cached; marks it as recently used without reading it."""
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            return False
+        return True
+
+    def put(self, key, data):
+        """Stores data under key and evicts least recently used entries when over budget."""
+        if len(data) > self.max_bytes:
+            return
+        self._write(key, lambda f: f.write(data))
+
+    def put_file(self, key, file):
+        """Like put, but copies from a file object without loading it into memory."""
+        self._write(key, lambda f: shutil.copyfileobj(file, f))
+
+    def _write(self, key, write):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+                size = f.tell()
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to write cache entry {key}: {e}")
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # Removed by another process
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        # Other processes write to the same directory, so re-scan before evicting
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)  # Leave some headroom to avoid evicting on every put
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                pass
+            total -= size
+        self._size = total
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "bytes_served": self.bytes_served,
+            "evictions": self.evictions,
+        }
+
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache"))
+
+# Cropped diagram/table images are immutable once uploaded, so they are keyed by URL
+image_cache = DiskCache(
+    os.path.join(CACHE_DIR, "images"),
+    int(os.getenv("IMAGE_CACHE_MAX_MB", "512")) * 1024 * 1024,
+)
+
+# Rendered exports, keyed by a hash of the normalized document plus wordgen.TEMPLATE_VERSION
+docx_cache = DiskCache(
+    os.path.join(CACHE_DIR, "docx"),
+    int(os.getenv("DOCX_CACHE_MAX_MB", "1024")) * 1024 * 1024,
+)
+
+# Model-facing copies of uploaded PDFs, keyed by content hash plus the optimization settings
+pdf_cache = DiskCache(
+    os.path.join(CACHE_DIR, "pdfs"),
+    int(os.getenv("PDF_CACHE_MAX_MB", "512")) * 1024 * 1024,
+)
@@ -0,0 +1,231 @@
+import itertools
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import psutil
+
+from config.metrics import EXTRACTION_IN_FLIGHT, EXTRACTION_QUEUED, UPLOADS_REJECTED
+from modules.pdf_probe import plan_ranges
+
+# Admission control for extraction jobs. Every job renders pages at 300 DPI and loads a
+# YOLO model, so only EXTRACTION_WORKERS run at a time and at most EXTRACTION_MAX_QUEUED
+# wait behind them. Uploads beyond that, from a client over its quota, or while the box
+# is short of memory are refused with a Retry-After estimate instead of being started.
+# Queued jobs start cheapest first by their estimated cost, aged by their wait.
+# The queue lives in the API process, so each uvicorn worker has its own.
+
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "1"))
+EXTRACTION_MAX_QUEUED = int(os.getenv("EXTRACTION_MAX_QUEUED", "20"))
+# Per client: jobs queued or running at once, and uploads per rolling hour
+EXTRACTION_CLIENT_MAX_JOBS = int(os.getenv("EXTRACTION_CLIENT_MAX_JOBS", "3"))
+EXTRACTION_CLIENT_HOURLY = int(os.getenv("EXTRACTION_CLIENT_HOURLY", "30"))
+# New jobs are refused while running ones leave less than this much memory available
+EXTRACTION_MIN_FREE_MB = int(os.getenv("EXTRACTION_MIN_FREE_MB", "1024"))
+# Assumed job duration until some jobs have completed, for Retry-After
+EXTRACTION_DEFAULT_SECONDS = float(os.getenv("EXTRACTION_DEFAULT_SECONDS", "90"))
+
+QUOTA_WINDOW_SECONDS = 3600
+
+# Quotas are per connection address. Only requests from these addresses (a reverse
+# proxy or gateway that authenticates callers) may name the client in X-Client-Id.
+TRUSTED_PROXIES = {host.strip() for host in os.getenv("TRUSTED_PROXIES", "").split(",") if host.strip()}
+
+def client_key(host, client_id=None):
+    """Identity the per-client quotas are kept under."""
+    if client_id and host in TRUSTED_PROXIES:
+        return f"id:{client_id}"
+    return host
+
+# sjf: cheapest estimated job first, with aging. fifo: submission order.
+EXTRACTION_SCHEDULER = os.getenv("EXTRACTION_SCHEDULER", "sjf")
+# Seconds of estimated cost a waiting job gains per second waited, so long papers still start
+EXTRACTION_AGING = float(os.getenv("EXTRACTION_AGING", "0.1"))
+
+# Cost model of one extraction from its probe: model requests per range, rendering and
+# detection per page, and scanned papers take longer (bigger PDFs, no text layer)
+COST_SECONDS_PER_RANGE = float(os.getenv("COST_SECONDS_PER_RANGE", "20"))
+COST_SECONDS_PER_PAGE = float(os.getenv("COST_SECONDS_PER_PAGE", "1.5"))
+COST_RASTERIZED_FACTOR = float(os.getenv("COST_RASTERIZED_FACTOR", "1.5"))
+
+def estimate_cost(probe):
+    """Estimated seconds to extract a document, from its PdfProbe."""
+    if probe is None:
+        return EXTRACTION_DEFAULT_SECONDS
+    seconds = len(plan_ranges(probe)) * COST_SECONDS_PER_RANGE + probe.page_count * COST_SECONDS_PER_PAGE
+    if probe.is_rasterized:
+        seconds *= COST_RASTERIZED_FACTOR
+    return seconds
+
+def job_priority(cost, waited, seq, scheduler=EXTRACTION_SCHEDULER, aging=EXTRACTION_AGING):
+    """Sort key of a queued job; the smallest starts next."""
+    if scheduler == "fifo":
+        return (seq,)
+    return (cost - aging * waited, seq)
+
+class AdmissionError(Exception):
+    """Raised when an upload is refused; retry_after is in seconds."""
+
+    def __init__(self, reason, message, retry_after):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = max(1, int(retry_after))
+
+class Ticket:
+    """A reserved queue slot, turned into a job by submit() or given back with cancel()."""
+
+    def __init__(self, client):
+        self.client = client
+        self.seq = None
+        self.cost = EXTRACTION_DEFAULT_SECONDS
+        self.function = None
+        self.args = ()
+        self.submitted = None
+
+class ExtractionQueue:
+    def __init__(self, workers=EXTRACTION_WORKERS, max_queued=EXTRACTION_MAX_QUEUED,
+                 client_max_jobs=EXTRACTION_CLIENT_MAX_JOBS, client_hourly=EXTRACTION_CLIENT_HOURLY,
+                 min_free_mb=EXTRACTION_MIN_FREE_MB):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.client_max_jobs = client_max_jobs
+        self.client_hourly = client_hourly
+        self.min_free_mb = min_free_mb
+        self._lock = threading.Condition()
+        self._queued = []
+        self._reserved = 0
+        self._running = 0
+        self._active = defaultdict(int)  # client -> reserved, queued or running jobs
+        self._uploads = defaultdict(deque)  # client -> admission times in the quota window
+        self._seq = itertools.count()
+        self._average_seconds = EXTRACTION_DEFAULT_SECONDS
+        self._threads = []
+
+    def _order_key(self, job, now):
+        return job_priority(job.cost, now - job.submitted, job.seq)
+
+    def _retry_after(self):
+        # Time until enough queued jobs have started to free a slot, at the observed rate
+        excess = len(self._queued) + self._reserved - self.max_queued + 1
+        return self._average_seconds * max(1, excess) / self.workers
+
+    def reserve(self, client):
+        """Admits one upload for client or raises AdmissionError."""
+        now = time.monotonic()
+        with self._lock:
+            uploads = self._uploads[client]
+            while uploads and uploads[0] <= now - QUOTA_WINDOW_SECONDS:
+                uploads.popleft()
+
+            if self._active[client] >= self.client_max_jobs:
+                reason, message = "client_jobs", f"At most {self.client_max_jobs} uploads per client can be processed at a time"
+                retry_after = self._average_seconds
+            elif len(uploads) >= self.client_hourly:
+                reason, message = "client_quota", f"At most {self.client_hourly} uploads per client per hour"
+                retry_after = uploads[0] + QUOTA_WINDOW_SECONDS - now
+            elif len(self._queued) + self._reserved >= self.max_queued:
+                reason, message = "queue_full", "Too many documents are waiting to be processed"
+                retry_after = self._retry_after()
+            elif self._running and psutil.virtual_memory().available < self.min_free_mb * 1024 * 1024:
+                reason, message = "memory", "The server is short of memory"
+                retry_after = self._average_seconds / self.workers
+            else:
+                uploads.append(now)
+                self._active[client] += 1
+                self._reserved += 1
+                return Ticket(client)
+
+        UPLOADS_REJECTED.labels(reason).inc()
+        raise AdmissionError(reason, message, retry_after)
+
+    def cancel(self, ticket):
+        """Gives back a reserved slot whose upload failed before submit()."""
+        with self._lock:
+            self._reserved -= 1
+            self._release(ticket.client)
+
+    def _release(self, client):
+        self._active[client] -= 1
+        if not self._active[client]:
+            del self._active[client]
+
+    def submit(self, ticket, function, *args, cost=None):
+        """
+        Queues function(*args) for the reserved slot with its estimated cost in seconds
+        (see estimate_cost) and returns its queue position (0 = starting now).
+        """
+        self._start_workers()
+        with self._lock:
+            ticket.seq = next(self._seq)
+            if cost is not None:
+                ticket.cost = cost
+            ticket.function = function
+            ticket.args = args
+            ticket.submitted = time.monotonic()
+            self._reserved -= 1
+            self._queued.append(ticket)
+            EXTRACTION_QUEUED.inc()
+            position = self._position(ticket)
+            self._lock.notify()
+        return position
+
+    def _position(self, ticket):
+        now = time.monotonic()
+        key = self._order_key(ticket, now)
+        ahead = sum(1 for job in self._queued if job is not ticket and self._order_key(job, now) < key)
+        idle = self.workers - self._running
+        # Jobs that idle workers are about to pick up are not waiting
+        return max(0, ahead + 1 - idle)
+
+    def stats(self):
+        with self._lock:
+            return {"running": self._running, "queued": len(self._queued), "workers": self.workers}
+
+    def _start_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"extraction-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _next_job(self):
+        with self._lock:
+            while not self._queued:
+                self._lock.wait()
+            now = time.monotonic()
+            job = min(self._queued, key=lambda job: self._order_key(job, now))
+            self._queued.remove(job)
+            self._running += 1
+            EXTRACTION_QUEUED.dec()
+            EXTRACTION_IN_FLIGHT.inc()
+            return job
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            start = time.monotonic()
+            try:
+                job.function(*job.args)
+            except Exception as e:
+                print(f"Extraction job failed: {e}")
+            finally:
+                elapsed = time.monotonic() - start
+                with self._lock:
+                    self._running -= 1
+                    self._release(job.client)
+                    # Moving average of job durations for Retry-After
+                    self._average_seconds = 0.8 * self._average_seconds + 0.2 * elapsed
+                EXTRACTION_IN_FLIGHT.dec()
+
+_extraction_queue = None
+_extraction_queue_lock = threading.Lock()
+
+def get_extraction_queue():
+    global _extraction_queue
+    with _extraction_queue_lock:
+        if _extraction_queue is None:
+            _extraction_queue = ExtractionQueue()
+    return _extraction_queue
@@ -0,0 +1,56 @@
+import io
+import math
+import os
+
+from PIL import Image
+
+# Resolution images are resampled to for their embedded width; 0 disables preparation
+DOCX_IMAGE_DPI = int(os.getenv("DOCX_IMAGE_DPI", "200"))
+
+JPEG_QUALITY = 85
+LINE_ART_COLORS = 16
+
+def is_line_art(image):
+    """
+    Exam diagrams are mostly dark strokes on white paper. Treat an image as line art
+    when nearly all of its pixels sit at the ends of the grey histogram.
+    """
+    histogram = image.convert("L").resize((256, 256), Image.NEAREST).histogram()
+    total = sum(histogram)
+    extremes = sum(histogram[:64]) + sum(histogram[192:])
+    return extremes / total > 0.9
+
+def prepare_image(image_bytes, width_inches, dpi=None):
+    """
+    Resamples a crop to the pixel width it is displayed at and re-encodes it:
+    palette PNG for line art, JPEG for photos. Returns the original bytes when
+    that would not make the image smaller.
+    """
+    dpi = DOCX_IMAGE_DPI if dpi is None else dpi
+    if not dpi:
+        return image_bytes
+
+    target_width = math.ceil(width_inches * dpi)
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        if image.width > target_width * 2:
+            # Let the JPEG decoder downscale by a power of two; BICUBIC finishes the job
+            image.draft("RGB", (target_width, round(image.height * target_width / image.width)))
+        image.load()
+    except Exception as e:
+        print(f"Failed to read image for preparation: {e}")
+        return image_bytes
+
+    if image.width > target_width:
+        target_height = max(1, round(image.height * target_width / image.width))
+        image = image.resize((target_width, target_height), Image.BICUBIC, reducing_gap=3.0)
+
+    output = io.BytesIO()
+    if is_line_art(image):
+        palette = image.convert("RGB").quantize(colors=LINE_ART_COLORS, method=Image.Quantize.FASTOCTREE)
+        palette.save(output, format="PNG")
+    else:
+        image.convert("RGB").save(output, format="JPEG", quality=JPEG_QUALITY, progressive=True)
+
+    prepared = output.getvalue()
+    return prepared if len(prepared) < len(image_bytes) else image_bytes
@@ -0,0 +1,130 @@
+import copy
+
+# Minimal RFC 6902 (JSON Patch) / RFC 6901 (JSON Pointer) implementation for
+# editing stored document trees without sending the whole tree back.
+
+class JsonPatchError(ValueError):
+    pass
+
+def parse_pointer(pointer):
+    if not isinstance(pointer, str):
+        raise JsonPatchError(f"Invalid JSON pointer: {pointer!r}")
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise JsonPatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+def _list_index(container, token, allow_end=False):
+    if allow_end and token == "-":
+        return len(container)
+    if not token.isdigit() or (token != "0" and token.startswith("0")):
+        raise JsonPatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchError(f"Array index out of range: {index}")
+    return index
+
+def _resolve(doc, tokens):
+    """Returns the value at tokens."""
+    value = doc
+    for token in tokens:
+        if isinstance(value, dict):
+            if token not in value:
+                raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+            value = value[token]
+        elif isinstance(value, list):
+            value = value[_list_index(value, token)]
+        else:
+            raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+    return value
+
+def _add(doc, tokens, value):
+    if not tokens:
+        return value
+    parent = _resolve(doc, tokens[:-1])
+    if isinstance(parent, dict):
+        parent[tokens[-1]] = value
+    elif isinstance(parent, list):
+        parent.insert(_list_index(parent, tokens[-1], allow_end=True), value)
+    else:
+        raise JsonPatchError(f"Cannot add to a scalar at /{'/'.join(tokens[:-1])}")
+    return doc
+
+def _remove(doc, tokens):
+    if not tokens:
+        raise JsonPatchError("Cannot remove the document root")
+    parent = _resolve(doc, tokens[:-1])
+    if isinstance(parent, dict):
+        if tokens[-1] not in parent:
+            raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+        return parent.pop(tokens[-1])
+    if isinstance(parent, list):
+        return parent.pop(_list_index(parent, tokens[-1]))
+    raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+
+def apply_patch(doc, operations):
+    """
+    Applies RFC 6902 operations to a copy of doc and returns it. The original is
+    left untouched when any operation fails.
+    """
+    if not isinstance(operations, list):
+        raise JsonPatchError("A JSON Patch must be an array of operations")
+
+    doc = copy.deepcopy(doc)
+    for operation in operations:
+        if not isinstance(operation, dict) or "op" not in operation or "path" not in operation:
+            raise JsonPatchError(f"Invalid operation: {operation!r}")
+        op = operation["op"]
+        tokens = parse_pointer(operation["path"])
+
+        if op in ["add", "replace", "test"] and "value" not in operation:
+            raise JsonPatchError(f"Operation {op} requires a value")
+        if op in ["move", "copy"] and "from" not in operation:
+            raise JsonPatchError(f"Operation {op} requires from")
+
+        if op == "add":
+            doc = _add(doc, tokens, copy.deepcopy(operation["value"]))
+        elif op == "remove":
+            _remove(doc, tokens)
+        elif op == "replace":
+            if tokens:
+                _resolve(doc, tokens)  # The target must exist
+                _remove(doc, tokens)
+            doc = _add(doc, tokens, copy.deepcopy(operation["value"]))
+        elif op in ["move", "copy"]:
+            from_tokens = parse_pointer(operation["from"])
+            if op == "move" and tokens[:len(from_tokens)] == from_tokens and tokens != from_tokens:
+                raise JsonPatchError("Cannot move a value into one of its children")
+            if op == "move":
+                value = _remove(doc, from_tokens)
+            else:
+                value = copy.deepcopy(_resolve(doc, from_tokens))
+            doc = _add(doc, tokens, value)
+        elif op == "test":
+            if _resolve(doc, tokens) != operation["value"]:
+                raise JsonPatchError(f"Test failed at {operation['path']}")
+        else:
+            raise JsonPatchError(f"Unknown operation: {op!r}")
+    return doc
+
+def dropped_paths(operations, patched, normalized):
+    """
+    Paths written by operations that hold a value in patched but are missing from
+    normalized, i.e. fields that did not survive normalization and would be lost.
+    """
+    dropped = []
+    for operation in operations:
+        if operation["op"] not in ["add", "replace", "move", "copy"]:
+            continue
+        tokens = parse_pointer(operation["path"])
+        try:
+            if _resolve(patched, tokens) is None:
+                continue
+        except JsonPatchError:
+            continue  # Removed again by a later operation
+        try:
+            _resolve(normalized, tokens)
+        except JsonPatchError:
+            dropped.append(operation["path"])
+    return dropped
@@ -0,0 +1,213 @@
+from dataclasses import dataclass, field
+
+# Typed, normalized form of the extracted question tree. The LLM output (or an
+# edited copy from the client) is parsed once with parse_paper; cropping and DOCX
+# generation then work on these objects, and to_dict gives back the JSON schema.
+
+@dataclass(slots=True)
+class Text:
+    malay: str = ""
+    english: str = ""
+
+    def to_dict(self):
+        return {"malay": self.malay, "english": self.english}
+
+@dataclass(slots=True)
+class TextContent:
+    text: Text
+    type: str = "text"
+
+    def to_dict(self):
+        return {"type": self.type, "text": self.text.to_dict()}
+
+@dataclass(slots=True)
+class FigureContent:
+    """A diagram or table cropped from the PDF."""
+    type: str
+    number: str
+    page: int | None = None
+    url: str | None = None
+
+    def to_dict(self):
+        data = {"type": self.type, "number": self.number}
+        if self.page is not None:
+            data["page"] = self.page
+        if self.url is not None:
+            data["url"] = self.url
+        return data
+
+@dataclass(slots=True)
+class AnswerSpace:
+    format: str
+    lines: int | None = None
+    options: list[Text] | None = None
+    type: str = "answer_space"
+
+    def to_dict(self):
+        data = {"type": self.type, "format": self.format}
+        if self.lines is not None:
+            data["lines"] = self.lines
+        if self.options is not None:
+            data["options"] = [option.to_dict() for option in self.options]
+        return data
+
+@dataclass(slots=True)
+class RowContent:
+    items: list = field(default_factory=list)
+    type: str = "row"
+
+    def to_dict(self):
+        return {"type": self.type, "items": [item.to_dict() for item in self.items]}
+
+@dataclass(slots=True)
+class OtherContent:
+    """Any content_flow element this model does not know about, kept verbatim."""
+    type: str
+    data: dict
+
+    def to_dict(self):
+        return self.data
+
+@dataclass(slots=True)
+class SubQuestion:
+    number: str
+    content_flow: list = field(default_factory=list)
+    marks: str | None = None
+
+    def to_dict(self):
+        data = {"number": self.number}
+        if self.marks is not None:
+            data["marks"] = self.marks
+        data["content_flow"] = [content.to_dict() for content in self.content_flow]
+        return data
+
+@dataclass(slots=True)
+class Question:
+    number: str
+    content_flow: list = field(default_factory=list)
+    marks: str | None = None
+    sub_questions: list[SubQuestion] | None = None  # None when the question has no sub-questions
+
+    def to_dict(self):
+        data = {"number": self.number}
+        if self.marks is not None:
+            data["marks"] = self.marks
+        data["content_flow"] = [content.to_dict() for content in self.content_flow]
+        if self.sub_questions is not None:
+            data["sub_questions"] = [sub_q.to_dict() for sub_q in self.sub_questions]
+        return data
+
+@dataclass(slots=True)
+class MainQuestion:
+    number: str
+    content_flow: list = field(default_factory=list)
+    questions: list[Question] = field(default_factory=list)
+
+    def to_dict(self):
+        return {
+            "number": self.number,
+            "content_flow": [content.to_dict() for content in self.content_flow],
+            "questions": [question.to_dict() for question in self.questions],
+        }
+
+    def content_flows(self):
+        """Yields every content_flow list of this main question, in document order."""
+        yield self.content_flow
+        for question in self.questions:
+            yield question.content_flow
+            for sub_q in question.sub_questions or []:
+                yield sub_q.content_flow
+
+    def figures(self):
+        """Yields every diagram/table, including those inside rows, in document order."""
+        for content_flow in self.content_flows():
+            for content in content_flow:
+                if isinstance(content, FigureContent):
+                    yield content
+                elif isinstance(content, RowContent):
+                    for item in content.items:
+                        if isinstance(item, FigureContent):
+                            yield item
+
+@dataclass(slots=True)
+class Paper:
+    main_questions: list[MainQuestion] = field(default_factory=list)
+
+    def to_dict(self):
+        return {"main_questions": [main_q.to_dict() for main_q in self.main_questions]}
+
+    def figures(self):
+        for main_q in self.main_questions:
+            yield from main_q.figures()
+
+def _str(value):
+    return "" if value is None else str(value)
+
+def _text(value):
+    # The model is asked to write line breaks as a literal \n
+    return _str(value).replace("\\n", "\n")
+
+def _int(value, name):
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        print(f"Warning: {name} '{value}' is not a valid integer.")
+        return None
+
+def parse_text(data):
+    data = data or {}
+    return Text(malay=_text(data.get("malay")), english=_text(data.get("english")))
+
+def parse_content(data):
+    content_type = data.get("type")
+    if content_type == "text":
+        return TextContent(text=parse_text(data.get("text")))
+    if content_type in ["diagram", "table"]:
+        return FigureContent(
+            type=content_type,
+            number=_str(data.get("number")),
+            page=_int(data.get("page"), "Page number"),
+            url=data.get("url"),
+        )
+    if content_type == "answer_space":
+        options = data.get("options")
+        return AnswerSpace(
+            format=_str(data.get("format")),
+            lines=_int(data.get("lines"), "Answer lines"),
+            options=[parse_text(option) for option in options] if options is not None else None,
+        )
+    if content_type == "row":
+        return RowContent(items=[parse_content(item) for item in data.get("items") or []])
+    return OtherContent(type=_str(content_type), data=data)
+
+def parse_content_flow(data):
+    return [parse_content(content) for content in data or [] if isinstance(content, dict)]
+
+def parse_sub_question(data):
+    return SubQuestion(
+        number=_str(data.get("number")),
+        content_flow=parse_content_flow(data.get("content_flow")),
+        marks=_str(data["marks"]) if data.get("marks") is not None else None,
+    )
+
+def parse_question(data):
+    sub_questions = data.get("sub_questions")
+    return Question(
+        number=_str(data.get("number")),
+        content_flow=parse_content_flow(data.get("content_flow")),
+        marks=_str(data["marks"]) if data.get("marks") is not None else None,
+        sub_questions=[parse_sub_question(sub_q) for sub_q in sub_questions] if sub_questions is not None else None,
+    )
+
+def parse_main_question(data):
+    return MainQuestion(
+        number=_str(data.get("number")),
+        content_flow=parse_content_flow(data.get("content_flow")),
+        questions=[parse_question(question) for question in data.get("questions") or []],
+    )
+
+def parse_paper(data):
+    """Parses and normalizes an extracted question tree (dict) into a Paper."""
+    return Paper(main_questions=[parse_main_question(main_q) for main_q in (data or {}).get("main_questions") or []])
@@ -0,0 +1,100 @@
+import hashlib
+import io
+import math
+import os
+
+import fitz
+from PIL import Image
+
+from modules.disk_cache import pdf_cache
+
+# The model reads the PDF three times per document (once per range), so it gets a
+# slimmed copy: embedded scans downsampled to MODEL_PDF_DPI, metadata, thumbnails and
+# attachments removed, unused objects collected and streams deflated. Page sizes are
+# left untouched, so page numbers and crop coordinates from the model still refer to
+# the original upload (cropping keeps using the original).
+
+MODEL_PDF_OPTIMIZE = os.getenv("MODEL_PDF_OPTIMIZE", "true").lower() == "true"
+MODEL_PDF_DPI = int(os.getenv("MODEL_PDF_DPI", "150"))
+MODEL_PDF_JPEG_QUALITY = int(os.getenv("MODEL_PDF_JPEG_QUALITY", "75"))
+
+def _page_rects(document):
+    return [(tuple(page.rect), tuple(page.mediabox), page.rotation) for page in document]
+
+def _effective_dpi(info):
+    x0, y0, x1, y1 = info["bbox"]
+    placed_inches = math.hypot(x1 - x0, y1 - y0) / 72
+    if placed_inches <= 0:
+        return 0
+    return math.hypot(info["width"], info["height"]) / placed_inches
+
+def downsample_images(document, dpi, quality):
+    """
+    Re-encodes images drawn at more than 1.3x dpi as JPEGs at dpi, in place. Returns
+    how many were replaced. Images with a soft mask (transparent diagrams) are kept.
+    """
+    seen = set()
+    replaced = 0
+    for page in document:
+        masked = {image[0] for image in page.get_images(full=True) if image[1]}
+        for info in page.get_image_info(xrefs=True):
+            xref = info["xref"]
+            if not xref or xref in seen or xref in masked:
+                continue
+            seen.add(xref)
+            effective_dpi = _effective_dpi(info)
+            # Images only slightly above the target are left alone, recompressing them gains little
+            if effective_dpi <= dpi * 1.3:
+                continue
+
+            pixmap = fitz.Pixmap(document, xref)
+            if pixmap.colorspace is None or pixmap.colorspace.n not in (1, 3) or pixmap.alpha:
+                pixmap = fitz.Pixmap(fitz.csRGB, pixmap, 0)
+            mode = "L" if pixmap.n == 1 else "RGB"
+            image = Image.frombytes(mode, (pixmap.width, pixmap.height), pixmap.samples)
+            scale = dpi / effective_dpi
+            image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, format="JPEG", quality=quality, optimize=True)
+            page.replace_image(xref, stream=output.getvalue())
+            replaced += 1
+    return replaced
+
+def optimize_pdf(pdf_content, dpi=MODEL_PDF_DPI, quality=MODEL_PDF_JPEG_QUALITY):
+    """
+    Returns the model-facing copy of a PDF. Falls back to the original when the copy
+    would be larger or its page geometry differs.
+    """
+    with fitz.open(stream=pdf_content, filetype="pdf") as document:
+        geometry = _page_rects(document)
+        downsample_images(document, dpi, quality)
+        # Hidden text is kept: OCR layers of scanned papers are invisible text
+        document.scrub(hidden_text=False, redactions=False, reset_fields=False, reset_responses=False)
+        optimized = document.tobytes(garbage=4, deflate=True, deflate_images=True, deflate_fonts=True, clean=True)
+
+    with fitz.open(stream=optimized, filetype="pdf") as document:
+        if _page_rects(document) != geometry:
+            print("Optimized PDF changed the page geometry, sending the original")
+            return pdf_content
+    if len(optimized) >= len(pdf_content):
+        return pdf_content
+    return optimized
+
+def get_model_pdf(pdf_content, probe=None):
+    """The optimized copy of pdf_content, cached per content hash and settings."""
+    if not MODEL_PDF_OPTIMIZE:
+        return pdf_content
+    content_hash = probe.content_hash if probe is not None else hashlib.sha256(pdf_content).hexdigest()
+    key = f"model_pdf:{MODEL_PDF_DPI}:{MODEL_PDF_JPEG_QUALITY}:{content_hash}"
+    cached = pdf_cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        optimized = optimize_pdf(pdf_content)
+    except Exception as e:
+        print(f"Failed to optimize PDF, sending the original: {e}")
+        return pdf_content
+    print(f"Optimized PDF for the model: {len(pdf_content)} -> {len(optimized)} bytes")
+    pdf_cache.put(key, optimized)
+    return optimized
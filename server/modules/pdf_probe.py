@@ -0,0 +1,157 @@
+import hashlib
+import os
+import re
+import statistics
+from dataclasses import dataclass, field
+
+import fitz
+
+# One pass over an uploaded PDF that records what later stages need to know about
+# it: page count and sizes, which pages have a text layer or images, where each
+# main question starts, and a content hash. It is stored with the document, so
+# range planning, rasterization and cropping do not reopen and rescan the bytes.
+
+PROBE_VERSION = 2
+
+# Main questions are numbered in bold at the left margin ("1", "2", ...)
+ANCHOR_PATTERN = re.compile(r"\d{1,2}")
+ANCHOR_MAX_X = 0.12  # Fraction of the page width
+ANCHOR_MIN_SIZE = 0.8  # Fraction of the median font size
+
+# Range planning: main questions per model request and the pages they may span
+RANGE_MAX_QUESTIONS = int(os.getenv("RANGE_MAX_QUESTIONS", "4"))
+RANGE_MAX_PAGES = int(os.getenv("RANGE_MAX_PAGES", "15"))
+DEFAULT_RANGES = [(1, 4), (5, 8), (9, 11)]
+
+@dataclass(slots=True)
+class PageInfo:
+    number: int  # 1-based, like the page numbers in the question tree
+    width: float
+    height: float
+    text_chars: int
+    image_count: int
+
+    @property
+    def has_text(self):
+        return self.text_chars > 0
+
+    def to_dict(self):
+        return {
+            "number": self.number,
+            "width": self.width,
+            "height": self.height,
+            "text_chars": self.text_chars,
+            "image_count": self.image_count,
+        }
+
+@dataclass(slots=True)
+class PdfProbe:
+    content_hash: str
+    size_bytes: int
+    page_count: int
+    pages: list[PageInfo] = field(default_factory=list)
+    anchors: list[tuple[int, int]] = field(default_factory=list)  # (main question number, page)
+    max_candidate: int = 0  # Highest anchor-like number seen, in the chain or not
+    version: int = PROBE_VERSION
+
+    @property
+    def is_rasterized(self):
+        """True when no page has a text layer and every page is an image (scanned papers)."""
+        return all(not page.has_text and page.image_count for page in self.pages)
+
+    def to_dict(self):
+        return {
+            "version": self.version,
+            "content_hash": self.content_hash,
+            "size_bytes": self.size_bytes,
+            "page_count": self.page_count,
+            "pages": [page.to_dict() for page in self.pages],
+            "anchors": [list(anchor) for anchor in self.anchors],
+            "max_candidate": self.max_candidate,
+        }
+
+def _anchor_candidates(page, page_number):
+    """Yields (number, page_number) for bold integers at the left margin of a page."""
+    spans = []
+    for block in page.get_text("dict")["blocks"]:
+        for line in block.get("lines", []):
+            spans.extend(line["spans"])
+    sizes = [span["size"] for span in spans if span["text"].strip()]
+    if not sizes:
+        return
+    min_size = statistics.median(sizes) * ANCHOR_MIN_SIZE
+    for span in spans:
+        text = span["text"].strip()
+        bold = span["flags"] & 16 or "bold" in span["font"].lower()
+        if (bold and ANCHOR_PATTERN.fullmatch(text) and span["size"] >= min_size
+                and span["bbox"][0] < page.rect.width * ANCHOR_MAX_X):
+            yield int(text), page_number
+
+def probe_pdf(pdf_content):
+    """Scans the PDF once and returns its PdfProbe."""
+    pages = []
+    anchors = []
+    max_candidate = 0
+    with fitz.open(stream=pdf_content, filetype="pdf") as document:
+        for page in document:
+            number = page.number + 1
+            text = page.get_text("text")
+            pages.append(PageInfo(
+                number=number,
+                width=page.rect.width,
+                height=page.rect.height,
+                text_chars=len(text.strip()),
+                image_count=len(page.get_images(full=False)),
+            ))
+            if text.strip():
+                for main_number, page_number in _anchor_candidates(page, number):
+                    max_candidate = max(max_candidate, main_number)
+                    # Main questions appear in order, which filters out stray bold numbers
+                    if main_number == (anchors[-1][0] if anchors else 0) + 1:
+                        anchors.append((main_number, page_number))
+
+    return PdfProbe(
+        content_hash=hashlib.sha256(pdf_content).hexdigest(),
+        size_bytes=len(pdf_content),
+        page_count=len(pages),
+        pages=pages,
+        anchors=anchors,
+        max_candidate=max_candidate,
+    )
+
+def plan_ranges(probe):
+    """
+    Splits the main questions into (start, end) ranges for the model requests, each
+    with at most RANGE_MAX_QUESTIONS questions spanning at most RANGE_MAX_PAGES pages
+    (a single longer question gets a range of its own). Falls back to DEFAULT_RANGES
+    when the PDF has no main question anchors, e.g. scanned papers.
+
+    When the anchor chain breaks (a heading was missed, so later ones were out of
+    order), the last range is extended to the highest number seen and, like a range
+    with no anchor after it, runs to the end of the paper.
+    """
+    if probe is None or not probe.anchors:
+        return DEFAULT_RANGES
+
+    spans = []
+    for index, (number, page) in enumerate(probe.anchors):
+        next_page = probe.anchors[index + 1][1] if index + 1 < len(probe.anchors) else probe.page_count + 1
+        spans.append((number, max(1, next_page - page)))
+
+    ranges = []
+    start, questions, pages = None, 0, 0
+    for number, span in spans:
+        if start is not None and (questions == RANGE_MAX_QUESTIONS or pages + span > RANGE_MAX_PAGES):
+            ranges.append((start, number - 1))
+            start, questions, pages = None, 0, 0
+        if start is None:
+            start = number
+        questions += 1
+        pages += span
+    last = spans[-1][0]
+    if probe.max_candidate > last:
+        print(f"Main question anchors stop at {last} but {probe.max_candidate} was seen; "
+              f"extending the last range to the end of the paper")
+        last = probe.max_candidate
+    ranges.append((start, last))
+    return ranges
@@ -0,0 +1,119 @@
+import os
+
+import fitz
+
+# Text-layer extraction mode. Born-digital papers already carry their text, fonts
+# and positions, so instead of the PDF the model is sent a compact serialization
+# of the pages of the requested range: one line per text line with its position,
+# **bold** runs marked, and placeholders where images sit. Pages without a text
+# layer (scanned pages) are still sent as PDF pages.
+
+# pdf: send the whole PDF (default). text: send the text layer of the range's pages.
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "pdf")
+
+PROMPT_HEADER = (
+    "The exam paper is given below as the text layer of its PDF pages instead of the PDF itself.\n"
+    "Each page starts with '=== Page N ===' (N is the PDF page number to use in \"page\").\n"
+    "Each line is '[x,y] text' with the line's top-left position in points; **text** is bold.\n"
+    "'[FIGURE x0,y0,x1,y1]' marks an image at that position (a diagram or table drawing; "
+    "its number is in the caption text below it).\n"
+)
+
+def range_pages(probe, start, end):
+    """
+    Pages that hold main questions start..end: from the page of start's anchor to the
+    page where the question after end begins. All pages when anchors are missing.
+    """
+    anchors = dict(probe.anchors)
+    if start not in anchors:
+        return list(range(1, probe.page_count + 1))
+    first = anchors[start]
+    last = anchors.get(end + 1, probe.page_count)
+    return list(range(first, max(first, last) + 1))
+
+# Lines whose tops are this close (points) are one visual line, e.g. justified words
+SAME_LINE_TOLERANCE = 2
+
+def _span_text(span):
+    text = span["text"]
+    bold = span["flags"] & 16 or "bold" in span["font"].lower()
+    if not bold or not text.strip():
+        return text
+    # Keep the surrounding spaces outside the markers so words do not run together
+    stripped = text.strip()
+    start = text.index(stripped)
+    return f"{text[:start]}**{stripped}**{text[start + len(stripped):]}"
+
+def serialize_page(page):
+    lines = []
+    for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+        for line in block.get("lines", []):
+            text = " ".join("".join(_span_text(span) for span in line["spans"]).split())
+            if text:
+                lines.append((line["bbox"][1], line["bbox"][0], text))
+
+    items = []
+    for y, x, text in sorted(lines):
+        if items and items[-1][0] != "figure" and abs(y - items[-1][1]) <= SAME_LINE_TOLERANCE:
+            items[-1][3].append((x, text))
+        else:
+            items.append(["text", y, x, [(x, text)]])
+    for image in page.get_image_info():
+        x0, y0, x1, y1 = (round(value) for value in image["bbox"])
+        items.append(["figure", y0, x0, f"[FIGURE {x0},{y0},{x1},{y1}]"])
+
+    output = [f"=== Page {page.number + 1} ==="]
+    for kind, y, x, content in sorted(items, key=lambda item: (item[1], item[2])):
+        if kind == "figure":
+            output.append(content)
+        else:
+            output.append(f"[{round(x)},{round(y)}] " + " ".join(text for _, text in sorted(content)))
+    return "\n".join(output)
+
+def serialize_pages(pdf_content, pages, scanned_pages=()):
+    """
+    Serializes the text layer of the given 1-based pages. Scanned pages only get a
+    pointer to their position in the attached PDF.
+    """
+    output = []
+    with fitz.open(stream=pdf_content, filetype="pdf") as document:
+        for number in pages:
+            if number in scanned_pages:
+                position = scanned_pages.index(number) + 1
+                output.append(f"=== Page {number} ===\n[SCANNED PAGE: see page {position} of the attached PDF]")
+            else:
+                output.append(serialize_page(document[number - 1]))
+    return "\n".join(output)
+
+def subset_pdf(pdf_content, pages):
+    """Returns a PDF with only the given 1-based pages."""
+    with fitz.open(stream=pdf_content, filetype="pdf") as document, fitz.open() as output:
+        for number in pages:
+            output.insert_pdf(document, from_page=number - 1, to_page=number - 1)
+        return output.tobytes(garbage=3, deflate=True)
+
+def prepare_request(pdf_content, probe, start, end, mode=None):
+    """
+    Returns (pdf, page_text) for one range request. In pdf mode that is the whole
+    PDF and no text. In text mode the text layer of the range's pages, plus a PDF
+    of just those pages that have no text layer (None when there are none).
+    """
+    mode = mode or EXTRACTION_MODE
+    if mode != "text" or probe is None or probe.is_rasterized:
+        return pdf_content, None
+
+    pages = range_pages(probe, start, end)
+    scanned_pages = [number for number in pages if not probe.pages[number - 1].has_text]
+    page_text = serialize_pages(pdf_content, pages, scanned_pages)
+    pdf = subset_pdf(pdf_content, scanned_pages) if scanned_pages else None
+    return pdf, page_text
+
+def request_parts(pdf, start, end, page_text=None):
+    """The paper-specific parts of a range request, as ("pdf", bytes) / ("text", str) pairs."""
+    if page_text is None:
+        return [("pdf", pdf), ("text", f"Extract **Main Questions {start} to {end}** for this PDF.")]
+    parts = [("text", PROMPT_HEADER + "\n" + page_text)]
+    if pdf is not None:
+        parts.append(("pdf", pdf))
+    parts.append(("text", f"Extract **Main Questions {start} to {end}** from these pages."))
+    return parts
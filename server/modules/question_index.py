@@ -0,0 +1,253 @@
+import json
+import os
+import sqlite3
+import threading
+
+from config.serialization import compress_json, decompress_json
+from config.tracing import span
+from modules.disk_cache import CACHE_DIR
+from modules.models import TextContent, FigureContent, AnswerSpace, RowContent, parse_main_question
+
+# Question bank: every main question, question and sub-question of every extracted
+# document, flattened into one SQLite table with an FTS5 index over the bilingual
+# text. It is derived data, rebuilt per document whenever that document changes.
+# Each main question subtree is also kept (compressed) so questions can be picked
+# from many papers without loading whole documents.
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# BM25 is computed for every match, which is too slow for words that appear in most
+# of the bank ("the", "rajah"). Only the newest RANK_WINDOW matches are ranked.
+RANK_WINDOW = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    rowid INTEGER PRIMARY KEY,
+    document_id TEXT NOT NULL,
+    file_name TEXT,
+    main_number TEXT NOT NULL,
+    question_number TEXT,
+    sub_number TEXT,
+    level TEXT NOT NULL,
+    marks TEXT,
+    malay TEXT NOT NULL,
+    english TEXT NOT NULL,
+    figures TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS questions_document ON questions (document_id);
+CREATE TABLE IF NOT EXISTS main_questions (
+    document_id TEXT NOT NULL,
+    main_number TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (document_id, main_number)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+    malay, english,
+    content='questions', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS questions_ai AFTER INSERT ON questions BEGIN
+    INSERT INTO questions_fts (rowid, malay, english) VALUES (new.rowid, new.malay, new.english);
+END;
+CREATE TRIGGER IF NOT EXISTS questions_ad AFTER DELETE ON questions BEGIN
+    INSERT INTO questions_fts (questions_fts, rowid, malay, english) VALUES ('delete', old.rowid, old.malay, old.english);
+END;
+"""
+
+def content_text(content_flow):
+    """Returns the (malay, english) text of a content_flow, including options and rows."""
+    malay, english = [], []
+
+    def add(content):
+        if isinstance(content, TextContent):
+            malay.append(content.text.malay)
+            english.append(content.text.english)
+        elif isinstance(content, AnswerSpace):
+            for option in content.options or []:
+                malay.append(option.malay)
+                english.append(option.english)
+        elif isinstance(content, RowContent):
+            for item in content.items:
+                add(item)
+
+    for content in content_flow:
+        add(content)
+    return "\n".join(filter(None, malay)), "\n".join(filter(None, english))
+
+def _figures(content_flow):
+    figures = []
+    for content in content_flow:
+        items = content.items if isinstance(content, RowContent) else [content]
+        for item in items:
+            if isinstance(item, FigureContent):
+                figures.append({"type": item.type, "number": item.number, "url": item.url})
+    return figures
+
+def flatten_paper(document_id, file_name, paper):
+    """Yields one index row per main question, question and sub-question of a Paper."""
+    for main_q in paper.main_questions:
+        malay, english = content_text(main_q.content_flow)
+        yield (str(document_id), file_name, main_q.number, None, None, "main_question", None,
+               malay, english, json.dumps(_figures(main_q.content_flow)))
+        for question in main_q.questions:
+            malay, english = content_text(question.content_flow)
+            yield (str(document_id), file_name, main_q.number, question.number, None, "question", question.marks,
+                   malay, english, json.dumps(_figures(question.content_flow)))
+            for sub_q in question.sub_questions or []:
+                malay, english = content_text(sub_q.content_flow)
+                yield (str(document_id), file_name, main_q.number, question.number, sub_q.number, "sub_question",
+                       sub_q.marks, malay, english, json.dumps(_figures(sub_q.content_flow)))
+
+def match_expression(query):
+    """
+    Turns free text into an FTS5 expression: every word must match, as a prefix
+    ("moment" finds "momentum"). Quoting each word keeps FTS5 syntax out of user input.
+    """
+    words = [word.replace('"', '""') for word in query.split()]
+    return " ".join(f'"{word}"*' for word in words if word)
+
+class QuestionIndex:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+
+    def _connection(self):
+        # One connection per thread: sync endpoints and background tasks share the index
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def index_document(self, document_id, file_name, paper):
+        """Replaces the indexed questions of one document. Returns the number of rows written."""
+        rows = list(flatten_paper(document_id, file_name, paper))
+        subtrees = [
+            (str(document_id), main_q.number, position, compress_json(main_q.to_dict()))
+            for position, main_q in enumerate(paper.main_questions)
+        ]
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM questions WHERE document_id = ?", (str(document_id),))
+            conn.execute("DELETE FROM main_questions WHERE document_id = ?", (str(document_id),))
+            conn.executemany(
+                "INSERT INTO questions (document_id, file_name, main_number, question_number, sub_number, "
+                "level, marks, malay, english, figures) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            # A repeated main question number keeps its first occurrence
+            conn.executemany(
+                "INSERT OR IGNORE INTO main_questions (document_id, main_number, position, data) VALUES (?, ?, ?, ?)",
+                subtrees,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def remove_document(self, document_id):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM questions WHERE document_id = ?", (str(document_id),))
+            conn.execute("DELETE FROM main_questions WHERE document_id = ?", (str(document_id),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def search(self, query, limit=SEARCH_LIMIT, document_id=None):
+        """Returns the best matching questions for query, ranked by BM25."""
+        expression = match_expression(query)
+        if not expression:
+            return []
+        conn = self._connection()
+
+        # Walking the rowid order of the matches is cheap, unlike ranking them
+        min_rowid = 0
+        if document_id is None:
+            cutoff = conn.execute(
+                "SELECT rowid FROM questions_fts WHERE questions_fts MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                (expression, RANK_WINDOW - 1),
+            ).fetchone()
+            if cutoff is not None:
+                min_rowid = cutoff[0]
+
+        sql = (
+            "SELECT q.document_id, q.file_name, q.main_number, q.question_number, q.sub_number, q.level, "
+            "q.marks, q.malay, q.english, q.figures, "
+            "snippet(questions_fts, -1, '[', ']', '...', 12) AS snippet, bm25(questions_fts) AS score "
+            "FROM questions_fts JOIN questions q ON q.rowid = questions_fts.rowid "
+            "WHERE questions_fts MATCH ? AND questions_fts.rowid >= ?"
+        )
+        params = [expression, min_rowid]
+        if document_id is not None:
+            sql += " AND q.document_id = ?"
+            params.append(str(document_id))
+        sql += " ORDER BY score LIMIT ?"
+        params.append(max(1, min(limit, MAX_SEARCH_LIMIT)))
+
+        results = []
+        for row in conn.execute(sql, params):
+            result = dict(row)
+            result["figures"] = json.loads(result["figures"])
+            results.append(result)
+        return results
+
+    def get_main_questions(self, refs):
+        """
+        Returns the MainQuestion for each (document_id, main_number) ref, in order,
+        with None for refs that are not indexed.
+        """
+        keys = [(str(document_id), str(main_number)) for document_id, main_number in refs]
+        found = {}
+        conn = self._connection()
+        # Stay well under SQLite's bound parameter limit
+        for start in range(0, len(keys), 400):
+            chunk = list(dict.fromkeys(keys[start:start + 400]))
+            where = " OR ".join(["(document_id = ? AND main_number = ?)"] * len(chunk))
+            for document_id, main_number, data in conn.execute(
+                f"SELECT document_id, main_number, data FROM main_questions WHERE {where}",
+                [value for key in chunk for value in key],
+            ):
+                found[(document_id, main_number)] = data
+        return [parse_main_question(decompress_json(found[key])) if key in found else None for key in keys]
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+
+QUESTION_INDEX_PATH = os.getenv("QUESTION_INDEX_PATH", os.path.join(CACHE_DIR, "questions.db"))
+
+_question_index = None
+_question_index_lock = threading.Lock()
+
+def get_question_index():
+    """Opens the shared index on first use, so importing this module touches no files."""
+    global _question_index
+    with _question_index_lock:
+        if _question_index is None:
+            _question_index = QuestionIndex(QUESTION_INDEX_PATH)
+    return _question_index
+
+def index_document(document_id, file_name, paper):
+    """Indexes a document without letting an index failure break the caller."""
+    try:
+        with span("index", document_id=document_id) as index_span:
+            count = get_question_index().index_document(document_id, file_name, paper)
+            index_span.set(questions=count)
+    except Exception as e:
+        print(f"Failed to index document {document_id}: {e}")
+
+def remove_document(document_id):
+    try:
+        get_question_index().remove_document(document_id)
+    except Exception as e:
+        print(f"Failed to remove document {document_id} from the question index: {e}")
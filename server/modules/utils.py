@@ -1,8 +1,13 @@
 import fitz
+import multiprocessing
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-def get_last_page(pdf_content: bytes) -> int:
+def get_last_page(pdf_content: bytes, probe=None) -> int:
     """Returns the last page number of a PDF."""
+    if probe is not None:
+        return probe.page_count
     doc = fitz.open(stream=pdf_content, filetype="pdf")  # Open PDF from bytes
     last_page = len(doc)  # Get total page count
     doc.close()
@@ -18,8 +23,10 @@ def get_reference_pdf() -> str:
     with open(reference_pdf_path, 'rb') as f:
         return f.read()
 
-def is_pdf_rasterized(pdf_content: bytes) -> bool:
+def is_pdf_rasterized(pdf_content: bytes, probe=None) -> bool:
     """Checks if a PDF byte stream is likely rasterized."""
+    if probe is not None:
+        return probe.is_rasterized
     try:
         pdf_document = fitz.open(stream=pdf_content, filetype="pdf")
         for page_num in range(pdf_document.page_count):
@@ -38,27 +45,96 @@ def is_pdf_rasterized(pdf_content: bytes) -> bool:
         print(f"Error processing PDF: {e}")
         return False
 
-def get_rasterized_pdf(pdf_content: bytes):
+# 72 matches the page size in points, as the original get_pixmap() call rendered
+RASTER_DPI = int(os.getenv("RASTER_DPI", "72"))
+RASTER_COLORSPACE = os.getenv("RASTER_COLORSPACE", "rgb")  # rgb or gray
+RASTER_FORMAT = os.getenv("RASTER_FORMAT", "png")  # png (lossless) or jpeg
+RASTER_WORKERS = int(os.getenv("RASTER_WORKERS", str(os.cpu_count() or 1)))
+
+COLORSPACES = {"rgb": fitz.csRGB, "gray": fitz.csGRAY}
+
+# Worker process state: the source PDF is opened once per worker, not once per page
+_raster_document = None
+
+def _open_raster_document(pdf_content):
+    global _raster_document
+    _raster_document = fitz.open(stream=pdf_content, filetype="pdf")
+
+def render_page(page_num, dpi, colorspace, image_format):
+    """Worker entry point: renders one page of the worker's PDF."""
+    return _render_page(_raster_document, page_num, dpi, colorspace, image_format)
+
+def _render_page(document, page_num, dpi, colorspace, image_format):
+    """Returns the page (width, height) in points and its image encoded as image_format."""
+    page = document.load_page(page_num)
+    pix = page.get_pixmap(dpi=dpi, colorspace=COLORSPACES[colorspace], alpha=False)
+    if image_format == "jpeg":
+        image = pix.tobytes("jpeg", jpg_quality=85)
+    else:
+        image = pix.tobytes("png")
+    return page.rect.width, page.rect.height, image
+
+def rasterize_pdf(pdf_content, dpi=None, colorspace=None, image_format=None, workers=None, max_in_flight=None, probe=None):
+    """
+    Renders every page to an image and returns a new PDF made of those images.
+
+    Pages are rendered on a process pool (one worker per core by default) and
+    added to the output in page order as they complete. At most max_in_flight
+    rendered pages (default 2 per worker) are held in memory at any time.
+    """
+    dpi = dpi or RASTER_DPI
+    colorspace = colorspace or RASTER_COLORSPACE
+    image_format = image_format or RASTER_FORMAT
+    workers = workers or RASTER_WORKERS
+    max_in_flight = max_in_flight or workers * 2
+    if colorspace not in COLORSPACES:
+        raise ValueError(f"Unsupported colorspace: {colorspace}")
+
+    page_count = get_last_page(pdf_content, probe)
+    if page_count == 0:
+        # Nothing to render, and a PDF without pages cannot be saved
+        return pdf_content
+    output = fitz.open()
+
+    def add_page(result):
+        width, height, image = result
+        # Keep the source page size so coordinates stay valid for later stages
+        page = output.new_page(width=width, height=height)
+        page.insert_image(page.rect, stream=image)
+
+    if workers == 1 or page_count == 1:
+        with fitz.open(stream=pdf_content, filetype="pdf") as document:
+            for page_num in range(page_count):
+                add_page(_render_page(document, page_num, dpi, colorspace, image_format))
+    else:
+        # spawn: forking the threaded API process is not safe
+        with ProcessPoolExecutor(
+            max_workers=min(workers, page_count),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_open_raster_document,
+            initargs=(pdf_content,),
+        ) as pool:
+            in_flight = deque()
+            next_page = 0
+            while next_page < page_count or in_flight:
+                while next_page < page_count and len(in_flight) < max_in_flight:
+                    in_flight.append(pool.submit(render_page, next_page, dpi, colorspace, image_format))
+                    next_page += 1
+                # Pages complete out of order but are written in order, so wait on the oldest
+                add_page(in_flight.popleft().result())
+
+    rasterized_pdf_bytes = output.tobytes(garbage=3, deflate=True)
+    output.close()
+    return rasterized_pdf_bytes
+
+def get_rasterized_pdf(pdf_content: bytes, dpi=None, colorspace=None, workers=None, probe=None):
     #First, check if pdf is rasterized. If rasterized, return the pdf.
-    if is_pdf_rasterized(pdf_content):
+    if is_pdf_rasterized(pdf_content, probe):
         print(f"PDF is already rasterized.")
         return pdf_content
     else:
         print(f"PDF is not rasterized. Rasterizing...")
         # If not rasterized, then rasterize the pdf.
-        pdf_document = fitz.open(stream=pdf_content, filetype="pdf")
-        rasterized_pdf_stream = fitz.open()  # Create a new PDF to hold rasterized pages
-        
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)  # Load each page
-            pix = page.get_pixmap()  # Render page to a pixmap (image)
-            rasterized_page = rasterized_pdf_stream.new_page(width=pix.width, height=pix.height)  # Create a new page in the rasterized PDF
-            rasterized_page.insert_image(rasterized_page.rect, pixmap=pix)  # Insert the image into the new page
-        
-        # Save the rasterized PDF to bytes
-        rasterized_pdf_bytes = rasterized_pdf_stream.write()
+        rasterized_pdf_bytes = rasterize_pdf(pdf_content, dpi=dpi, colorspace=colorspace, workers=workers, probe=probe)
         print(f"PDF rasterization complete.")
-        
-        rasterized_pdf_stream.close()
-        pdf_document.close()
-        return rasterized_pdf_bytes  # Return the rasterized PDF content
\ No newline at end of file
+        return rasterized_pdf_bytes  # Return the rasterized PDF content
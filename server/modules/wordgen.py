@@ -1,106 +1,214 @@
 import requests
 import io
+import os
+import copy
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from docx import Document
-from docx.shared import Inches, Cm, Twips
+from docx.shared import Inches, Cm, Twips, Emu
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+from docx.table import Table, _Cell
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.enum.table import WD_TABLE_ALIGNMENT, WD_ROW_HEIGHT
 import json
 
-def add_content_to_cell(cell, content, level):
+from modules.disk_cache import image_cache, docx_cache
+from config.tracing import span, bind
+from modules import image_prep
+from modules.image_prep import prepare_image
+from modules.models import Paper, TextContent, FigureContent, RowContent, AnswerSpace
+
+IMAGE_FETCH_WORKERS = 8
+IMAGE_FETCH_TIMEOUT = (3.05, 20)  # (connect, read) seconds
+IMAGE_FETCH_RETRIES = 3
+
+# Stale fragments are rendered concurrently; image preparation (PIL) releases the GIL
+RENDER_WORKERS = int(os.getenv("DOCX_RENDER_WORKERS", "4"))
+
+# Bump whenever the DOCX layout changes so cached renderings are not served
+TEMPLATE_VERSION = "2"
+
+# Renderings are cached by content hash (document_hash, fragment_hash), so edited data
+# is never served stale and nothing has to be invalidated. Renderings of deleted or
+# edited documents stay until LRU eviction, except the one warm_cache keeps a pointer to.
+
+# Rendered documents stay in memory up to this size, then spill to a per-request temp file
+DOCX_SPOOL_MAX_BYTES = 32 * 1024 * 1024
+
+_http_session = None
+
+def get_http_session():
+    """Returns a process-wide session with a connection pool sized for the prefetch workers."""
+    global _http_session
+    if _http_session is None:
+        retry = Retry(
+            total=IMAGE_FETCH_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=IMAGE_FETCH_WORKERS, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _http_session = session
+    return _http_session
+
+def collect_image_urls(main_questions):
+    """Returns the unique diagram/table image URLs of the main questions in document order."""
+    urls = []
+    for main_q in main_questions:
+        urls.extend(figure.url for figure in main_q.figures() if figure.url)
+    return list(dict.fromkeys(urls))
+
+def fetch_image(url):
+    """Downloads a single image over the shared session."""
+    response = get_http_session().get(url, timeout=IMAGE_FETCH_TIMEOUT)
+    response.raise_for_status()
+    return response.content
+
+def fetch_images(urls):
+    """
+    Downloads all images concurrently and returns a {url: bytes} map.
+    Failed downloads are left out so the caller falls back to a placeholder.
+    """
+    images = {}
+    if not urls:
+        return images
+
+    with ThreadPoolExecutor(max_workers=min(IMAGE_FETCH_WORKERS, len(urls))) as executor:
+        results = executor.map(bind(_try_fetch_image), urls)
+        for url, content in zip(urls, results):
+            if content is not None:
+                images[url] = content
+    return images
+
+def warm_images(urls):
+    """Downloads the images that are not in the image cache yet, without keeping their bytes."""
+    missing = [url for url in urls if not image_cache.contains(url)]
+    if not missing:
+        return
+    with ThreadPoolExecutor(max_workers=min(IMAGE_FETCH_WORKERS, len(missing))) as executor:
+        # Each result is dropped as soon as it is consumed; the bytes live on disk
+        for _ in executor.map(bind(_try_fetch_image), missing):
+            pass
+
+def _try_fetch_image(url):
+    cached = image_cache.get(url)
+    if cached is not None:
+        return cached
+    try:
+        with span("image.fetch", url=url):
+            content = fetch_image(url)
+    except Exception as e:
+        print(f"Failed to fetch image {url}: {e}")
+        return None
+    image_cache.put(url, content)
+    return content
+
+def get_prepared_image(url, image, width):
+    """
+    prepare_image, cached by URL and display width: crops never change once uploaded,
+    and renumbered or edited questions would otherwise prepare the same image again.
+    """
+    key = f"prepared:{image_prep.DOCX_IMAGE_DPI}:{image_prep.JPEG_QUALITY}:{image_prep.LINE_ART_COLORS}:{int(width)}:{url}"
+    prepared = image_cache.get(key)
+    if prepared is None:
+        prepared = prepare_image(image, width.inches)
+        image_cache.put(key, prepared)
+    return prepared
+
+def add_image_to_paragraph(paragraph, item, images, width):
+    """Adds the prefetched image for a diagram/table, or its placeholder text."""
+    image = images.get(item.url) if item.url else None
+    if image is None:
+        paragraph.text = f"[{item.type.upper()} {item.number}]"
+        return
+
+    run = paragraph.add_run()
+    try:
+        # Embed at the resolution it is displayed at rather than the 300-DPI crop
+        run.add_picture(io.BytesIO(get_prepared_image(item.url, image, width)), width=width)
+    except Exception as e:
+        paragraph.text = f"[{item.type.upper()} {item.number}]"
+        print(f"Failed to load image: {e}")
+
+def add_content_to_cell(cell, content, level, images=None):
     """Helper function to add content to a cell."""
-    # Return early if content is empty or not valid
-    if not content or not isinstance(content, dict):
-        return  # Exit the function if content is empty or not a dictionary
+    images = images or {}
+    # Return early if content is empty
+    if content is None:
+        return
 
-    if content["type"] == "text":
+    if isinstance(content, TextContent):
         # Add Malay text
-        malay_text = content["text"]["malay"]
+        malay_text = content.text.malay
         # Directly set the text of the first paragraph
         cell.paragraphs[0].text = malay_text  # Set Malay text in the first paragraph
         
         # Add English text in italics
-        english_text = content["text"]["english"]
+        english_text = content.text.english
         run = cell.paragraphs[0].add_run(f"\n{english_text}")  # Add English text in the same paragraph
         run.italic = True  # Set the run to italic
-    elif content["type"] == "row":
+    elif isinstance(content, RowContent):
         # Create a table within the cell for the row items
-        if "items" in content and len(content["items"]) > 0:
+        if len(content.items) > 0:
             # Clear any existing content
             cell.text = ""
             # Create a table with 1 row and columns equal to number of items
-            table = cell.add_table(rows=1, cols=len(content["items"]))
+            table = cell.add_table(rows=1, cols=len(content.items))
             # table.style = "Table Grid"
             table.alignment = WD_TABLE_ALIGNMENT.CENTER
 
             # Process each item in the row
-            for idx, item in enumerate(content["items"]):
-                if item["type"] in ["diagram", "table"]:
+            for idx, item in enumerate(content.items):
+                if isinstance(item, FigureContent):
                     cell = table.cell(0, idx)
                     cell.text = ""  # Clear any existing content
                     paragraph = cell.paragraphs[0]
                     paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
                     
-                    if "url" in item:
-                        run = paragraph.add_run()
-                        try:
-                            # Download image from URL
-                            response = requests.get(item["url"])
-                            image_stream = io.BytesIO(response.content)
-                            # Add the image from the stream with adjusted width
-                            width = Inches(6.0 / len(content["items"]))
-                            run.add_picture(image_stream, width=width)
-                        except Exception as e:
-                            paragraph.text = f"[{item['type'].upper()} {item['number']}]"
-                            print(f"Failed to load image: {e}")
-                    else:
-                        paragraph.text = f"[{item['type'].upper()} {item['number']}]"
+                    # Add the image with width adjusted to the number of columns
+                    add_image_to_paragraph(paragraph, item, images, Inches(6.0 / len(content.items)))
 
                     # Add caption below image
                     caption_para = cell.add_paragraph()
                     caption_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                    if item["type"] == "diagram":
-                        caption_para.text = f"Rajah {item['number']}"
-                        caption_run = caption_para.add_run(f"\nDiagram {item['number']}")
+                    if item.type == "diagram":
+                        caption_para.text = f"Rajah {item.number}"
+                        caption_run = caption_para.add_run(f"\nDiagram {item.number}")
                     else:  # table
-                        caption_para.text = f"Jadual {item['number']}"
-                        caption_run = caption_para.add_run(f"\nTable {item['number']}")
+                        caption_para.text = f"Jadual {item.number}"
+                        caption_run = caption_para.add_run(f"\nTable {item.number}")
                     caption_run.italic = True
         else:
             cell.text = "[ROW ITEM]"
             cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-    elif content["type"] in ["diagram", "table"]:
+    elif isinstance(content, FigureContent):
         # Clear existing content
         cell.text = ""
         paragraph = cell.paragraphs[0]
         paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
         
-        if "url" in content:
-            run = paragraph.add_run()
-            try:
-                # Download image from URL
-                response = requests.get(content["url"])
-                image_stream = io.BytesIO(response.content)
-                # Add the image from the stream
-                run.add_picture(image_stream, width=Inches(6))
-            except Exception as e:
-                paragraph.text = f"[{content['type'].upper()} {content['number']}]"
-                print(f"Failed to load image: {e}")
-        else:
-            paragraph.text = f"[{content['type'].upper()} {content['number']}]"
+        add_image_to_paragraph(paragraph, content, images, Inches(6))
 
         # Add caption below image
         caption_para = cell.add_paragraph()
         caption_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        if content["type"] == "diagram":
-            caption_para.text = f"Rajah {content['number']}"
-            caption_run = caption_para.add_run(f"\nDiagram {content['number']}")
+        if content.type == "diagram":
+            caption_para.text = f"Rajah {content.number}"
+            caption_run = caption_para.add_run(f"\nDiagram {content.number}")
         else:  # table
-            caption_para.text = f"Jadual {content['number']}"
-            caption_run = caption_para.add_run(f"\nTable {content['number']}")
+            caption_para.text = f"Jadual {content.number}"
+            caption_run = caption_para.add_run(f"\nTable {content.number}")
         caption_run.italic = True
-    elif content['type'] == "answer_space":
-        if content['format'] == "line":
-            for i in range(content['lines']):
+    elif isinstance(content, AnswerSpace):
+        if content.format == "line":
+            for i in range(content.lines if content.lines is not None else 1):
                 if level == 'question':
                     if i == 0:
                         cell.paragraphs[0].text = "\n……………………………………………………………………………………………………………………………………………………………"
@@ -112,12 +220,12 @@ def add_content_to_cell(cell, content, level):
                     else:
                         cell.paragraphs[0].add_run("\n……………………………………………………………………………………………………………………………………………")
                         
-        elif content['format'] == "blank-space":
+        elif content.format == "blank-space":
             cell.text = '\n\n\n\n\n'
-        elif content['format'] == "multiple-choice":
-            for i in range(len(content.get("options", []))):
-                malay_option = content["options"][i]["malay"]
-                english_option = content["options"][i]["english"]
+        elif content.format == "multiple-choice":
+            for i, option in enumerate(content.options or []):
+                malay_option = option.malay
+                english_option = option.english
                 if i == 0:
                     cell.paragraphs[0].text = f"   [ ] {malay_option}"
                 else:
@@ -135,20 +243,74 @@ def add_marks_to_cell(cell, marks):
     label.italic = True
     cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
 
-def replace_newlines(data):
-    if isinstance(data, dict):
-        for key, value in data.items():
-            if isinstance(value, str):
-                data[key] = value.replace("\\n", "\n")
+def render_settings():
+    """Everything besides the data that changes the rendered output; part of every cache key."""
+    return f"{TEMPLATE_VERSION}:{image_prep.DOCX_IMAGE_DPI}:{image_prep.JPEG_QUALITY}:{image_prep.LINE_ART_COLORS}"
+
+def document_hash(paper):
+    """Hash of the normalized document plus the render settings, used as the render cache key."""
+    normalized = json.dumps(paper.to_dict(), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(f"{render_settings()}:{normalized}".encode("utf-8")).hexdigest()
+
+def generate(paper):
+    """Returns the DOCX for a Paper as a file object, reusing a cached rendering when available."""
+    with span("docx.build", main_questions=len(paper.main_questions)) as build_span:
+        output = _generate(paper, build_span)
+    return output
+
+def _generate(paper, build_span):
+    key = document_hash(paper)
+    cached = docx_cache.get(key)
+    if cached is not None:
+        print(f"Serving cached document {key[:12]}")
+        build_span.set(cached=True)
+        return io.BytesIO(cached)
+
+    # Reuse the fragments of unchanged main questions and only render the edited ones
+    fragments = [docx_cache.get(f"fragment:{fragment_hash(main_q)}") for main_q in paper.main_questions]
+    stale = [main_q for main_q, fragment in zip(paper.main_questions, fragments) if fragment is None]
+    print(f"Rendering {len(stale)} of {len(fragments)} main questions")
+    build_span.set(cached=False, rendered=len(stale))
+
+    # Fetch the images of the stale questions up front instead of one blocking request per cell
+    urls = collect_image_urls(stale)
+    images = fetch_images(urls)
+    print(f"Image cache: {image_cache.stats()}")
+
+    complete = True
+    pending = [index for index, fragment in enumerate(fragments) if fragment is None]
+    with ThreadPoolExecutor(max_workers=max(1, min(RENDER_WORKERS, len(pending)))) as executor:
+        results = executor.map(bind(lambda index: render_fragment(paper.main_questions[index], images)), pending)
+        for index, (fragment, fragment_complete) in zip(pending, results):
+            fragments[index] = fragment
+            if fragment_complete:
+                docx_cache.put(f"fragment:{fragment_hash(paper.main_questions[index])}", fragment)
             else:
-                replace_newlines(value)
-    elif isinstance(data, list):
-        for item in data:
-            replace_newlines(item)
-            
-def generate(data):
-    replace_newlines(data)
+                complete = False
+
+    output = stitch_fragments(fragments)
+    if complete:
+        # Don't pin placeholders for images that failed to download
+        docx_cache.put_file(key, output)
+        output.seek(0)
+    return output
+
+def fragment_hash(main_q):
+    """Hash of one main question subtree, used as its fragment cache key."""
+    normalized = json.dumps(main_q.to_dict(), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(f"{render_settings()}:fragment:{normalized}".encode("utf-8")).hexdigest()
 
+def render_fragment(main_q, images):
+    """
+    Renders a single main question (its table and the page break after it) as
+    standalone DOCX bytes. Also returns whether every image in it was available.
+    """
+    urls = collect_image_urls([main_q])
+    with span("docx.render_fragment", main_number=main_q.number):
+        output = build_document(Paper(main_questions=[main_q]), images)
+    return output.read(), all(url in images for url in urls)
+
+def new_document():
     doc = Document()
 
     # Set page margins
@@ -157,113 +319,250 @@ def generate(data):
     section.bottom_margin = Inches(0.5)  # Set bottom margin
     section.left_margin = Inches(0.5)    # Set left margin
     section.right_margin = Inches(0.5)   # Set right margin
-    
-    # Fill table with nested structure
-    for main_q in data["main_questions"]:
-        print(f"Processing main question: {main_q['number']}")
-        
-        # Calculate total rows needed for the current main question
-        total_rows = (len(main_q["content_flow"]) +  # Add main question content rows
-                    sum(len(q.get("content_flow", [])) + (1 if "marks" in q else 0) + 
-                        sum(len(sq.get("content_flow", [])) + (1 if "marks" in sq else 0) 
-                            for sq in q.get("sub_questions", [])) 
-                        for q in main_q["questions"]))  # Add question and sub-question content rows
+    return doc
 
-        print(f"Total rows for main question {main_q['number']}: {total_rows}")
+def append_fragment(doc, fragment):
+    """Appends the body of a rendered DOCX (bytes) to doc, before its section properties."""
+    sect_pr = doc.element.body.sectPr
+    fragment_doc = Document(io.BytesIO(fragment))
+    for element in fragment_doc.element.body.iterchildren():
+        if element.tag == qn("w:sectPr"):
+            continue
+        element = copy.deepcopy(element)
+        # Re-register embedded images with this document's package
+        for blip in element.iter(qn("a:blip")):
+            image_part = fragment_doc.part.related_parts[blip.get(qn("r:embed"))]
+            r_id, _ = doc.part.get_or_add_image(io.BytesIO(image_part.blob))
+            blip.set(qn("r:embed"), r_id)
+        sect_pr.addprevious(element)
 
-        # Create a new table for each main question
-        table = doc.add_table(rows=total_rows, cols=4)
-        table.style = "Table Grid"
-        table.alignment = WD_TABLE_ALIGNMENT.CENTER
-
-        # Set column widths
-        for row in table.rows:
-            row.cells[0].width = Inches(0.3)
-            row.cells[1].width = Inches(0.5)
-            row.cells[2].width = Inches(0.75)
-            row.cells[3].width = Inches(6.5)
-
-        current_row = 0
-
-        # Handle main question content
-        for index, content in enumerate(main_q["content_flow"]):
-            print(f"Current row: {current_row}, Content type: {content['type']}")
-            if content["type"] != "questions":
-                if index == 0:
-                    table.rows[current_row].cells[0].text = main_q["number"]
-                main_q_content_cell = table.rows[current_row].cells[1]
-                main_q_content_cell.merge(table.rows[current_row].cells[-1])
-                add_content_to_cell(main_q_content_cell, content, 'main_q')
-                current_row += 1
+def stitch_fragments(fragments):
+    """
+    Concatenates rendered main question fragments into one document and returns it
+    as a file. fragments may be a generator; each is merged and released as it comes.
+    """
+    doc = new_document()
+    for fragment in fragments:
+        append_fragment(doc, fragment)
+
+    # Drawing ids restart in every fragment, so renumber them to stay unique
+    for index, doc_pr in enumerate(doc.element.body.iter(qn("wp:docPr")), start=1):
+        doc_pr.set("id", str(index))
+        doc_pr.set("name", f"Picture {index}")
+
+    output = tempfile.SpooledTemporaryFile(max_size=DOCX_SPOOL_MAX_BYTES)
+    doc.save(output)
+    output.seek(0)
+    return output
+
+def warm_cache(document_id, paper):
+    """Renders a freshly extracted document ahead of the first export."""
+    drop_warmed(document_id)
+    generate(paper).close()
+    docx_cache.put(f"document:{document_id}", document_hash(paper).encode("utf-8"))
+
+def drop_warmed(document_id):
+    """
+    Frees the rendering warm_cache stored for a document that was edited or deleted.
+    Only a space saving: other renderings are keyed by content and never go stale.
+    """
+    pointer = f"document:{document_id}"
+    key = docx_cache.get(pointer)
+    if key is not None:
+        docx_cache.delete(key.decode("utf-8"))
+        docx_cache.delete(pointer)
+
+# Column widths of the question table: main number, question number, sub-question number, content
+COLUMN_WIDTHS = [Inches(0.3), Inches(0.5), Inches(0.75), Inches(6.5)]
+
+def plan_main_question(main_q):
+    """
+    Lays out one main question as a 4-column table without touching python-docx.
+
+    Returns (total_rows, merges, ops): merges maps a row index to the first column
+    of its right-hand merged span, and ops are ("text" | "content" | "marks", row,
+    col, ...) cell writes in document order.
+    """
+    # Calculate total rows needed for the current main question
+    total_rows = (len(main_q.content_flow) +  # Add main question content rows
+                sum(len(q.content_flow) + (1 if q.marks is not None else 0) + 
+                    sum(len(sq.content_flow) + (1 if sq.marks is not None else 0) 
+                        for sq in q.sub_questions or []) 
+                    for q in main_q.questions))  # Add question and sub-question content rows
+
+    print(f"Total rows for main question {main_q.number}: {total_rows}")
+
+    merges = {}
+    ops = []
+    current_row = 0
 
-        # Handle questions
-        for question in main_q["questions"]:
-            print(f"Processing question: {question['number']}")
+    # Handle main question content
+    for index, content in enumerate(main_q.content_flow):
+        if content.type != "questions":
+            if index == 0:
+                ops.append(("text", current_row, 0, main_q.number))
+            merges[current_row] = 1
+            ops.append(("content", current_row, 1, content, 'main_q'))
+            current_row += 1
+
+    # Handle questions
+    for question in main_q.questions:
+        if current_row >= total_rows:
+            print("Error: current_row exceeds total_rows")
+            break  # Prevent accessing out of range
+
+        ops.append(("text", current_row, 1, question.number))
+
+        for content in question.content_flow:
+            merges[current_row] = 2
+            ops.append(("content", current_row, 2, content, 'question'))
+            current_row += 1
+
+        if question.marks is not None and question.sub_questions is None:
+            merges[current_row] = 2
+            ops.append(("marks", current_row, 2, question.marks))
+            current_row += 1
+
+        # Handle sub-questions if they exist
+        for sub_q in question.sub_questions or []:
+            # Check if current_row is within the valid range
             if current_row >= total_rows:
-                print("Error: current_row exceeds total_rows")
+                print(f"Error: current_row {current_row} exceeds total_rows {total_rows}")
                 break  # Prevent accessing out of range
 
-            table.rows[current_row].cells[1].text = question["number"]
-            
-            
-            for content in question.get("content_flow", []):
-                q_content_cell = table.rows[current_row].cells[2]
-                q_content_cell.merge(table.rows[current_row].cells[-1])
-                add_content_to_cell(q_content_cell, content, 'question')
-                current_row += 1
-                    
-            if "marks" in question and "sub_questions" not in question:
-                question_marks_cell = table.rows[current_row].cells[2]
-                question_marks_cell.merge(table.rows[current_row].cells[-1])
-                add_marks_to_cell(question_marks_cell, question["marks"])
-                current_row += 1
-            
-            # Handle sub-questions if they exist
-            for sub_q in question.get("sub_questions", []):
-                print(f"Processing sub-question: {sub_q['number']}")
-                
-                # Check if current_row is within the valid range
+            ops.append(("text", current_row, 2, sub_q.number))
+
+            for content in sub_q.content_flow:
+                # Check if current_row is within the valid range before accessing cells
                 if current_row >= total_rows:
-                    print(f"Error: current_row {current_row} exceeds total_rows {total_rows}")
+                    print(f"Error: current_row {current_row} exceeds total_rows {total_rows} before adding content")
                     break  # Prevent accessing out of range
 
-                # Accessing the sub-question number
-                table.rows[current_row].cells[2].text = sub_q["number"]
-                
-                for content in sub_q.get("content_flow", []):
-                    sub_q_content_cell = table.rows[current_row].cells[3]
-                    
-                    # Check if current_row is within the valid range before accessing cells
-                    if current_row >= total_rows:
-                        print(f"Error: current_row {current_row} exceeds total_rows {total_rows} before adding content")
-                        break  # Prevent accessing out of range
-                    
-                    add_content_to_cell(sub_q_content_cell, content, 'sub_q')
-                    current_row += 1
+                ops.append(("content", current_row, 3, content, 'sub_q'))
+                current_row += 1
 
-                # Check if current_row is within the valid range before accessing marks cell
-                if current_row >= total_rows:
-                    print(f"Error: current_row {current_row} exceeds total_rows {total_rows} before accessing marks cell")
-                    break  # Prevent accessing out of range
+            # Check if current_row is within the valid range before accessing marks cell
+            if current_row >= total_rows:
+                print(f"Error: current_row {current_row} exceeds total_rows {total_rows} before accessing marks cell")
+                break  # Prevent accessing out of range
 
-                if "marks" in sub_q:
-                    sub_q_marks_cell = table.rows[current_row].cells[3]
-                    add_marks_to_cell(sub_q_marks_cell, sub_q['marks'])
-                    current_row += 1
-                
-            if "marks" in question and "sub_questions" in question:
-                question_marks_cell = table.rows[current_row].cells[2]
-                question_marks_cell.merge(table.rows[current_row].cells[-1])
-                add_marks_to_cell(question_marks_cell, question["marks"])
+            if sub_q.marks is not None:
+                ops.append(("marks", current_row, 3, sub_q.marks))
                 current_row += 1
 
+        if question.marks is not None and question.sub_questions is not None:
+            merges[current_row] = 2
+            ops.append(("marks", current_row, 2, question.marks))
+            current_row += 1
+
+    return total_rows, merges, ops
+
+def apply_cell_ops(get_cell, ops, images):
+    """Writes planned cell contents, where get_cell(row, col) returns the (merged) cell."""
+    for op in ops:
+        kind, row, col = op[:3]
+        cell = get_cell(row, col)
+        if kind == "text":
+            cell.text = op[3]
+        elif kind == "content":
+            add_content_to_cell(cell, op[3], op[4], images)
+        elif kind == "marks":
+            add_marks_to_cell(cell, op[3])
+
+def add_table_python_docx(doc, plan, images):
+    """Reference builder: creates the table through python-docx's cell API."""
+    total_rows, merges, ops = plan
+
+    # Create a new table for each main question
+    table = doc.add_table(rows=total_rows, cols=4)
+    table.style = "Table Grid"
+    table.alignment = WD_TABLE_ALIGNMENT.CENTER
+
+    # Set column widths
+    for row in table.rows:
+        for cell, width in zip(row.cells, COLUMN_WIDTHS):
+            cell.width = width
+
+    for row_index, start_col in merges.items():
+        table.rows[row_index].cells[start_col].merge(table.rows[row_index].cells[-1])
+
+    apply_cell_ops(lambda row, col: table.rows[row].cells[col], ops, images)
+
+def _tc_xml(width):
+    return f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{width.twips}"/></w:tcPr><w:p/></w:tc>'
+
+def _merged_tc_xml(start_col):
+    width = Emu(sum(COLUMN_WIDTHS[start_col:]))
+    span = len(COLUMN_WIDTHS) - start_col
+    return f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{width.twips}"/><w:gridSpan w:val="{span}"/></w:tcPr><w:p/></w:tc>'
+
+# Prebuilt <w:tr> templates keyed by the first merged column (None = no merge)
+ROW_TEMPLATES = {
+    None: "<w:tr>" + "".join(_tc_xml(width) for width in COLUMN_WIDTHS) + "</w:tr>",
+    1: "<w:tr>" + _tc_xml(COLUMN_WIDTHS[0]) + _merged_tc_xml(1) + "</w:tr>",
+    2: "<w:tr>" + "".join(_tc_xml(width) for width in COLUMN_WIDTHS[:2]) + _merged_tc_xml(2) + "</w:tr>",
+}
+
+def add_table_xml(doc, plan, images):
+    """
+    Fast builder: emits the whole table skeleton, widths and merges included, as one
+    XML string from the row templates, so only the cell contents go through python-docx.
+    """
+    total_rows, merges, ops = plan
+
+    # Same default grid as doc.add_table: the text width split evenly across the columns
+    grid_width = Emu(doc._block_width // len(COLUMN_WIDTHS)).twips
+    grid = f'<w:gridCol w:w="{grid_width}"/>' * len(COLUMN_WIDTHS)
+    rows = "".join(ROW_TEMPLATES[merges.get(row_index)] for row_index in range(total_rows))
+    tbl = parse_xml(
+        f'<w:tbl {nsdecls("w")}>'
+        '<w:tblPr><w:tblStyle w:val="TableGrid"/><w:tblW w:type="auto" w:w="0"/><w:jc w:val="center"/>'
+        '<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" w:noHBand="0" w:noVBand="1" w:val="04A0"/>'
+        '</w:tblPr>'
+        f'<w:tblGrid>{grid}</w:tblGrid>'
+        f'{rows}</w:tbl>'
+    )
+    doc.element.body.sectPr.addprevious(tbl)
+    table = Table(tbl, doc._body)
+
+    # Map grid columns to <w:tc> elements; merged columns share the spanning cell
+    cells = {}
+    for row_index, tr in enumerate(tbl.tr_lst):
+        tcs = tr.tc_lst
+        start_col = merges.get(row_index)
+        for col in range(len(COLUMN_WIDTHS)):
+            tc = tcs[min(col, start_col)] if start_col is not None else tcs[col]
+            cells[row_index, col] = tc
+
+    apply_cell_ops(lambda row, col: _Cell(cells[row, col], table), ops, images)
+
+DOCX_BUILDERS = {
+    "python-docx": add_table_python_docx,
+    "xml": add_table_xml,
+}
+DOCX_BUILDER = os.getenv("DOCX_BUILDER", "xml")
+
+def build_document(paper, images, builder=None):
+    """Builds the exam DOCX for a Paper using the prefetched {url: bytes} images."""
+    add_table = DOCX_BUILDERS[builder or DOCX_BUILDER]
+
+    doc = new_document()
+
+    # Fill table with nested structure
+    for main_q in paper.main_questions:
+        print(f"Processing main question: {main_q.number}")
+
+        # Create a new table for each main question
+        add_table(doc, plan_main_question(main_q), images)
+
         # Add a page break after each table
         doc.add_page_break()
 
-    # Save document
-    doc.save("table.docx")
+    # Save document into a per-call buffer so concurrent exports never share a file
+    output = tempfile.SpooledTemporaryFile(max_size=DOCX_SPOOL_MAX_BYTES)
+    doc.save(output)
+    output.seek(0)
     
     print("Document saved!")
     
-    return "table.docx"  # Return the path of the saved document
-    
\ No newline at end of file
+    return output  # Return a file object positioned at the start of the document
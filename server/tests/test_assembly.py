@@ -0,0 +1,77 @@
+from modules import assembly
+from modules.assembly import assemble_paper, renumber_main_question
+from modules.models import parse_main_question
+
+
+def text(english):
+    return {"type": "text", "text": {"malay": english, "english": english}}
+
+
+def main_question(number, figures, references):
+    return parse_main_question({
+        "number": number,
+        "content_flow": [text(reference) for reference in references]
+                        + [{"type": figure_type, "number": figure_number, "page": 1} for figure_type, figure_number in figures],
+        "questions": [{"number": f"{number}(a)", "content_flow": [text("Answer")]}],
+    })
+
+
+class FakeIndex:
+    def __init__(self, main_questions):
+        self.main_questions = main_questions
+
+    def get_main_questions(self, refs):
+        return [self.main_questions.get(ref) for ref in refs]
+
+
+def assemble(monkeypatch, main_questions, refs):
+    monkeypatch.setattr(assembly, "get_question_index", lambda: FakeIndex(main_questions))
+    return assemble_paper(refs)
+
+
+def figure_numbers(main_q):
+    return [(figure.type, figure.number) for figure in main_q.figures()]
+
+
+def english(main_q):
+    return [content.text.english for content in main_q.content_flow if content.type == "text"]
+
+
+def test_assembles_question_and_paper_numbered_figures(monkeypatch):
+    # Paper "a" numbers diagrams by question and tables across the paper; paper "b" by question
+    main_questions = {
+        ("a", "6"): main_question("6", [("diagram", "6.1"), ("diagram", "6.2"), ("table", "2")],
+                                  ["Study Diagram 6.1 and diagram 6.2.", "Table 2 shows the results."]),
+        ("a", "7"): main_question("7", [("diagram", "7"), ("table", "1")],
+                                  ["Rajah 7 dan Jadual 1.", "TABLE 1 lists the values."]),
+        ("b", "9"): main_question("9", [("diagram", "9.1"), ("table", "9")],
+                                  ["Based on rajah 9.1 and Table 9."]),
+    }
+    paper = assemble(monkeypatch, main_questions, [("a", "6"), ("a", "7"), ("b", "9")])
+
+    assert [main_q.number for main_q in paper.main_questions] == ["1", "2", "3"]
+    assert figure_numbers(paper.main_questions[0]) == [("diagram", "1.1"), ("diagram", "1.2"), ("table", "1")]
+    assert figure_numbers(paper.main_questions[1]) == [("diagram", "2"), ("table", "2")]
+    assert figure_numbers(paper.main_questions[2]) == [("diagram", "3.1"), ("table", "3")]
+
+    assert english(paper.main_questions[0]) == ["Study Diagram 1.1 and diagram 1.2.", "Table 1 shows the results."]
+    assert english(paper.main_questions[1]) == ["Rajah 2 dan Jadual 2.", "TABLE 2 lists the values."]
+    assert english(paper.main_questions[2]) == ["Based on rajah 3.1 and Table 3."]
+    assert paper.main_questions[2].questions[0].number == "3(a)"
+
+
+def test_references_follow_their_figure_type():
+    # Diagram 2 is tied to question 2, Table 1 is numbered across the paper, and there is no table 2
+    main_q = main_question("2", [("diagram", "2"), ("table", "1")], ["Diagram 2, Table 1 and Table 2."])
+    renumbered = renumber_main_question(main_q, "4", {"table": 2})
+
+    assert figure_numbers(renumbered) == [("diagram", "4"), ("table", "3")]
+    assert english(renumbered) == ["Diagram 4, Table 3 and Table 2."]
+
+
+def test_keeps_paper_numbered_figures_without_counts():
+    main_q = main_question("6", [("diagram", "6.1"), ("table", "1")], ["diagram 6.1, Table 1"])
+    renumbered = renumber_main_question(main_q, "2")
+
+    assert figure_numbers(renumbered) == [("diagram", "2.1"), ("table", "1")]
+    assert english(renumbered) == ["diagram 2.1, Table 1"]
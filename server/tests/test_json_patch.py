@@ -0,0 +1,16 @@
+import pytest
+
+from modules.json_patch import JsonPatchError, apply_patch
+
+DOCUMENT = {"main_questions": [{"number": "1"}]}
+
+
+@pytest.mark.parametrize("op", ["move", "copy"])
+def test_move_and_copy_require_from(op):
+    with pytest.raises(JsonPatchError, match=f"Operation {op} requires from"):
+        apply_patch(DOCUMENT, [{"op": op, "path": "/main_questions/0"}])
+
+
+def test_copy_from_path():
+    patched = apply_patch(DOCUMENT, [{"op": "copy", "from": "/main_questions/0", "path": "/main_questions/-"}])
+    assert patched == {"main_questions": [{"number": "1"}, {"number": "1"}]}